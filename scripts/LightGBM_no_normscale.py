@@ -1,15 +1,15 @@
 #!/usr/bin/env python3
 
 import pandas as pd
-import lightgbm as lgb
 import os
 import pickle
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import roc_auc_score, accuracy_score, classification_report, confusion_matrix
 import argparse
 import sys
 
+import model_compiler
+import score_server
+
 # Base: prefer explicit model dir, else helpers dir, else script dir
 _BASE = os.environ.get("SPLICECOV_MODEL_DIR")
 if not _BASE:
@@ -28,6 +28,12 @@ FEATURE_IMPORTANCES_FILE = os.path.join(MODEL_DIR, '0606_spleen_no_normscale_nor
 OUTPUT_DIR    = MODEL_DIR
 
 def train_model(print_row_index=0, scaling_factor=1.0):
+    # lightgbm/sklearn are imported where needed: scoring through a running
+    # score_server never loads them
+    import lightgbm as lgb
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import roc_auc_score, accuracy_score, classification_report, confusion_matrix
+
     print("Starting model training...")
 
     # Load the input file
@@ -199,19 +205,45 @@ def train_model(print_row_index=0, scaling_factor=1.0):
     return model, encoders
 
 
-def score_data(testing_file, output_file, threshold=0.4):
-    # --- NEW: threshold is now a parameter (default 0.4) ---
-    if not (0.0 <= float(threshold) <= 1.0):
-        print(f"Error: threshold must be in [0,1], got {threshold}", file=sys.stderr)
-        sys.exit(1)
-    print(f"Using classification threshold: {threshold}")
-
-    print(f"Loading the pretrained model from '{MODEL_FILE}'...")
-    try:
-        model = lgb.Booster(model_file=MODEL_FILE)
-    except Exception as e:
-        print(f"Error loading the model: {e}", file=sys.stderr)
-        sys.exit(1)
+COLUMNS_TRAINING = [
+    'chromosome','position','junction_id','num_samples','strand','perc',
+    'cov_diff','perc_cov_diff','junc_len','smooth_metric','cov_change_dir','event','label'
+]
+COLUMNS_TESTING = COLUMNS_TRAINING[:-1]
+
+# Column dtypes of the round-1 bundle file (as written by
+# process_tiebrush_round1_juncs_splicecov.py); used by the chunked reader.
+DTYPES_TRAINING = {
+    'chromosome': str, 'position': np.int64, 'junction_id': str, 'num_samples': np.int64,
+    'strand': str, 'perc': str, 'cov_diff': np.int64, 'perc_cov_diff': np.float64,
+    'junc_len': np.int64, 'smooth_metric': np.float64, 'cov_change_dir': np.int64,
+    'event': str, 'label': np.int64,
+}
+
+
+def load_scoring_model(use_server=True):
+    """
+    Load the pretrained booster (its model_compiler build when present) and
+    its normalization encoders, or use the running score_server when it
+    serves the same files.
+    """
+    if use_server:
+        remote = score_server.remote_models({"junction": (MODEL_FILE, ENCODERS_FILE)})
+        if remote:
+            print(f"Using the scoring server at '{score_server.default_socket()}' for '{MODEL_FILE}'...")
+            return remote["junction"]
+
+    model = model_compiler.load_compiled(MODEL_FILE)
+    if model is not None:
+        print(f"Loading the compiled model '{model_compiler.compiled_path(MODEL_FILE)}'...")
+    else:
+        import lightgbm as lgb
+        print(f"Loading the pretrained model from '{MODEL_FILE}'...")
+        try:
+            model = lgb.Booster(model_file=MODEL_FILE)
+        except Exception as e:
+            print(f"Error loading the model: {e}", file=sys.stderr)
+            sys.exit(1)
 
     print(f"Loading encoders and normalization parameters from '{ENCODERS_FILE}'...")
     try:
@@ -220,36 +252,20 @@ def score_data(testing_file, output_file, threshold=0.4):
     except Exception as e:
         print(f"Error loading encoders: {e}", file=sys.stderr)
         sys.exit(1)
+    return model, encoders
 
-    print(f"Loading input data from '{testing_file}'...")
-    try:
-        data = pd.read_csv(testing_file, sep='\t', header=None)
-    except Exception as e:
-        print(f"Error loading testing file: {e}", file=sys.stderr)
-        sys.exit(1)
-
-    columns_training = [
-        'chromosome','position','junction_id','num_samples','strand','perc',
-        'cov_diff','perc_cov_diff','junc_len','smooth_metric','cov_change_dir','event','label'
-    ]
-    columns_testing = [
-        'chromosome','position','junction_id','num_samples','strand','perc',
-        'cov_diff','perc_cov_diff','junc_len','smooth_metric','cov_change_dir','event'
-    ]
-
-    if data.shape[1] == 13:
-        data.columns = columns_training
-    elif data.shape[1] == 12:
-        data.columns = columns_testing
-    else:
-        print(f"Error: Unexpected number of columns: {data.shape[1]}", file=sys.stderr)
-        sys.exit(1)
 
-    print("Extracting features...")
+def score_frame(data, model, encoders, threshold=0.4, verbose=True):
+    """
+    Score a round-1 junction table (12 or 13 named columns) in place, adding
+    'confidence_score' and 'predicted_label'. Returns the same DataFrame.
+    """
+    say = print if verbose else (lambda *a, **k: None)
+    say("Extracting features...")
     smooth_metric_raw = data['smooth_metric'].copy()
     X = data[['num_samples','perc','cov_diff','perc_cov_diff','junc_len','smooth_metric','cov_change_dir']].copy()
 
-    print("Binarizing 'perc' into two categories...")
+    say("Binarizing 'perc' into two categories...")
     X['perc_binarized'] = X['perc'].apply(
         lambda x: 1 if x == "1.0000-1.0000-1.0000-1.0000" else 0
     )
@@ -259,7 +275,7 @@ def score_data(testing_file, output_file, threshold=0.4):
     scaling_factor = encoders.get('scaling_factor', 1.0)
     if coverage_median == 0:
         coverage_median = 1.0
-    print(f"Normalizing 'num_samples' by median={coverage_median}, then scaling by dividing by {scaling_factor}...")
+    say(f"Normalizing 'num_samples' by median={coverage_median}, then scaling by dividing by {scaling_factor}...")
     X['num_samples_med_norm'] = X['num_samples'] / coverage_median
     X['num_samples_scaled'] = X['num_samples_med_norm'] / scaling_factor
     X = X.drop(['num_samples','num_samples_med_norm'], axis=1)
@@ -267,9 +283,9 @@ def score_data(testing_file, output_file, threshold=0.4):
     X['junc_len_raw'] = X['junc_len']; X = X.drop('junc_len', axis=1)
     X['smooth_metric_raw'] = X['smooth_metric']; X = X.drop('smooth_metric', axis=1)
 
-    print(f"Prediction features: {list(X.columns)}")
+    say(f"Prediction features: {list(X.columns)}")
 
-    print("Making predictions...")
+    say("Making predictions...")
     try:
         y_pred_prob = model.predict(X, num_iteration=model.best_iteration)
     except Exception as e:
@@ -294,6 +310,37 @@ def score_data(testing_file, output_file, threshold=0.4):
 
     data['confidence_score'] = y_pred_prob
     data['predicted_label'] = y_pred
+    return data
+
+
+def score_data(testing_file, output_file, threshold=0.4, chunk_rows=0):
+    # --- NEW: threshold is now a parameter (default 0.4) ---
+    if not (0.0 <= float(threshold) <= 1.0):
+        print(f"Error: threshold must be in [0,1], got {threshold}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Using classification threshold: {threshold}")
+
+    model, encoders = load_scoring_model()
+    if chunk_rows > 0:
+        score_data_chunked(testing_file, output_file, model, encoders, threshold, chunk_rows)
+        return
+
+    print(f"Loading input data from '{testing_file}'...")
+    try:
+        data = pd.read_csv(testing_file, sep='\t', header=None)
+    except Exception as e:
+        print(f"Error loading testing file: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if data.shape[1] == 13:
+        data.columns = COLUMNS_TRAINING
+    elif data.shape[1] == 12:
+        data.columns = COLUMNS_TESTING
+    else:
+        print(f"Error: Unexpected number of columns: {data.shape[1]}", file=sys.stderr)
+        sys.exit(1)
+
+    score_frame(data, model, encoders, threshold)
 
     print(f"Saving the results to '{output_file}'...")
     try:
@@ -303,6 +350,45 @@ def score_data(testing_file, output_file, threshold=0.4):
         print(f"Error saving scored data: {e}", file=sys.stderr)
         sys.exit(1)
 
+def score_data_chunked(testing_file, output_file, model, encoders, threshold, chunk_rows):
+    """
+    score_data in batches of `chunk_rows` rows: each batch is read with the
+    round-1 dtypes, scored with score_frame and appended to the output, so
+    peak memory is set by the batch size, not the input size. The output is
+    identical to the whole-file path.
+    """
+    print(f"Loading input data from '{testing_file}' in chunks of {chunk_rows} rows...")
+    try:
+        with open(testing_file, 'r') as f:
+            first = f.readline()
+    except Exception as e:
+        print(f"Error loading testing file: {e}", file=sys.stderr)
+        sys.exit(1)
+    ncols = len(first.rstrip('\n').split('\t')) if first.strip() else 0
+    if ncols == 13:
+        columns = COLUMNS_TRAINING
+    elif ncols == 12:
+        columns = COLUMNS_TESTING
+    else:
+        print(f"Error: Unexpected number of columns: {ncols}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Saving the results to '{output_file}'...")
+    rows = 0
+    try:
+        reader = pd.read_csv(testing_file, sep='\t', header=None, names=columns,
+                             dtype={c: DTYPES_TRAINING[c] for c in columns}, chunksize=chunk_rows)
+        with open(output_file, 'w', newline='') as out:
+            for i, chunk in enumerate(reader):
+                score_frame(chunk, model, encoders, threshold, verbose=(i == 0))
+                chunk.to_csv(out, sep='\t', index=False, header=(i == 0))
+                rows += len(chunk)
+    except Exception as e:
+        print(f"Error scoring data in chunks: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Scored data saved to '{output_file}' ({rows} rows).")
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Train a LightGBM model and score new data.')
     parser.add_argument('-i', '--input', dest='input_file', required=True,
@@ -316,6 +402,8 @@ if __name__ == '__main__':
     # --- NEW: threshold flag ---
     parser.add_argument('-s', '--threshold', dest='threshold', type=float, default=0.4,
                         help='Prediction threshold in [0,1] for converting probabilities to labels (default: 0.4).')
+    parser.add_argument('-c', '--chunk-rows', dest='chunk_rows', type=int, default=0,
+                        help='Score the input in batches of this many rows to bound memory (default: 0, whole file).')
 
     args = parser.parse_args()
 
@@ -332,5 +420,5 @@ if __name__ == '__main__':
         train_model(print_row_index=args.row_index, scaling_factor=args.scaling_factor)
 
     # Score data with user-specified threshold
-    score_data(args.input_file, args.output_file, threshold=args.threshold)
+    score_data(args.input_file, args.output_file, threshold=args.threshold, chunk_rows=args.chunk_rows)
     print("Done.")
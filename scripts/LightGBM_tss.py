@@ -2,9 +2,12 @@
 import os, sys, argparse, pickle
 import numpy as np
 import pandas as pd
-import lightgbm as lgb
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
+
+import model_compiler
+import score_server
+
+# lightgbm/sklearn are imported where needed: scoring through a running
+# score_server never loads them
 
 # -----------------------
 # Path resolution (Option B)
@@ -74,19 +77,24 @@ def _prep_X(df, enc):
     X["value3_norm"] = (X["value3"] / float(vmax)).fillna(0.0)
     X.drop(columns=["value3"], inplace=True)
 
-    if "le_value8" in enc:
-        le = enc["le_value8"]
-    else:
-        classes = enc.get("value8_classes", [])
-        le = LabelEncoder()
-        # ensure string dtype for stable mapping
-        le.classes_ = np.array(list(map(str, classes)), dtype=str)
-    X["value8_encoded"] = le.transform(df["value8"].astype(str))
+    X["value8_encoded"] = value8_encoder(enc).transform(df["value8"].astype(str))
     X.drop(columns=["value8"], inplace=True)
 
     return X
 
+def value8_encoder(enc):
+    """The value8 LabelEncoder of an encoder dict (live, snapshot or remote)."""
+    if "le_value8" in enc:
+        return enc["le_value8"]
+    from sklearn.preprocessing import LabelEncoder
+    classes = enc.get("value8_classes", [])
+    le = LabelEncoder()
+    # ensure string dtype for stable mapping
+    le.classes_ = np.array(list(map(str, classes)), dtype=str)
+    return le
+
 def _fit_encoders(df):
+    from sklearn.preprocessing import LabelEncoder
     vmax = df["value3"].max()
     if pd.isna(vmax) or vmax == 0:
         vmax = 1.0
@@ -97,6 +105,8 @@ def _fit_encoders(df):
 # Training
 # -----------------------
 def _train_one(df_full, row_type, model_path, enc_path, print_row_index=0):
+    import lightgbm as lgb
+    from sklearn.model_selection import train_test_split
     print(f"[train] row_type={row_type}")
     df = df_full[df_full["row_type"] == row_type].copy()
     if df.empty:
@@ -174,29 +184,42 @@ def train_models(training_path, tss_model, cpas_model, tss_enc, cpas_enc, print_
 def _load_model_and_enc(model_path, enc_path):
     if not os.path.exists(model_path) or not os.path.exists(enc_path):
         return None, None
-    model = lgb.Booster(model_file=model_path)
+    model = model_compiler.load_compiled(model_path)
+    if model is None:
+        import lightgbm as lgb
+        model = lgb.Booster(model_file=model_path)
     enc = _load(enc_path)  # snapshot dict
     return model, enc
 
-def score(testing_path, output_path, tss_model, cpas_model, tss_enc, cpas_enc, threshold=0.4):
-    if not (0.0 <= float(threshold) <= 1.0):
-        raise ValueError(f"threshold must be in [0,1], got {threshold}")
-    print(f"[score] threshold={threshold}")
-
-    df = pd.read_csv(testing_path, sep="\t", header=None)
-    if df.shape[1] != len(COLS_TEST):
-        raise ValueError(f"Unexpected testing cols: {df.shape[1]} (expected {len(COLS_TEST)})")
-    df.columns = COLS_TEST
-
-    df["confidence_score"] = np.nan
-    df["predicted_label"] = np.nan
-
+def load_models(tss_model, cpas_model, tss_enc, cpas_enc, use_server=True):
+    """
+    Load {row_type: (booster, encoder snapshot)} for the row types that have a
+    model, or use the running score_server when it serves the same files.
+    """
+    if use_server:
+        remote = score_server.remote_models({"TSS": (tss_model, tss_enc), "CPAS": (cpas_model, cpas_enc)})
+        if remote:
+            print(f"[score] TSS/CPAS: using the scoring server at {score_server.default_socket()}")
+            return remote
+    models = {}
     for rt, mpath, epath in (("TSS", tss_model, tss_enc), ("CPAS", cpas_model, cpas_enc)):
         print(f"[score] {rt}: loading model/encoders")
         model, enc_snapshot = _load_model_and_enc(mpath, epath)
         if model is None or enc_snapshot is None:
             print(f"[score] {rt}: model or encoders not found; skipping.")
             continue
+        models[rt] = (model, enc_snapshot)
+    return models
+
+def score_frame(df, models, threshold=0.4):
+    """Add confidence_score/predicted_label to a TSS/CPAS feature table (COLS_TEST columns)."""
+    df["confidence_score"] = np.nan
+    df["predicted_label"] = np.nan
+
+    for rt in ("TSS", "CPAS"):
+        if rt not in models:
+            continue
+        model, enc_snapshot = models[rt]
 
         sub_idx = df.index[df["row_type"] == rt]
         if len(sub_idx) == 0:
@@ -212,6 +235,20 @@ def score(testing_path, output_path, tss_model, cpas_model, tss_enc, cpas_enc, t
 
     df["confidence_score"] = df["confidence_score"].fillna(0.0)
     df["predicted_label"]  = df["predicted_label"].fillna(0).astype(int)
+    return df
+
+def score(testing_path, output_path, tss_model, cpas_model, tss_enc, cpas_enc, threshold=0.4):
+    if not (0.0 <= float(threshold) <= 1.0):
+        raise ValueError(f"threshold must be in [0,1], got {threshold}")
+    print(f"[score] threshold={threshold}")
+
+    df = pd.read_csv(sys.stdin if testing_path == "-" else testing_path, sep="\t", header=None)
+    if df.shape[1] != len(COLS_TEST):
+        raise ValueError(f"Unexpected testing cols: {df.shape[1]} (expected {len(COLS_TEST)})")
+    df.columns = COLS_TEST
+
+    models = load_models(tss_model, cpas_model, tss_enc, cpas_enc)
+    score_frame(df, models, threshold)
 
     print(f"[score] writing -> {output_path}")
     df.to_csv(output_path, sep="\t", index=False)
@@ -223,7 +260,7 @@ def score(testing_path, output_path, tss_model, cpas_model, tss_enc, cpas_enc, t
 def main():
     p = argparse.ArgumentParser(description="Train and score LightGBM models for TSS/CPAS.")
     p.add_argument("-i", "--input",  dest="testing_file",  required=True,
-                   help="Input file (TSSTES features without label).")
+                   help="Input file (TSSTES features without label); '-' reads stdin.")
     p.add_argument("-o", "--output", dest="output_file",   required=True,
                    help="Output path for scored TSV.")
     p.add_argument("-s", "--threshold", type=float, default=0.4,
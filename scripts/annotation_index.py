@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+.annidx: cached evaluation references for one annotation GTF.
+
+An npz archive (no pickled objects) with, per chromosome in sorted order:
+  ss_pos / ss_off          unique splice-site positions (intron ends), sorted
+  tsstes_pos / tsstes_tss / tsstes_off
+                           unique TSS/CPAS positions sorted by (pos, type);
+                           tsstes_tss is 1 for TSS, 0 for CPAS
+plus the GTF's sha256, size and mtime. The splice sites are those of
+gtf_to_intron_bed.py (consecutive exons of each transcript_id) and the
+TSS/CPAS those of transcript features, or exon extents when the GTF has no
+transcript features.
+
+Evaluation uses <gtf>.annidx whenever it matches the GTF: size and mtime
+equal, or else the same sha256. Otherwise the GTF is parsed as before.
+Written by `splicecov annotate-index`.
+
+Usage: annotation_index.py build <annotation.gtf>
+       annotation_index.py refs <annotation.gtf> <splice_sites.bed> <tsstes.bed>
+"""
+import hashlib
+import os
+import re
+import sys
+
+import numpy as np
+
+VERSION = 1
+SUFFIX = ".annidx"
+
+_ATTR_RE = re.compile(r'(\S+)\s+"([^"]+)"')
+
+
+def index_path(gtf):
+    return gtf + SUFFIX
+
+
+def gtf_sha256(gtf):
+    h = hashlib.sha256()
+    with open(gtf, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _intron_tid(attrs):
+    # gtf_to_intron_bed.py: first ';' attribute starting with transcript_id
+    for attr in attrs.split(";"):
+        attr = attr.strip()
+        if attr.startswith("transcript_id"):
+            return attr.split('"')[1]
+    return None
+
+
+def parse_gtf(gtf):
+    """
+    ({chrom: set(splice-site positions)}, {chrom: set((pos, is_tss))}) of a
+    GTF in one pass.
+    """
+    exons = {}     # tid -> [(start, end, chrom)], for the splice sites
+    tx = {}        # tid -> (chrom, strand, start, end) of transcript features
+    exon_ext = {}  # tid -> [chrom, strand, min start, max end]
+    with open(gtf, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not line or line[0] == "#":
+                continue
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 9:
+                continue
+            feature = parts[2]
+            if feature != "exon" and feature != "transcript":
+                continue
+            try:
+                start, end = int(parts[3]), int(parts[4])
+            except ValueError:
+                continue
+            chrom, strand = parts[0], parts[6]
+            a = dict(_ATTR_RE.findall(parts[8]))
+            tid = a.get("transcript_id") or a.get("transcriptId") or a.get("transcript")
+            if feature == "exon":
+                itid = _intron_tid(parts[8])
+                if itid:
+                    exons.setdefault(itid, []).append((start, end, chrom))
+                if tid:
+                    v = exon_ext.get(tid)
+                    if v is None:
+                        exon_ext[tid] = [chrom, strand, start, end]
+                    else:
+                        v[2] = min(v[2], start)
+                        v[3] = max(v[3], end)
+            elif tid:
+                tx[tid] = (chrom, strand, start, end)
+
+    ss = {}
+    for ex in exons.values():
+        ex.sort(key=lambda e: e[0])
+        for (_, end1, chrom), (start2, _, _) in zip(ex, ex[1:]):
+            s = ss.setdefault(chrom, set())
+            s.add(end1)
+            s.add(start2)
+
+    tsstes = {}
+    for chrom, strand, s, e in (tx if tx else exon_ext).values():
+        tss, cpas = (s, e) if strand == "+" else (e, s)
+        t = tsstes.setdefault(chrom, set())
+        t.add((tss, 1))
+        t.add((cpas, 0))
+    return ss, tsstes
+
+
+class AnnotationIndex:
+    """Splice sites and TSS/CPAS per chromosome, from a GTF or an .annidx file."""
+
+    def __init__(self, ss, tsstes):
+        # ss: {chrom: sorted int64 positions}; tsstes: {chrom: (positions, TSS flags)}
+        self.ss = ss
+        self.tsstes = tsstes
+
+    @classmethod
+    def from_gtf(cls, gtf):
+        ss, tsstes = parse_gtf(gtf)
+        ss = {c: np.array(sorted(v), dtype=np.int64) for c, v in ss.items()}
+        out = {}
+        for c, v in tsstes.items():
+            a = np.array(sorted(v), dtype=np.int64).reshape(-1, 2)
+            out[c] = (a[:, 0].copy(), a[:, 1].astype(np.uint8))
+        return cls(ss, out)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            ss = _split(z["ss_chroms"], z["ss_off"], z["ss_pos"])
+            pos = _split(z["tsstes_chroms"], z["tsstes_off"], z["tsstes_pos"])
+            tss = _split(z["tsstes_chroms"], z["tsstes_off"], z["tsstes_tss"])
+        return cls(ss, {c: (pos[c], tss[c]) for c in pos})
+
+    def save(self, path, gtf):
+        """Write the index for `gtf` (hash and stat recorded for freshness checks)."""
+        st = os.stat(gtf)
+        ss_chroms = sorted(self.ss)
+        ts_chroms = sorted(self.tsstes)
+        tmp = f"{path}.tmp.{os.getpid()}"
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, version=np.int64(VERSION), sha256=np.str_(gtf_sha256(gtf)),
+                         gtf_size=np.int64(st.st_size), gtf_mtime_ns=np.int64(st.st_mtime_ns),
+                         ss_chroms=np.array(ss_chroms, dtype=str), ss_off=_offsets(self.ss, ss_chroms),
+                         ss_pos=_concat([self.ss[c] for c in ss_chroms], np.int64),
+                         tsstes_chroms=np.array(ts_chroms, dtype=str),
+                         tsstes_off=_offsets({c: v[0] for c, v in self.tsstes.items()}, ts_chroms),
+                         tsstes_pos=_concat([self.tsstes[c][0] for c in ts_chroms], np.int64),
+                         tsstes_tss=_concat([self.tsstes[c][1] for c in ts_chroms], np.uint8))
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def write_refs(self, ss_out, tsstes_out):
+        """The reference files the evaluators read: 'chr pos' and 'chr pos TSS|CPAS' lines."""
+        with open(ss_out, "w") as w:
+            for c in sorted(self.ss):
+                w.writelines(f"{c}\t{p}\n" for p in self.ss[c].tolist())
+        with open(tsstes_out, "w") as w:
+            for c in sorted(self.tsstes):
+                pos, tss = self.tsstes[c]
+                w.writelines(f"{c}\t{p}\t{'TSS' if k else 'CPAS'}\n" for p, k in zip(pos.tolist(), tss.tolist()))
+
+
+def _offsets(arrays, chroms):
+    return np.cumsum([0] + [len(arrays[c]) for c in chroms], dtype=np.int64)
+
+
+def _concat(arrays, dtype):
+    return np.concatenate(arrays).astype(dtype) if arrays else np.empty(0, dtype=dtype)
+
+
+def _split(chroms, off, values):
+    return {str(c): values[off[i]:off[i + 1]] for i, c in enumerate(chroms)}
+
+
+def is_fresh(path, gtf):
+    """True if the index at `path` was built from the current contents of `gtf`."""
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            if int(z["version"]) != VERSION:
+                return False
+            st = os.stat(gtf)
+            if int(z["gtf_size"]) == st.st_size and int(z["gtf_mtime_ns"]) == st.st_mtime_ns:
+                return True
+            return int(z["gtf_size"]) == st.st_size and str(z["sha256"]) == gtf_sha256(gtf)
+    except (OSError, KeyError, ValueError):
+        return False
+
+
+def load_for(gtf):
+    """(AnnotationIndex, True if it came from a fresh <gtf>.annidx) for `gtf`."""
+    path = index_path(gtf)
+    if os.path.exists(path) and is_fresh(path, gtf):
+        return AnnotationIndex.load(path), True
+    return AnnotationIndex.from_gtf(gtf), False
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "build":
+        gtf = sys.argv[2]
+        out = index_path(gtf)
+        idx = AnnotationIndex.from_gtf(gtf)
+        idx.save(out, gtf)
+        print(f"{sum(len(v) for v in idx.ss.values())} splice sites, "
+              f"{sum(len(v[0]) for v in idx.tsstes.values())} TSS/CPAS -> {out}")
+    elif len(sys.argv) == 5 and sys.argv[1] == "refs":
+        idx, cached = load_for(sys.argv[2])
+        idx.write_refs(sys.argv[3], sys.argv[4])
+        print(f"annotation references {'from ' + index_path(sys.argv[2]) if cached else 'parsed from GTF'}",
+              file=sys.stderr)
+    else:
+        print(f"Usage: {sys.argv[0]} build <annotation.gtf>\n"
+              f"       {sys.argv[0]} refs <annotation.gtf> <splice_sites.bed> <tsstes.bed>", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Stream the intervals of a bigWig as bedGraph text on stdout, formatted like
+UCSC bigWigToBedGraph ("%g" values). Chromosomes are decoded block by block
+through coverage_cache, so neither the whole genome nor a whole chromosome
+is held in memory; the output is meant to be piped straight into
+process_tiebrush. Chromosomes come in LC_ALL=C byte order, the order of the
+sorted junction file process_tiebrush merges them with, whatever the order
+inside the bigWig.
+
+Usage: bigwig_to_bedgraph.py <coverage.bigWig|coverage.scov> [chrom ...]
+"""
+import sys
+
+from coverage_cache import open_coverage
+
+
+def junction_order(chroms):
+    """Chromosome names in LC_ALL=C byte order, as the junctions are sorted."""
+    return sorted(chroms, key=lambda c: c.encode())
+
+
+def bedgraph_lines(source, chroms=None):
+    """
+    Yield "chrom\tstart\tend\tvalue\n" lines for `chroms` (all, in
+    junction_order, when None). `source` is a bigWig/.scov path or an open coverage
+    reader (CoverageCache, ScovCoverage) shared with other stages.
+    """
+    cov = source if hasattr(source, "iter_blocks") else open_coverage(source, budget_mb=0)
+    try:
+        for chrom in (chroms if chroms is not None else junction_order(cov.chroms())):
+            if cov.chroms(chrom) is None:
+                continue
+            for s, e, v in cov.iter_blocks(chrom):
+                for a, b, x in zip(s.tolist(), e.tolist(), v.tolist()):
+                    yield f"{chrom}\t{a}\t{b}\t{x:g}\n"
+    finally:
+        if cov is not source:
+            cov.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} <coverage.bigWig> [chrom ...]", file=sys.stderr)
+        sys.exit(1)
+    chroms = sys.argv[2:] or None
+    try:
+        sys.stdout.writelines(bedgraph_lines(sys.argv[1], chroms))
+        sys.stdout.flush()
+    except BrokenPipeError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
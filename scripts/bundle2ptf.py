@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Python port of splicecov_bundle2ptf.pl: turns round-2 bundle metric lines
+(compute_round2_tsstes_metrics.py output) into PTF rows, one per
+tstart/tend/jstart/jend line, with the same fields and formatting.
+
+With --tsstes only the TSS/CPAS rows are produced (what the Perl script
+followed by awk '($4=="TSS" || $4=="CPAS")' gives) and jstart/jend lines are
+skipped without scanning their junction fields. spliceCOV.sh pipes this
+straight into LightGBM_tss.py -i -, so no PTF file is written.
+
+Usage: bundle2ptf.py [--tsstes] <bundle_metrics.txt|->
+"""
+import argparse
+import sys
+
+EVENTS = {"tstart": "TSS", "tend": "CPAS", "jstart": "JSTART", "jend": "JEND"}
+
+
+def ptf_rows(lines, tsstes_only=False):
+    """
+    Yield PTF rows (lists of strings) for bundle metric lines. Like the Perl
+    script, an unknown line type is reported on stderr and ends the output.
+    """
+    chrom = None
+    for line in lines:
+        a = line.split()
+        kind = a[0] if a else ""
+        if kind == "bundle":
+            chrom = a[1]
+        elif kind in ("tstart", "tend"):
+            yield [chrom, a[1], ".", EVENTS[kind], f"{1 - float(a[2]):.4f}"] + a[3:]
+        elif kind in ("jstart", "jend"):
+            if tsstes_only:
+                continue
+            # junction with the highest coverage (last ':' field), first one on ties
+            max_value, max_field, maxsign = -1, "", "."
+            for f in a[5:len(a) - 2]:
+                b = f.split(":")
+                if float(b[-1]) > max_value:
+                    max_value, max_field, maxsign = float(b[-1]), f, b[1]
+            yield [chrom, a[1], maxsign, EVENTS[kind],
+                   f"{1 - float(a[2]):.4f}", a[3], a[4], max_field, a[-2], a[-1]]
+        else:
+            print(f"Line error: {line.rstrip()}", file=sys.stderr)
+            return
+
+
+def main():
+    p = argparse.ArgumentParser(description="Round-2 bundle metrics -> PTF rows on stdout.")
+    p.add_argument("bundle_file", help="Bundle metrics file ('-' for stdin).")
+    p.add_argument("--tsstes", action="store_true", help="Only emit the TSS/CPAS rows.")
+    args = p.parse_args()
+    f = sys.stdin if args.bundle_file == "-" else open(args.bundle_file)
+    try:
+        out = sys.stdout
+        for row in ptf_rows(f, args.tsstes):
+            out.write("\t".join(row) + "\n")
+        out.flush()
+    except BrokenPipeError:
+        pass
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+if __name__ == "__main__":
+    main()
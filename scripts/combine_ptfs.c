@@ -0,0 +1,344 @@
+#define _POSIX_C_SOURCE 200809L
+
+// Merge the score-positive junction and TSS/CPAS files into combined.ptf in
+// one pass; the output is that of combine_ptfs.sh's
+// `LC_ALL=C sort -k1,1 -k2,2n -k3,3 -k4,4 -u`.
+//
+// Both scorers write their positives grouped by chromosome in byte order;
+// within a chromosome the junction rows are only nearly sorted (each JEND
+// row follows its JSTART). Each input is read one chromosome at a time, an
+// out-of-order chromosome is sorted in memory and the two inputs are merged
+// and deduplicated, so memory is bounded by one chromosome's positives.
+//
+// The inputs are checked first. If a chromosome is split or out of order,
+// or a field would not sort the same way (empty, blanks, non-integer or
+// zero-padded position), nothing is written and the exit status is 3;
+// combine_ptfs.sh then falls back to sort.
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define EXIT_UNSORTED 3
+
+// Fields taken from each input, as combine_ptfs.sh's awk
+typedef struct {
+    int min_nf;
+    int cols[4];
+} Spec;
+
+static const Spec JUNC_SPEC = {12, {0, 1, 4, 11}};    // chrom, pos, strand, JSTART/JEND
+static const Spec TSSTES_SPEC = {4, {0, 1, 2, 3}};    // chrom, pos, ".", TSS/CPAS
+
+typedef struct {
+    const char *p[4];
+    int len[4];
+} Fields;
+
+// One output row; its text is text[off, off + len) of the block
+typedef struct {
+    long long pos;
+    size_t off;
+    int len;
+    int f3;   // offsets of fields 3 and 4 in the row text
+    int f3len;
+    int f4;
+    int f4len;
+    int seq;
+} Row;
+
+typedef struct {
+    char *chrom;
+    size_t chrom_cap;
+    Row *rows;
+    int size;
+    int cap;
+    char *text;
+    size_t text_len;
+    size_t text_cap;
+} Block;
+
+typedef struct {
+    FILE *f;
+    const Spec *spec;
+    char *line;
+    size_t line_cap;
+    int pending;  // line holds the first row of the next chromosome
+    Block blk;
+} Input;
+
+// Kept fields of a data line; 0 for comments and lines with too few fields
+static int split_fields(char *line, size_t n, const Spec *spec, Fields *out) {
+    if (n > 0 && line[n - 1] == '\n') line[--n] = '\0';
+    if (line[0] == '#' || n == 0) return 0;
+    const char *start[64];
+    int len[64];
+    int nf = 0;
+    char *p = line;
+    char *end = line + n;
+    while (nf < 64) {
+        char *t = memchr(p, '\t', end - p);
+        start[nf] = p;
+        len[nf] = (int)((t ? t : end) - p);
+        nf++;
+        if (!t) break;
+        p = t + 1;
+    }
+    if (nf < spec->min_nf) return 0;
+    for (int i = 0; i < 4; i++) {
+        out->p[i] = start[spec->cols[i]];
+        out->len[i] = len[spec->cols[i]];
+    }
+    return 1;
+}
+
+// Position as `sort -n` reads it; 0 if it is not a plain integer
+static int parse_pos(const char *p, int n, long long *v) {
+    int i = 0;
+    int neg = 0;
+    if (n > 0 && p[0] == '-') {
+        neg = 1;
+        i = 1;
+    }
+    if (i == n || n - i > 18) return 0;
+    long long x = 0;
+    for (; i < n; i++) {
+        if (p[i] < '0' || p[i] > '9') return 0;
+        x = x * 10 + (p[i] - '0');
+    }
+    *v = neg ? -x : x;
+    return 1;
+}
+
+// 0 for a zero-padded position or "-0": sort -n ties it with another text
+// (007 and 7), and which row -u keeps is then sort's to decide
+static int canonical_pos(const char *p, int n) {
+    int i = n > 0 && p[0] == '-';
+    return !(p[i] == '0' && (n - i > 1 || i));
+}
+
+// Fields compare under `sort -k` only when non-empty and free of blanks
+static int plain_field(const char *p, int n) {
+    if (n == 0) return 0;
+    for (int i = 0; i < n; i++) {
+        if (p[i] == ' ' || p[i] == '\t') return 0;
+    }
+    return 1;
+}
+
+static int cmp_bytes(const char *a, int na, const char *b, int nb) {
+    int c = memcmp(a, b, na < nb ? na : nb);
+    if (c) return c;
+    return (na > nb) - (na < nb);
+}
+
+// 1 if the file can be merged: each chromosome forms one run, the runs are
+// in byte order, and every kept field sorts the same as under `sort -k`
+static int check_input(const char *path, const Spec *spec) {
+    FILE *f = fopen(path, "r");
+    if (!f) {
+        perror(path);
+        exit(1);
+    }
+    char *line = NULL;
+    size_t cap = 0;
+    ssize_t n;
+    char *prev = NULL;
+    size_t prev_cap = 0;
+    int ok = 1;
+    while (ok && (n = getline(&line, &cap, f)) != -1) {
+        Fields fl;
+        long long pos;
+        if (!split_fields(line, (size_t)n, spec, &fl)) continue;
+        for (int i = 0; i < 4; i++) {
+            if (!plain_field(fl.p[i], fl.len[i])) ok = 0;
+        }
+        if (!ok || !parse_pos(fl.p[1], fl.len[1], &pos) || !canonical_pos(fl.p[1], fl.len[1])) {
+            ok = 0;
+            break;
+        }
+        if (prev && strlen(prev) == (size_t)fl.len[0] && memcmp(prev, fl.p[0], fl.len[0]) == 0) continue;
+        if (prev && cmp_bytes(prev, (int)strlen(prev), fl.p[0], fl.len[0]) > 0) {
+            ok = 0;
+            break;
+        }
+        if ((size_t)fl.len[0] + 1 > prev_cap) {
+            prev_cap = fl.len[0] + 1;
+            prev = realloc(prev, prev_cap);
+        }
+        memcpy(prev, fl.p[0], fl.len[0]);
+        prev[fl.len[0]] = '\0';
+    }
+    free(prev);
+    free(line);
+    fclose(f);
+    return ok;
+}
+
+static const char *sort_text;  // text of the block being sorted
+
+static int cmp_rows(const Row *a, const char *ta, const Row *b, const char *tb) {
+    if (a->pos != b->pos) return a->pos < b->pos ? -1 : 1;
+    int c = cmp_bytes(ta + a->off + a->f3, a->f3len, tb + b->off + b->f3, b->f3len);
+    if (c) return c;
+    return cmp_bytes(ta + a->off + a->f4, a->f4len, tb + b->off + b->f4, b->f4len);
+}
+
+// Key order, then input order
+static int cmp_rows_stable(const void *pa, const void *pb) {
+    const Row *a = pa;
+    const Row *b = pb;
+    int c = cmp_rows(a, sort_text, b, sort_text);
+    if (c) return c;
+    return (a->seq > b->seq) - (a->seq < b->seq);
+}
+
+static void add_row(Block *b, const Fields *fl, long long pos) {
+    if (b->size >= b->cap) {
+        b->cap = b->cap ? b->cap * 2 : 4096;
+        b->rows = realloc(b->rows, b->cap * sizeof(Row));
+    }
+    size_t need = (size_t)fl->len[0] + fl->len[1] + fl->len[2] + fl->len[3] + 4;
+    if (b->text_len + need > b->text_cap) {
+        while (b->text_len + need > b->text_cap) {
+            b->text_cap = b->text_cap ? b->text_cap * 2 : 1 << 16;
+        }
+        b->text = realloc(b->text, b->text_cap);
+    }
+    Row *r = &b->rows[b->size];
+    char *t = b->text + b->text_len;
+    int k = 0;
+    for (int i = 0; i < 4; i++) {
+        if (i == 2) r->f3 = k;
+        if (i == 3) r->f4 = k;
+        memcpy(t + k, fl->p[i], fl->len[i]);
+        k += fl->len[i];
+        t[k++] = i < 3 ? '\t' : '\n';
+    }
+    r->pos = pos;
+    r->off = b->text_len;
+    r->len = k;
+    r->f3len = fl->len[2];
+    r->f4len = fl->len[3];
+    r->seq = b->size;
+    b->text_len += k;
+    b->size++;
+}
+
+// Read the next chromosome of in into in->blk, sorted; 0 at end of input
+static int read_block(Input *in) {
+    Block *b = &in->blk;
+    b->size = 0;
+    b->text_len = 0;
+    ssize_t n;
+    while (in->pending || (n = getline(&in->line, &in->line_cap, in->f)) != -1) {
+        Fields fl;
+        long long pos = 0;
+        if (in->pending) {
+            n = (ssize_t)strlen(in->line);
+            in->pending = 0;
+        }
+        if (!split_fields(in->line, (size_t)n, in->spec, &fl)) continue;
+        parse_pos(fl.p[1], fl.len[1], &pos);
+        if (b->size == 0) {
+            if ((size_t)fl.len[0] + 1 > b->chrom_cap) {
+                b->chrom_cap = fl.len[0] + 1;
+                b->chrom = realloc(b->chrom, b->chrom_cap);
+            }
+            memcpy(b->chrom, fl.p[0], fl.len[0]);
+            b->chrom[fl.len[0]] = '\0';
+        } else if (strlen(b->chrom) != (size_t)fl.len[0] || memcmp(b->chrom, fl.p[0], fl.len[0]) != 0) {
+            // split_fields cut the line at its newline; restore it for the next call
+            char *nul = memchr(in->line, '\0', (size_t)n);
+            if (nul) *nul = '\n';
+            in->pending = 1;
+            break;
+        }
+        add_row(b, &fl, pos);
+    }
+    if (b->size == 0) return 0;
+    for (int i = 1; i < b->size; i++) {
+        if (cmp_rows(&b->rows[i - 1], b->text, &b->rows[i], b->text) > 0) {
+            sort_text = b->text;
+            qsort(b->rows, b->size, sizeof(Row), cmp_rows_stable);
+            break;
+        }
+    }
+    return 1;
+}
+
+static void open_input(Input *in, const char *path, const Spec *spec) {
+    memset(in, 0, sizeof(*in));
+    in->spec = spec;
+    in->f = fopen(path, "r");
+    if (!in->f) {
+        perror(path);
+        exit(1);
+    }
+}
+
+static void close_input(Input *in) {
+    fclose(in->f);
+    free(in->line);
+    free(in->blk.chrom);
+    free(in->blk.rows);
+    free(in->blk.text);
+}
+
+// Write the rows of one chromosome from both blocks (either may be NULL) in
+// key order, keeping the first of equal keys (blocks in argument order)
+static void merge_blocks(const Block *a, const Block *b, FILE *out) {
+    int i = 0;
+    int j = 0;
+    int na = a ? a->size : 0;
+    int nb = b ? b->size : 0;
+    const Row *last = NULL;
+    const char *last_text = NULL;
+    while (i < na || j < nb) {
+        const Row *r;
+        const char *t;
+        if (j >= nb || (i < na && cmp_rows(&a->rows[i], a->text, &b->rows[j], b->text) <= 0)) {
+            r = &a->rows[i++];
+            t = a->text;
+        } else {
+            r = &b->rows[j++];
+            t = b->text;
+        }
+        if (last && cmp_rows(last, last_text, r, t) == 0) continue;
+        fwrite(t + r->off, 1, r->len, out);
+        last = r;
+        last_text = t;
+    }
+}
+
+int main(int argc, char *argv[]) {
+    if (argc != 3) {
+        fprintf(stderr, "Usage: %s <jpos.txt> <tsstes.pos.txt>\n", argv[0]);
+        return 1;
+    }
+    if (!check_input(argv[1], &JUNC_SPEC) || !check_input(argv[2], &TSSTES_SPEC)) {
+        return EXIT_UNSORTED;
+    }
+
+    static char outbuf[1 << 20];
+    setvbuf(stdout, outbuf, _IOFBF, sizeof(outbuf));
+    Input in[2];
+    open_input(&in[0], argv[1], &JUNC_SPEC);
+    open_input(&in[1], argv[2], &TSSTES_SPEC);
+    int live[2];
+    live[0] = read_block(&in[0]);
+    live[1] = read_block(&in[1]);
+    while (live[0] || live[1]) {
+        int c = (live[0] && live[1]) ? strcmp(in[0].blk.chrom, in[1].blk.chrom) : (live[0] ? -1 : 1);
+        merge_blocks(c <= 0 ? &in[0].blk : NULL, c >= 0 ? &in[1].blk : NULL, stdout);
+        if (c <= 0) live[0] = read_block(&in[0]);
+        if (c >= 0) live[1] = read_block(&in[1]);
+    }
+    close_input(&in[0]);
+    close_input(&in[1]);
+    if (fflush(stdout) != 0 || ferror(stdout)) {
+        perror("write");
+        return 1;
+    }
+    return 0;
+}
@@ -20,6 +20,15 @@ out="${3:-/dev/stdout}"
 [[ -f "$file1" ]] || { echo "Missing: $file1" >&2; exit 2; }
 [[ -f "$file2" ]] || { echo "Missing: $file2" >&2; exit 2; }
 
+# Inputs already grouped by chromosome (as the scorers write them) are merged
+# in one pass by the compiled helper; it exits 3 without output otherwise.
+merge_bin="$(dirname "$0")/combine_ptfs"
+if [[ -x "$merge_bin" ]]; then
+  rc=0
+  "$merge_bin" "$file1" "$file2" > "$out" || rc=$?
+  [[ $rc -eq 3 ]] || exit "$rc"
+fi
+
 # Optional: tune sort tmp and threads
 sort_tmp="${TMPDIR:-.}"
 threads="$(getconf _NPROCESSORS_ONLN 2>/dev/null || echo 1)"
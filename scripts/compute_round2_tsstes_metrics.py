@@ -5,6 +5,8 @@ import pyBigWig
 import numpy as np
 import math
 
+from coverage_cache import open_coverage
+
 def main():
     if len(sys.argv) != 3:
         print("Usage: script.py <bundle_file> <bigwig_file>")
@@ -13,40 +15,146 @@ def main():
     bigwig_file = sys.argv[2]
     
     try:
-        bw = pyBigWig.open(bigwig_file)
+        bw = open_coverage(bigwig_file)
     except Exception as e:
         print(f"Error opening bigWig file: {e}")
         sys.exit(1)
     
-    current_chr = None
     with open(bundle_file, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            cols = line.split()
-            if cols[0] == 'bundle':
-                current_chr = cols[1]
-                print(line)
-            elif cols[0] in ('tstart', 'tend'):
-                position = int(cols[1])
-                event_type = cols[0]
-                # Now process this position
-                # angle_metric, slope_metric = compute_metrics(bw, current_chr, position, event_type)
-                angle_metric, slope_metric, smoothness_metric = compute_metrics(bw, current_chr, position, event_type)
-                # Determine TRUE/FALSE based on slope and event type
-                if (event_type == 'tstart' and slope_metric > 0) or (event_type == 'tend' and slope_metric < 0):
-                    truth_value = "TRUE"
-                else:
-                    truth_value = "FALSE"
-                # Output the original line with metrics and truth value appended
-                # print(f"{line}\t{angle_metric:.2f}\t{slope_metric:.4f}\t{truth_value}")
-                print(f"{line}\t{angle_metric:.2f}\t{slope_metric:.4f}\t{smoothness_metric:.4f}\t{truth_value}")
-            else:
-                # Other lines, just print as is
-                print(line)
+        for out_line in annotate_bundles(f, bw):
+            print(out_line)
+    print(bw.report(), file=sys.stderr)
     bw.close()
 
+WINDOW = 50          # bases in the slope/smoothness window
+BATCH = 4096         # tstart/tend candidates annotated per batch
+BLOCK = 1 << 22      # coverage fetched per chromosome block
+SLOPE_GUARD = 1e-11  # relative guard band around the closed-form slope
+
+def annotate_bundles(lines, bw, batch=BATCH):
+    """
+    Yield the bundle lines with angle/slope/smoothness metrics and the
+    TRUE/FALSE direction flag appended to every tstart/tend line.
+    Lines are buffered and annotated in batches of whole bundles on one
+    chromosome (see batch_metrics); output order is unchanged.
+    """
+    pending = []   # output lines (tstart/tend ones are filled in on flush)
+    cands = []     # (index into pending, position, event_type)
+    current_chr = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        cols = line.split()
+        if cols[0] == 'bundle':
+            if cands and (cols[1] != current_chr or len(cands) >= batch):
+                yield from _flush(bw, current_chr, pending, cands)
+                pending, cands = [], []
+            elif not cands:
+                yield from pending
+                pending = []
+            current_chr = cols[1]
+            pending.append(line)
+        elif cols[0] in ('tstart', 'tend'):
+            cands.append((len(pending), int(cols[1]), cols[0]))
+            pending.append(line)
+        else:
+            # Other lines, just pass through as is
+            pending.append(line)
+    if cands:
+        yield from _flush(bw, current_chr, pending, cands)
+    else:
+        yield from pending
+
+def _flush(bw, chrom, pending, cands):
+    angles, slopes, smooths = batch_metrics(bw, chrom, [c[1] for c in cands], [c[2] for c in cands])
+    for (i, _, event_type), angle_metric, slope_metric, smoothness_metric in zip(cands, angles, slopes, smooths):
+        # Determine TRUE/FALSE based on slope and event type
+        if (event_type == 'tstart' and slope_metric > 0) or (event_type == 'tend' and slope_metric < 0):
+            truth_value = "TRUE"
+        else:
+            truth_value = "FALSE"
+        pending[i] = f"{pending[i]}\t{angle_metric:.2f}\t{slope_metric:.4f}\t{smoothness_metric:.4f}\t{truth_value}"
+    return pending
+
+def window_matrix(bw, chrom, starts, n=WINDOW):
+    """Coverage windows [s, s+n) as a (len(starts), n) float64 matrix, NaN -> 0, read once per block."""
+    starts = np.asarray(starts, dtype=np.int64)
+    out = np.empty((starts.size, n))
+    order = np.argsort(starts, kind='stable')
+    offsets = np.arange(n)
+    for grp in np.split(order, np.flatnonzero(np.diff(starts[order] // BLOCK)) + 1):
+        if grp.size == 0:
+            continue
+        lo = int(starts[grp[0]])
+        hi = int(starts[grp[-1]]) + n
+        if pyBigWig.numpy:
+            vals = np.asarray(bw.values(chrom, lo, hi, numpy=True), dtype=np.float64)
+        else:
+            vals = np.array(bw.values(chrom, lo, hi), dtype=np.float64)
+        vals = np.nan_to_num(vals)
+        out[grp] = vals[(starts[grp] - lo)[:, None] + offsets]
+    return out
+
+def _near_half(v, scale, band):
+    """True where v*scale lies within band*scale of a rounding tie (k + 0.5)."""
+    f = v * scale
+    return np.abs(f - np.floor(f) - 0.5) <= band * scale
+
+def window_metrics(Y):
+    """
+    compute_metrics over full windows (rows of Y). The slope is the
+    closed-form least-squares slope instead of np.linalg.lstsq; rows whose
+    printed angle/slope or slope sign could differ from lstsq (slope near 0
+    -- lstsq leaves ~1e-17 noise on flat windows -- or near a rounding tie)
+    are flagged in the returned `exact` mask as needing lstsq.
+    """
+    n = Y.shape[1]
+    xc = np.arange(n, dtype=np.float64) - (n - 1) / 2.0
+    slope = (Y @ xc) / float(xc @ xc)
+    angle = np.degrees(np.arctan(slope))
+    band = SLOPE_GUARD * (np.abs(Y).max(axis=1) + 1.0)
+    exact = ~((np.abs(slope) <= band) | _near_half(slope, 1e4, band) | _near_half(angle, 1e2, 60.0 * band + 1e-12))
+
+    # Same ops as compute_metrics, row-wise
+    diffs = np.diff(Y, axis=1)
+    mean_coverage = Y.mean(axis=1) + 1e-6
+    relative_diffs = diffs / mean_coverage[:, None]
+    abs_relative = np.abs(relative_diffs)
+    mean_abs_relative_diff = abs_relative.mean(axis=1) + 1e-6
+    cv_relative = relative_diffs.std(axis=1) / mean_abs_relative_diff
+    max_relative_diff = abs_relative.max(axis=1)
+    alpha = 0.5
+    beta = 1.0
+    smoothness = 1 / (1 + alpha * cv_relative + beta * max_relative_diff)
+    return angle, slope, smoothness, exact
+
+def batch_metrics(bw, chrom, positions, event_types):
+    """
+    compute_metrics for many tstart/tend positions of one chromosome.
+    Full 50bp windows share one coverage read and the closed-form slope;
+    clipped windows and guard-band rows go through compute_metrics.
+    Returns (angles, slopes, smoothness) arrays.
+    """
+    chrom_len = bw.chroms(chrom)
+    if chrom_len is None:
+        print(f"Chromosome {chrom} not found in bigWig file.")
+        sys.exit(1)
+    pos = np.asarray(positions, dtype=np.int64)
+    event_types = np.asarray(event_types)
+    wstart = np.where(event_types == 'tstart', pos, pos - WINDOW)
+    full = (wstart >= 0) & (wstart + WINDOW <= chrom_len)
+
+    angles, slopes, smooths = np.zeros(pos.size), np.zeros(pos.size), np.zeros(pos.size)
+    scalar = ~full
+    idx = np.flatnonzero(full)
+    if idx.size:
+        angles[idx], slopes[idx], smooths[idx], exact = window_metrics(window_matrix(bw, chrom, wstart[idx]))
+        scalar[idx[~exact]] = True
+    for i in np.flatnonzero(scalar):
+        angles[i], slopes[i], smooths[i] = compute_metrics(bw, chrom, int(pos[i]), str(event_types[i]))
+    return angles, slopes, smooths
+
 # def compute_metrics(bw, chrom, position, event_type):
 #     # Ensure the chromosome exists in the bigWig file
 #     chrom_len = bw.chroms(chrom)
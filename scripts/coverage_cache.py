@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Shared bigWig coverage access with a chromosome-block cache.
+
+CoverageCache decodes a bigWig in fixed-size blocks of each chromosome and
+keeps the decoded intervals (uint32 start/end, float32 value) in an LRU
+bounded by a memory budget. It answers the subset of the pyBigWig API used
+by the pipeline -- chroms(), values() and intervals() -- so round-1 junction
+features, the bedGraph stream fed to process_tiebrush and round-2 TSS/TES
+metrics can all share one instance, and a region is decoded once instead of
+once per stage. Results are identical to querying pyBigWig directly.
+
+The budget comes from SPLICECOV_CACHE_MB (default 1024); 0 disables
+retention. Safe to share between threads. open_coverage() picks this or
+the memory-mapped .scov reader (scov.py) by file type.
+
+Usage (stats for a full pass over a bigWig):
+  coverage_cache.py <coverage.bigWig>
+"""
+import itertools
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyBigWig
+
+BLOCK = 1 << 20
+DEFAULT_BUDGET_MB = 1024
+
+
+def budget_from_env():
+    return int(os.environ.get("SPLICECOV_CACHE_MB") or DEFAULT_BUDGET_MB)
+
+
+def fill_values(out, start, end, s, e, v):
+    """Write intervals (s, e, v) overlapping [start, end) into the per-base array out."""
+    s = np.maximum(s.astype(np.int64), start) - start
+    lens = np.minimum(e.astype(np.int64), end) - start - s
+    if lens.size:
+        first = np.cumsum(lens) - lens
+        out[np.repeat(s - first, lens) + np.arange(lens.sum())] = np.repeat(v, lens)
+
+
+def open_coverage(path, budget_mb=None):
+    """Coverage reader for a bigWig (CoverageCache) or a .scov index (memory-mapped)."""
+    import scov
+    if scov.is_scov(path):
+        return scov.ScovCoverage(path)
+    return CoverageCache(path, budget_mb)
+
+
+class CoverageCache:
+    def __init__(self, bigwig_file, budget_mb=None, block=BLOCK):
+        self.bw = pyBigWig.open(bigwig_file)
+        self.block = block
+        self.budget = (budget_from_env() if budget_mb is None else budget_mb) << 20
+        self.blocks = OrderedDict()  # (chrom, block index) -> (starts, ends, vals)
+        self.resident = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.RLock()
+        self._chroms = self.bw.chroms()
+
+    # -- pyBigWig-compatible surface ---------------------------------------
+    def chroms(self, chrom=None):
+        if chrom is None:
+            return dict(self._chroms)
+        return self._chroms.get(chrom)
+
+    def values(self, chrom, start, end, numpy=False):
+        """Per-base values of [start, end), NaN where there is no data (as pyBigWig.values)."""
+        out = np.full(end - start, np.nan, dtype=np.float32)
+        for s, e, v in self._overlapping(chrom, start, end):
+            fill_values(out, start, end, s, e, v)
+        return out if numpy else out.tolist()
+
+    def intervals(self, chrom, start=None, end=None):
+        """(start, end, value) tuples overlapping [start, end), unclipped (as pyBigWig.intervals)."""
+        start = 0 if start is None else start
+        end = self._chroms[chrom] if end is None else end
+        out, last_end = [], 0
+        for s, e, v in self._overlapping(chrom, start, end):
+            keep = s >= last_end
+            if keep.any():
+                out.extend(zip(s[keep].tolist(), e[keep].tolist(), v[keep].tolist()))
+                last_end = out[-1][1]
+        return tuple(out)
+
+    def close(self):
+        with self.lock:
+            self.blocks.clear()
+            self.resident = 0
+            self.bw.close()
+
+    # -- block cache ---------------------------------------------------------
+    def iter_blocks(self, chrom):
+        """Decoded blocks of a chromosome in order, intervals straddling a block edge reported once."""
+        last_end = 0
+        for b in range((self._chroms[chrom] + self.block - 1) // self.block):
+            s, e, v = self._block(chrom, b)
+            keep = s >= last_end
+            if keep.any():
+                s, e, v = s[keep], e[keep], v[keep]
+                last_end = int(e[-1])
+                yield s, e, v
+
+    def _overlapping(self, chrom, start, end):
+        for b in range(start // self.block, (end - 1) // self.block + 1):
+            s, e, v = self._block(chrom, b)
+            lo = np.searchsorted(e, start, side="right")
+            hi = np.searchsorted(s, end, side="left")
+            if hi > lo:
+                yield s[lo:hi], e[lo:hi], v[lo:hi]
+
+    def _block(self, chrom, b):
+        key = (chrom, b)
+        with self.lock:
+            blk = self.blocks.get(key)
+            if blk is not None:
+                self.hits += 1
+                self.blocks.move_to_end(key)
+                return blk
+            self.misses += 1
+            lo = b * self.block
+            hi = min(lo + self.block, self._chroms[chrom])
+            iv = self.bw.intervals(chrom, lo, hi) or ()
+            flat = np.fromiter(itertools.chain.from_iterable(iv), dtype=np.float64, count=3 * len(iv)).reshape(-1, 3)
+            blk = (flat[:, 0].astype(np.uint32), flat[:, 1].astype(np.uint32), flat[:, 2].astype(np.float32))
+            size = sum(a.nbytes for a in blk)
+            if size <= self.budget:
+                self.blocks[key] = blk
+                self.resident += size
+                while self.resident > self.budget:
+                    _, old = self.blocks.popitem(last=False)
+                    self.resident -= sum(a.nbytes for a in old)
+                    self.evictions += 1
+            return blk
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "resident_mb": round(self.resident / (1 << 20), 1)}
+
+    def report(self, label="coverage cache"):
+        st = self.stats()
+        total = st["hits"] + st["misses"]
+        rate = 100.0 * st["hits"] / total if total else 0.0
+        return (f"{label}: {st['hits']} hits, {st['misses']} misses ({rate:.1f}% hit), "
+                f"{st['evictions']} evictions, {st['resident_mb']} MB resident")
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} <coverage.bigWig>", file=sys.stderr)
+        sys.exit(1)
+    cov = CoverageCache(sys.argv[1])
+    n = 0
+    for chrom in cov.chroms():
+        for s, _, _ in cov.iter_blocks(chrom):
+            n += s.size
+    print(f"{n} intervals; {cov.report()}")
+    cov.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,15 @@
 
 import sys
 import os
-import bisect
+
+import numpy as np
 
 def read_reference_file(ref_file_path):
     """
-    Reads the reference BED file and stores positions in sorted lists per chromosome.
+    Reads the reference BED file into a sorted position array per chromosome
+    (chromosomes in file order, repeated positions kept).
     """
-    ref_dict = {}
+    ref_lists = {}
     try:
         with open(ref_file_path, 'r') as ref_file:
             for line in ref_file:
@@ -23,11 +25,8 @@ def read_reference_file(ref_file_path):
                     except ValueError:
                         print(f"Warning: Non-integer position '{cols[1]}' in reference file. Skipping line.")
                         continue
-                    ref_dict.setdefault(chrom, []).append(pos)
-        # Sort the positions for each chromosome
-        for chrom in ref_dict:
-            ref_dict[chrom].sort()
-        return ref_dict
+                    ref_lists.setdefault(chrom, []).append(pos)
+        return {chrom: np.sort(np.array(positions, dtype=np.int64)) for chrom, positions in ref_lists.items()}
     except FileNotFoundError:
         print(f"Error: Reference file '{ref_file_path}' not found.")
         sys.exit(1)
@@ -35,66 +34,68 @@ def read_reference_file(ref_file_path):
         print(f"An error occurred while reading the reference file: {e}")
         sys.exit(1)
 
-def find_matches(target_rows, ref_dict, window=50):
+def read_target_file(target_file_path):
     """
-    Finds matching and non-matching rows from the target file.
+    Reads the target file once. Returns its lines (newline removed), the label
+    suffix of each line ('' for comments, else '\t0' until matched) and, for
+    every row with a chromosome and an integer position: its line number,
+    chromosome, position and whether it counts towards TP/FP (rows that are
+    comments once leading blanks are stripped only get a label).
     """
-    matching_rows = []
-    non_matching_rows = []
-    matched_ref_positions = set()
-
-    for row in target_rows:
-        chrom, pos = row['chrom'], row['pos']
-        if chrom not in ref_dict:
-            non_matching_rows.append(row)
+    with open(target_file_path, 'r') as infile:
+        lines = infile.read().split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    suffix = ['' if not line or line[0] == '#' else '\t0' for line in lines]
+    rows, chroms, positions = [], [], []
+    for i, line in enumerate(lines):
+        if not suffix[i]:
+            continue
+        cols = line.split(None, 2)
+        if len(cols) < 2:
+            continue
+        try:
+            pos = int(cols[1])
+        except ValueError:
             continue
-        ref_positions = ref_dict[chrom]
-        left, right = pos - window, pos + window
-        l_idx = bisect.bisect_left(ref_positions, left)
-        r_idx = bisect.bisect_right(ref_positions, right)
-        if l_idx < r_idx:
-            matching_rows.append(row)
-            for ref_pos in ref_positions[l_idx:r_idx]:
-                matched_ref_positions.add((chrom, ref_pos))
-        else:
-            non_matching_rows.append(row)
-
-    return matching_rows, non_matching_rows, matched_ref_positions
-
-def add_label_column(input_file_path, ref_dict, output_file_path, window=50):
+        rows.append(i)
+        chroms.append(cols[0])
+        positions.append(pos)
+    counted = np.array([not lines[i].lstrip().startswith('#') for i in rows], dtype=bool)
+    return (lines, suffix, np.array(rows, dtype=np.int64), chroms,
+            np.array(positions, dtype=np.int64), counted)
+
+def match_windows(chroms, positions, counted, ref_dict, window=50):
     """
-    Writes out the input file with an extra final column: "1" if within `window` of a ref position, else "0".
+    Matches every target position against the reference positions within
+    `window`, one searchsorted per chromosome. Returns a match flag per target
+    row and, per reference chromosome, a flag per reference position that is
+    within `window` of a counted matching row.
     """
-    try:
-        with open(input_file_path, 'r') as infile, open(output_file_path, 'w') as outfile:
-            for line in infile:
-                line = line.rstrip('\n')
-                if not line or line.startswith('#'):
-                    outfile.write(line + '\n')
-                    continue
-                cols = line.split()
-                if len(cols) < 2:
-                    outfile.write(line + '\t0\n')
-                    continue
-                chrom = cols[0]
-                try:
-                    pos = int(cols[1])
-                except ValueError:
-                    outfile.write(line + '\t0\n')
-                    continue
-                if chrom not in ref_dict:
-                    outfile.write(line + '\t0\n')
-                    continue
-                ref_positions = ref_dict[chrom]
-                left, right = pos - window, pos + window
-                l_idx = bisect.bisect_left(ref_positions, left)
-                r_idx = bisect.bisect_right(ref_positions, right)
-                label = "1" if l_idx < r_idx else "0"
-                outfile.write(f"{line}\t{label}\n")
-        print(f"Labeled file written to: {output_file_path}")
-    except Exception as e:
-        print(f"An error occurred while adding labels: {e}")
-        sys.exit(1)
+    hit = np.zeros(len(positions), dtype=bool)
+    covered = {chrom: np.zeros(len(ref), dtype=bool) for chrom, ref in ref_dict.items()}
+    if len(positions) == 0:
+        return hit, covered
+    names = {}
+    inv = np.fromiter((names.setdefault(c, len(names)) for c in chroms), dtype=np.int64, count=len(chroms))
+    order = np.argsort(inv, kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(inv, minlength=len(names)))))
+    for k, chrom in enumerate(names):
+        ref_positions = ref_dict.get(chrom)
+        if ref_positions is None:
+            continue
+        idx = order[bounds[k]:bounds[k + 1]]
+        pos = positions[idx]
+        l_idx = np.searchsorted(ref_positions, pos - window, side='left')
+        r_idx = np.searchsorted(ref_positions, pos + window, side='right')
+        found = l_idx < r_idx
+        hit[idx] = found
+        # Reference positions covered by any [l_idx, r_idx) of a counted match
+        m = found & counted[idx]
+        n = len(ref_positions) + 1
+        depth = np.cumsum(np.bincount(l_idx[m], minlength=n) - np.bincount(r_idx[m], minlength=n))
+        covered[chrom] = depth[:-1] > 0
+    return hit, covered
 
 def main():
     if len(sys.argv) != 3:
@@ -115,40 +116,29 @@ def main():
     print("Reading reference BED file...")
     ref_dict = read_reference_file(ref_file_path)
 
-    # Add label column
+    # Read the target once, match it and add the label column
     print("Adding label column to target file...")
-    add_label_column(target_file_path, ref_dict, labeled_output_file)
-
-    # Load target rows for matching logic
-    target_rows = []
     try:
-        with open(target_file_path, 'r') as tf:
-            for line in tf:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                cols = line.split()
-                if len(cols) < 2:
-                    continue
-                chrom = cols[0]
-                try:
-                    pos = int(cols[1])
-                except ValueError:
-                    continue
-                target_rows.append({'chrom': chrom, 'pos': pos, 'line': line})
+        lines, suffix, rows, chroms, positions, counted = read_target_file(target_file_path)
+        hit, covered = match_windows(chroms, positions, counted, ref_dict)
+        for i in rows[hit].tolist():
+            suffix[i] = '\t1'
+        with open(labeled_output_file, 'w') as outfile:
+            outfile.writelines(f"{line}{s}\n" for line, s in zip(lines, suffix))
+        print(f"Labeled file written to: {labeled_output_file}")
     except Exception as e:
-        print(f"Error reading target file: {e}")
+        print(f"An error occurred while adding labels: {e}")
         sys.exit(1)
 
-    matching_rows, non_matching_rows, matched_ref_positions = find_matches(target_rows, ref_dict)
+    TP = int(np.count_nonzero(hit & counted))
+    FP = int(np.count_nonzero(~hit & counted))
 
-    print(f"Found {len(matching_rows)} matching and {len(non_matching_rows)} non-matching rows.")
+    print(f"Found {TP} matching and {FP} non-matching rows.")
 
     # Write matches
     try:
         with open(matching_output_file, 'w') as mf:
-            for r in matching_rows:
-                mf.write(r['line'] + '\n')
+            mf.writelines(lines[i].strip() + '\n' for i in rows[hit & counted].tolist())
         print(f"Matching rows → {matching_output_file}")
     except Exception as e:
         print(f"Error writing matching rows: {e}")
@@ -158,19 +148,16 @@ def main():
     try:
         fn_count = 0
         with open(ref_only_output_file, 'w') as rf:
-            for chrom, positions in ref_dict.items():
-                for pos in positions:
-                    if (chrom, pos) not in matched_ref_positions:
-                        rf.write(f"{chrom}\t{pos}\n")
-                        fn_count += 1
+            for chrom, ref_positions in ref_dict.items():
+                missed = ref_positions[~covered[chrom]].tolist()
+                rf.writelines(f"{chrom}\t{pos}\n" for pos in missed)
+                fn_count += len(missed)
         print(f"Reference-only rows → {ref_only_output_file}")
     except Exception as e:
         print(f"Error writing reference-only rows: {e}")
         sys.exit(1)
 
     # Compute and print metrics
-    TP = len(matching_rows)
-    FP = len(non_matching_rows)
     FN = fn_count
 
     precision   = TP / (TP + FP) if (TP + FP) > 0 else 0
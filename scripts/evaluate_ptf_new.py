@@ -1,148 +1,236 @@
 #!/usr/bin/env python3
-
-import sys
+"""
+Junction evaluation: predicted splice-site rows (target) against the
+annotation splice sites (reference), matched on (chromosome, position).
+
+When both files are sorted by chromosome (byte order) and numeric
+position -- spliceCOV.sh passes them that way -- they are merge-joined in
+one pass that holds only the current position, so memory does not grow
+with the input. Otherwise both are read into memory. Either way the
+matching / non-matching / reference-only rows and the metrics are the
+same: a position counts once, with its highest-confidence row when the
+rows carry a score in column 7, else its first row.
+
+Usage: evaluate_ptf_new.py [--no-row-files] <target_file> <ref_file_path>
+"""
+import argparse
 import os
+import sys
 
-def main():
-    if len(sys.argv) != 3:
-        print(f"Usage: {sys.argv[0]} <target_file> <ref_file_path>")
-        sys.exit(1)
 
-    target_file_path = sys.argv[1]
-    ref_file_path = sys.argv[2]
+class NotSorted(Exception):
+    pass
 
-    # # Debug: Print absolute paths to help ensure they are as expected.
-    # abs_target = os.path.abspath(target_file_path)
-    # abs_ref = os.path.abspath(ref_file_path)
-    # print(f"Looking for target file: {abs_target}")
-    # print(f"Looking for reference file: {abs_ref}")
 
-    # Check that the target file exists
-    if not os.path.exists(target_file_path):
-        print(f"Error: Target file '{target_file_path}' not found.")
-        sys.exit(1)
+class RowFiles:
+    """out/<target>_{matching_rows,non_matching_rows,ref_only_rows,with_labels}.txt, or nothing when disabled."""
 
-    # Check that the reference file exists
-    if not os.path.exists(ref_file_path):
-        print(f"Error: Reference file '{ref_file_path}' not found.")
-        sys.exit(1)
+    NAMES = ("matching_rows", "non_matching_rows", "ref_only_rows", "with_labels")
 
-    target_file_basename = os.path.basename(target_file_path)
-    
-    # Define output file names
-    matching_output_file = f"out/{target_file_basename}_matching_rows.txt"
-    non_matching_output_file = f"out/{target_file_basename}_non_matching_rows.txt"
-    ref_only_output_file = f"out/{target_file_basename}_ref_only_rows.txt"
-    labeled_output_file = f"out/{target_file_basename}_with_labels.txt"
+    def __init__(self, target_file_path, enabled=True):
+        basename = os.path.basename(target_file_path)
+        self.paths = {n: f"out/{basename}_{n}.txt" for n in self.NAMES}
+        self.files = {}
+        if enabled:
+            os.makedirs("out", exist_ok=True)
+            self.files = {n: open(p, 'w') for n, p in self.paths.items()}
 
-    # Create output directory if it doesn't exist
-    os.makedirs("out", exist_ok=True)
+    def write(self, name, row):
+        f = self.files.get(name)
+        if f is not None:
+            f.write(row + '\n')
 
-    # Read reference file and build a dict of positions to lines
-    ref_positions = {}
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def _rows(path):
+    """(stripped line, fields) per line; comment and blank lines have fields None."""
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                yield line, None
+            else:
+                yield line, line.split()
+
+
+def _key(cols, prev, path):
+    """(chrom, pos) of a row of a sorted file; NotSorted when it comes before prev."""
     try:
-        with open(ref_file_path, 'r') as ref_file:
-            for line in ref_file:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                cols = line.split()
-                if len(cols) >= 2:
-                    chrom = cols[0]
-                    pos = cols[1]
-                    ref_positions[(chrom, pos)] = line
-    except FileNotFoundError:
-        print(f"Error: Reference file '{ref_file_path}' not found.")
-        sys.exit(1)
+        pos = int(cols[1])
+    except ValueError:
+        raise NotSorted(f"{path}: non-integer position '{cols[1]}'")
+    if str(pos) != cols[1]:
+        raise NotSorted(f"{path}: non-canonical position '{cols[1]}'")
+    key = (cols[0], pos)
+    if prev is not None and key < prev:
+        raise NotSorted(f"{path}: not sorted by chromosome and position at {cols[0]}:{cols[1]}")
+    return key
+
+
+def _reference_keys(path):
+    """Each position of a sorted reference once, with its last line."""
+    prev_key, prev_line = None, None
+    for line, cols in _rows(path):
+        if cols is None or len(cols) < 2:
+            continue
+        key = _key(cols, prev_key, path)
+        if prev_key is not None and key != prev_key:
+            yield prev_key, prev_line
+        prev_key, prev_line = key, line
+    if prev_key is not None:
+        yield prev_key, prev_line
+
+
+def _has_score(cols, present):
+    # Decided on the first row with a 7th column; once found, it stays on
+    if not present and len(cols) > 6:
+        try:
+            float(cols[6])
+            return True
+        except ValueError:
+            return False
+    return present
+
+
+def evaluate_sorted(target_file_path, ref_file_path, out):
+    """Merge-join of two sorted files; returns the counts for the report."""
+    n = dict(ref=0, target=0, matching=0, non_matching=0, ref_only=0)
+    refs = _reference_keys(ref_file_path)
+    ref_key, ref_line = next(refs, (None, None))
+    confidence_score_present = False
+    group, best, in_ref = None, None, False
+
+    def close_group():
+        n['target'] += 1
+        if in_ref:
+            n['matching'] += 1
+            out.write("matching_rows", best)
+        else:
+            n['non_matching'] += 1
+            out.write("non_matching_rows", best)
+
+    for line, cols in _rows(target_file_path):
+        if cols is None:
+            out.write("with_labels", line)
+            continue
+        if len(cols) < 2:
+            continue
+        key = _key(cols, group, target_file_path)
+        confidence_score_present = _has_score(cols, confidence_score_present)
+        if key != group:
+            if group is not None:
+                close_group()
+            group, best = key, line
+            # Reference positions before this one have no prediction
+            while ref_key is not None and ref_key < key:
+                n['ref'] += 1
+                n['ref_only'] += 1
+                out.write("ref_only_rows", ref_line)
+                ref_key, ref_line = next(refs, (None, None))
+            in_ref = ref_key == key
+            if in_ref:
+                n['ref'] += 1
+                ref_key, ref_line = next(refs, (None, None))
+        elif confidence_score_present and float(cols[6]) > float(best.split()[6]):
+            best = line
+        out.write("with_labels", f"{best}\t{1 if in_ref else 0}")
+    if group is not None:
+        close_group()
+    while ref_key is not None:
+        n['ref'] += 1
+        n['ref_only'] += 1
+        out.write("ref_only_rows", ref_line)
+        ref_key, ref_line = next(refs, (None, None))
+    return n
+
+
+def evaluate_in_memory(target_file_path, ref_file_path, out):
+    """Same as evaluate_sorted for files in any order, holding both in dicts."""
+    ref_positions = {}
+    for line, cols in _rows(ref_file_path):
+        if cols is not None and len(cols) >= 2:
+            ref_positions[(cols[0], cols[1])] = line
 
-    # Initialize counters and containers
-    total_rows = 0
-    matching_rows = {}
-    non_matching_rows = {}
     target_positions = {}
+    in_ref = {}
     confidence_score_present = False
+    for line, cols in _rows(target_file_path):
+        if cols is None:
+            out.write("with_labels", line)
+            continue
+        if len(cols) < 2:
+            continue
+        key = (cols[0], cols[1])
+        confidence_score_present = _has_score(cols, confidence_score_present)
+        if key not in target_positions:
+            target_positions[key] = line
+            in_ref[key] = key in ref_positions
+        elif confidence_score_present and float(cols[6]) > float(target_positions[key].split()[6]):
+            target_positions[key] = line
+        out.write("with_labels", f"{target_positions[key]}\t{1 if in_ref[key] else 0}")
+
+    n = dict(ref=len(ref_positions), target=len(target_positions), matching=0, non_matching=0, ref_only=0)
+    for key, row in target_positions.items():
+        if in_ref[key]:
+            n['matching'] += 1
+            out.write("matching_rows", row)
+        else:
+            n['non_matching'] += 1
+            out.write("non_matching_rows", row)
+    for key, row in ref_positions.items():
+        if key not in target_positions:
+            n['ref_only'] += 1
+            out.write("ref_only_rows", row)
+    return n
 
-    try:
-        with open(target_file_path, 'r') as target_file, open(labeled_output_file, 'w') as labeled_file:
-            for line in target_file:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    labeled_file.write(line + '\n')
-                    continue
-                cols = line.split()
-                if len(cols) >= 2:
-                    total_rows += 1
-                    chrom = cols[0]
-                    pos = cols[1]
-                    key = (chrom, pos)
-
-                    # Check dynamically for the confidence score column.
-                    if not confidence_score_present and len(cols) > 6:
-                        try:
-                            float(cols[6])
-                            confidence_score_present = True
-                        except ValueError:
-                            confidence_score_present = False
-
-                    if confidence_score_present:
-                        # For rows with a confidence score, keep the row with the highest score for each key.
-                        confidence_score = float(cols[6])
-                        if key not in target_positions:
-                            target_positions[key] = line
-                        else:
-                            existing_line = target_positions[key]
-                            existing_score = float(existing_line.split()[6])
-                            if confidence_score > existing_score:
-                                target_positions[key] = line
-                    else:
-                        # For rows without a confidence score, simply use the first occurrence.
-                        if key not in target_positions:
-                            target_positions[key] = line
-
-                    # Categorize rows
-                    if key in ref_positions:
-                        matching_rows[key] = target_positions[key]
-                        labeled_file.write(target_positions[key] + '\t1\n')
-                    else:
-                        non_matching_rows[key] = target_positions[key]
-                        labeled_file.write(target_positions[key] + '\t0\n')
-    except FileNotFoundError:
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate predicted splice sites against reference splice sites.")
+    parser.add_argument('target_file')
+    parser.add_argument('ref_file_path')
+    parser.add_argument('--no-row-files', action='store_true',
+                        help="Only print the metrics; do not write the per-category row files under out/.")
+    args = parser.parse_args()
+
+    target_file_path = args.target_file
+    ref_file_path = args.ref_file_path
+
+    # Check that the target file exists
+    if not os.path.exists(target_file_path):
         print(f"Error: Target file '{target_file_path}' not found.")
         sys.exit(1)
 
-    # Write results to output files
-    matching_count = 0
-    with open(matching_output_file, 'w') as match_file:
-        for row in matching_rows.values():
-            match_file.write(row + '\n')
-            matching_count += 1
-
-    non_matching_count = 0
-    with open(non_matching_output_file, 'w') as non_match_file:
-        for row in non_matching_rows.values():
-            non_match_file.write(row + '\n')
-            non_matching_count += 1
-
-    print("Reference file rows:", len(ref_positions))
-    print("Target file rows:", len(target_positions))
-    ref_only_positions = set(ref_positions.keys()) - set(target_positions.keys())
-    ref_only_rows = [ref_positions[pos] for pos in ref_only_positions]
-
-    ref_only_count = 0
-    with open(ref_only_output_file, 'w') as ref_only_file:
-        for row in ref_only_rows:
-            ref_only_file.write(row + '\n')
-            ref_only_count += 1
-
-    print(f"Matching rows written to: {matching_output_file} ({matching_count} rows)")
-    print(f"Non-matching rows written to: {non_matching_output_file} ({non_matching_count} rows)")
-    print(f"Reference-only rows written to: {ref_only_output_file} ({ref_only_count} rows)")
-    print(f"File with labeled rows written to: {labeled_output_file}")
+    # Check that the reference file exists
+    if not os.path.exists(ref_file_path):
+        print(f"Error: Reference file '{ref_file_path}' not found.")
+        sys.exit(1)
+
+    out = RowFiles(target_file_path, not args.no_row_files)
+    try:
+        n = evaluate_sorted(target_file_path, ref_file_path, out)
+    except NotSorted as e:
+        print(f"Note: {e}; reading both files into memory.", file=sys.stderr)
+        out.close()
+        out = RowFiles(target_file_path, not args.no_row_files)
+        n = evaluate_in_memory(target_file_path, ref_file_path, out)
+    finally:
+        out.close()
+
+    print("Reference file rows:", n['ref'])
+    print("Target file rows:", n['target'])
+    if not args.no_row_files:
+        print(f"Matching rows written to: {out.paths['matching_rows']} ({n['matching']} rows)")
+        print(f"Non-matching rows written to: {out.paths['non_matching_rows']} ({n['non_matching']} rows)")
+        print(f"Reference-only rows written to: {out.paths['ref_only_rows']} ({n['ref_only']} rows)")
+        print(f"File with labeled rows written to: {out.paths['with_labels']}")
 
     # Calculate metrics
-    TP = matching_count
-    FP = non_matching_count
-    FN = ref_only_count
+    TP = n['matching']
+    FP = n['non_matching']
+    FN = n['ref_only']
 
     precision = TP / (TP + FP) if (TP + FP) != 0 else 0.0
     recall = TP / (TP + FN) if (TP + FN) != 0 else 0.0
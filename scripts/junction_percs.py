@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+numpy port of process_junctions_perc.pl.
+
+For every junction of a sorted junction BED, computes
+  percsame  = count / max count of same-strand junctions overlapping it
+  percdiff  = count / max count of other-strand junctions overlapping it
+  percleft  = count / max same-strand count starting at the same position
+  percright = count / max same-strand count ending at the same position
+and prints the BED line with a "percs-percd-percl-percr" (4 decimals) column,
+exactly like the Perl script.
+
+Per chromosome and strand, the active maximum over every segment between
+consecutive boundaries is a range-max update on a flat segment tree, and
+the overlap maxima are range-max queries on a second one; both are
+evaluated level by level for all junctions at once, so time is
+O(n log n) and memory O(n) per chromosome however dense the locus.
+
+Usage: junction_percs.py <sorted_junctions.bed>
+"""
+import sys
+
+import numpy as np
+
+HEADER = '# track name=junctions type=bedDetail description="percsame-percdifferent-percleft-percright"'
+STRAND_CHARS = ('-', '+', '.')
+
+
+def strand_idx(s):
+    return 1 if s == '+' else 0 if s == '-' else 2  # 0:neg, 1:pos, 2:neutral
+
+
+def _build_sparse(arr):
+    """Sparse table for range-max queries over arr."""
+    n = len(arr)
+    st = [list(arr)]
+    k = 1
+    while (1 << k) <= n:
+        prev = st[-1]
+        half = 1 << (k - 1)
+        st.append([max(prev[i], prev[i + half]) for i in range(n - (1 << k) + 1)])
+        k += 1
+    return st
+
+
+def _rmq_max(st, l, r):
+    if l > r:
+        return 0
+    k = (r - l + 1).bit_length() - 1
+    a = st[k][l]
+    b = st[k][r - (1 << k) + 1]
+    return a if a > b else b
+
+
+def _recompute_max(freq):
+    m = 0
+    for k, v in freq.items():
+        if v > 0 and k > m:
+            m = k
+    return m
+
+
+def _tree_size(m):
+    return 1 << max(m - 1, 0).bit_length()
+
+
+def _segment_max(l, r, c, m):
+    """Max of c over the intervals [l, r] covering each of m segments (0 where none)."""
+    size = _tree_size(m)
+    t = np.zeros(2 * size, dtype=np.int64)
+    l = l + size
+    r = r + size + 1
+    keep = l < r
+    l, r, c = l[keep], r[keep], c[keep]
+    while l.size:
+        odd = (l & 1).astype(bool)
+        np.maximum.at(t, l[odd], c[odd])
+        l = l + odd
+        odd = (r & 1).astype(bool)
+        r = r - odd
+        np.maximum.at(t, r[odd], c[odd])
+        l >>= 1
+        r >>= 1
+        keep = l < r
+        l, r, c = l[keep], r[keep], c[keep]
+    lo = 2
+    while lo < 2 * size:
+        t[lo:2 * lo] = np.maximum(t[lo:2 * lo], np.repeat(t[lo >> 1:lo], 2))
+        lo <<= 1
+    return t[size:size + m]
+
+
+def _range_max(vals, l, r):
+    """max(vals[l[i]..r[i]]) for every i; 0 for empty ranges."""
+    size = _tree_size(vals.size)
+    t = np.zeros(2 * size, dtype=np.int64)
+    t[size:size + vals.size] = vals
+    lo = size >> 1
+    while lo >= 1:
+        t[lo:2 * lo] = np.maximum(t[2 * lo:4 * lo:2], t[2 * lo + 1:4 * lo:2])
+        lo >>= 1
+    out = np.zeros(l.size, dtype=np.int64)
+    l = l + size
+    r = r + size + 1
+    act = l < r
+    while act.any():
+        a = act & (l & 1).astype(bool)
+        out[a] = np.maximum(out[a], t[l[a]])
+        l = l + a
+        b = act & (r & 1).astype(bool)
+        r = r - b
+        out[b] = np.maximum(out[b], t[r[b]])
+        l >>= 1
+        r >>= 1
+        act = l < r
+    return out
+
+
+def _ratio(c, m):
+    """c / m as float64, 1.0 where m <= 0."""
+    return np.divide(c, m, out=np.ones(c.size), where=m > 0)
+
+
+def chrom_percs(starts, ends, counts, zs):
+    """
+    Compute (percs, percd, percl, percr) lists for the junctions of one
+    chromosome. Returns None when fewer than two distinct boundaries exist
+    (the Perl script emits nothing for such a chromosome).
+    """
+    s = np.asarray(starts, dtype=np.int64)
+    e = np.asarray(ends, dtype=np.int64)
+    if (s >= e).any():
+        # Zero-length/inverted records interleave ends before starts at one
+        # coordinate; only the sweep reproduces the Perl bookkeeping for those.
+        return _sweep_percs(starts, ends, counts, zs)
+    c = np.asarray(counts, dtype=np.int64)
+    z = np.asarray(zs, dtype=np.int64)
+    coords = np.unique(np.concatenate([s, e]))
+    if coords.size < 2:
+        return None
+    ls = np.searchsorted(coords, s)
+    le = np.searchsorted(coords, e)
+    re = le - 1
+
+    over = np.zeros((3, s.size), dtype=np.int64)  # max active count per strand over each junction
+    for k in range(3):
+        on = z == k
+        if on.any():
+            over[k] = _range_max(_segment_max(ls[on], re[on], c[on], coords.size - 1), ls, re)
+    cols = np.arange(s.size)
+    same_max = np.maximum(over[z, cols], c)  # include itself (safety)
+    over[z, cols] = 0
+    diff_max = over.max(axis=0)
+
+    start_max = np.zeros(3 * coords.size, dtype=np.int64)
+    np.maximum.at(start_max, 3 * ls + z, c)
+    end_max = np.zeros(3 * coords.size, dtype=np.int64)
+    np.maximum.at(end_max, 3 * le + z, c)
+
+    return (_ratio(c, same_max).tolist(), _ratio(c, diff_max).tolist(),
+            _ratio(c, start_max[3 * ls + z]).tolist(), _ratio(c, end_max[3 * le + z]).tolist())
+
+
+def _sweep_percs(starts, ends, counts, zs):
+    """Event sweep over per-strand count multisets, step for step as the Perl script."""
+    starts_at = {}
+    ends_at = {}
+    for s, e, c, z in zip(starts, ends, counts, zs):
+        starts_at.setdefault(s, []).append((z, c))
+        ends_at.setdefault(e, []).append((z, c))
+
+    coords = sorted(set(starts_at) | set(ends_at))
+    if len(coords) < 2:
+        return None
+    idx_of = {x: i for i, x in enumerate(coords)}
+
+    start_max = {}
+    for x, evs in starts_at.items():
+        m = [0, 0, 0]
+        for z, c in evs:
+            if c > m[z]:
+                m[z] = c
+        start_max[x] = m
+    end_max = {}
+    for x, evs in ends_at.items():
+        m = [0, 0, 0]
+        for z, c in evs:
+            if c > m[z]:
+                m[z] = c
+        end_max[x] = m
+
+    freq = [{}, {}, {}]
+    curmax = [0, 0, 0]
+
+    def drop_ends(x):
+        dirty = [False, False, False]
+        for z, c in ends_at.get(x, ()):
+            h = freq[z]
+            if c in h:
+                h[c] -= 1
+                if h[c] <= 0:
+                    del h[c]
+            if curmax[z] == c and c not in h:
+                dirty[z] = True
+        for z in range(3):
+            if dirty[z]:
+                curmax[z] = _recompute_max(freq[z])
+
+    def add_starts(x):
+        for z, c in starts_at.get(x, ()):
+            h = freq[z]
+            h[c] = h.get(c, 0) + 1
+            if c > curmax[z]:
+                curmax[z] = c
+
+    drop_ends(coords[0])
+    add_starts(coords[0])
+
+    seg_max = ([], [], [])
+    for x in coords[1:]:
+        for z in range(3):
+            seg_max[z].append(curmax[z])
+        drop_ends(x)
+        add_starts(x)
+
+    st = [_build_sparse(a) for a in seg_max]
+
+    ps, pd, pl, pr = [], [], [], []
+    for s, e, c, z in zip(starts, ends, counts, zs):
+        ls = idx_of[s]
+        re = idx_of[e] - 1
+        same_max = _rmq_max(st[z], ls, re)
+        o1, o2 = [_rmq_max(st[o], ls, re) for o in range(3) if o != z]
+        diff_max = o1 if o1 > o2 else o2
+
+        if same_max < c:
+            same_max = c  # include itself (safety)
+        ps.append(c / same_max if same_max > 0 else 1.0)
+        pd.append(c / diff_max if diff_max > 0 else 1.0)
+        m = start_max[s][z]
+        pl.append(c / m if m > 0 else 1.0)
+        m = end_max[e][z]
+        pr.append(c / m if m > 0 else 1.0)
+    return ps, pd, pl, pr
+
+
+def format_percs(ps, pd, pl, pr):
+    return f"{ps:.4f}-{pd:.4f}-{pl:.4f}-{pr:.4f}"
+
+
+def _flush(chrom, recs, out):
+    starts = [r[0] for r in recs]
+    ends = [r[1] for r in recs]
+    counts = [r[3] for r in recs]
+    zs = [strand_idx(r[4]) for r in recs]
+    res = chrom_percs(starts, ends, counts, zs)
+    if res is None:
+        return
+    for (s, e, name, c, _), z, a, b, l, r in zip(recs, zs, *res):
+        out.write(f"{chrom}\t{s}\t{e}\t{name}\t{c}\t{STRAND_CHARS[z]}\t{format_percs(a, b, l, r)}\n")
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} <sorted_junctions.bed>", file=sys.stderr)
+        sys.exit(1)
+
+    out = sys.stdout
+    printed_header = False
+    cur_chr = ''
+    buf = []
+    with open(sys.argv[1], 'r') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.startswith('track') or line.startswith('#'):
+                if not printed_header:
+                    out.write(HEADER + '\n')
+                    printed_header = True
+                continue
+            a = line.split('\t')
+            if len(a) < 6:
+                continue
+            chrom = a[0]
+            if cur_chr != '' and chrom != cur_chr:
+                _flush(cur_chr, buf, out)
+                buf = []
+            cur_chr = chrom
+            buf.append((int(a[1]), int(a[2]), a[3], int(a[4]), a[5]))
+
+    if buf:
+        if not printed_header:
+            out.write(HEADER + '\n')
+        _flush(cur_chr, buf, out)
+
+
+if __name__ == '__main__':
+    main()
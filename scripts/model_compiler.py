@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Ahead-of-time compile LightGBM model_output boosters into native code.
+
+Each tree of a binary LightGBM text model becomes a C function of nested
+comparisons (thresholds and leaf values as exact hex literals); the
+generated file is built into <model>.so next to the model. The scorers
+load it through CompiledBooster instead of lgb.Booster when it is present
+and was built from the same model text (sha256), which skips the lightgbm
+import and model parsing. Predictions are bit-for-bit those of
+Booster.predict: same zero/NaN handling per split, same tree-order double
+sum and the same libm exp in the sigmoid.
+
+Usage: model_compiler.py <model.txt|model_dir> [...]
+       (a directory compiles every *_lightgbm_model.txt in it)
+"""
+import ctypes
+import glob
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+# LightGBM's kZeroThreshold (a float literal widened to double)
+ZERO_THRESHOLD = float(np.float32(1e-35))
+CATEGORICAL_MASK = 1
+DEFAULT_LEFT_MASK = 2
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+
+
+def compiled_path(model_path):
+    root, ext = os.path.splitext(model_path)
+    return (root if ext == ".txt" else model_path) + ".so"
+
+
+def model_sha256(model_path):
+    h = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parse_model(model_path):
+    """(header dict, [tree dict, ...]) of a LightGBM text model; tree values stay strings."""
+    header, trees = {}, []
+    cur = header
+    with open(model_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("Tree="):
+                cur = {}
+                trees.append(cur)
+            elif line == "end of trees":
+                break
+            elif "=" in line:
+                k, v = line.split("=", 1)
+                cur[k] = v
+    return header, trees
+
+
+def _floats(tree, key):
+    return [float(v) for v in tree[key].split()]
+
+
+def _ints(tree, key):
+    return [int(v) for v in tree[key].split()]
+
+
+def _emit_tree(out, i, tree):
+    out.append(f"static double tree_{i}(const double *x) {{")
+    leaves = _floats(tree, "leaf_value")
+    if int(tree["num_leaves"]) <= 1:
+        out.append(f"  return {leaves[0].hex()};")
+        out.append("}")
+        return
+    if int(tree.get("num_cat", "0")) > 0:
+        raise ValueError(f"tree {i}: categorical splits are not supported")
+    feat = _ints(tree, "split_feature")
+    thr = _floats(tree, "threshold")
+    dtype = _ints(tree, "decision_type")
+    left = _ints(tree, "left_child")
+    right = _ints(tree, "right_child")
+
+    def emit(node, depth):
+        pad = "  " * depth
+        if node < 0:
+            out.append(f"{pad}return {leaves[~node].hex()};")
+            return
+        d = dtype[node]
+        if d & CATEGORICAL_MASK:
+            raise ValueError(f"tree {i}: categorical splits are not supported")
+        missing = (d >> 2) & 3
+        dl = 1 if d & DEFAULT_LEFT_MASK else 0
+        if missing == MISSING_ZERO:
+            test = f"go_left_zero(x[{feat[node]}], {thr[node].hex()}, {dl})"
+        elif missing == MISSING_NAN:
+            test = f"go_left_nan(x[{feat[node]}], {thr[node].hex()}, {dl})"
+        else:
+            test = f"go_left(x[{feat[node]}], {thr[node].hex()})"
+        out.append(f"{pad}if ({test}) {{")
+        emit(left[node], depth + 1)
+        out.append(f"{pad}}} else {{")
+        emit(right[node], depth + 1)
+        out.append(f"{pad}}}")
+
+    emit(0, 1)
+    out.append("}")
+
+
+def generate_c(model_path):
+    """C source of the predictor for a binary LightGBM text model."""
+    header, trees = parse_model(model_path)
+    objective = header.get("objective", "").split()
+    if not objective or objective[0] != "binary" or header.get("num_tree_per_iteration", "1") != "1":
+        raise ValueError(f"{model_path}: only binary single-output models can be compiled")
+    sigmoid = 1.0
+    for tok in objective[1:]:
+        if tok.startswith("sigmoid:"):
+            sigmoid = float(tok.split(":", 1)[1])
+    nfeat = int(header["max_feature_idx"]) + 1
+
+    out = [
+        f"/* Generated by model_compiler.py from {os.path.basename(model_path)}; do not edit. */",
+        "#include <math.h>",
+        "",
+        f"#define NFEAT {nfeat}",
+        f"#define ZERO_THRESHOLD {ZERO_THRESHOLD.hex()}",
+        "",
+        f'const char *splicecov_model_sha256(void) {{ return "{model_sha256(model_path)}"; }}',
+        f"const long splicecov_model_trees = {len(trees)};",
+        "const long splicecov_model_features = NFEAT;",
+        "",
+        "static inline int go_left(double v, double t) {",
+        "  if (isnan(v)) v = 0.0;",
+        "  return v <= t;",
+        "}",
+        "static inline int go_left_zero(double v, double t, int default_left) {",
+        "  if (isnan(v)) v = 0.0;",
+        "  if (v >= -ZERO_THRESHOLD && v <= ZERO_THRESHOLD) return default_left;",
+        "  return v <= t;",
+        "}",
+        "static inline int go_left_nan(double v, double t, int default_left) {",
+        "  if (isnan(v)) return default_left;",
+        "  return v <= t;",
+        "}",
+        "",
+    ]
+    for i, tree in enumerate(trees):
+        _emit_tree(out, i, tree)
+    out.append("")
+    out.append("static double (*const TREES[])(const double *) = {")
+    out.extend(f"  tree_{i}," for i in range(len(trees)))
+    out.append("};")
+    out += [
+        "",
+        "/* Probabilities of nrows x NFEAT row-major rows, using the first ntrees trees. */",
+        "void splicecov_predict(const double *X, long nrows, long ntrees, double *out) {",
+        "  long i;",
+        "#pragma omp parallel for schedule(static)",
+        "  for (i = 0; i < nrows; i++) {",
+        "    double x[NFEAT];",
+        "    double raw = 0.0;",
+        "    long f, t;",
+        "    for (f = 0; f < NFEAT; f++) {",
+        "      double v = X[i * NFEAT + f];",
+        "      /* dense rows drop |v| <= kZeroThreshold, as LightGBM does */",
+        "      x[f] = (fabs(v) > ZERO_THRESHOLD || isnan(v)) ? v : 0.0;",
+        "    }",
+        "    for (t = 0; t < ntrees; t++) raw += TREES[t](x);",
+        f"    out[i] = 1.0 / (1.0 + exp(-{sigmoid.hex()} * raw));",
+        "  }",
+        "}",
+        "",
+    ]
+    return "\n".join(out)
+
+
+def compile_model(model_path, out_path=None, cc=None):
+    """Generate and build the predictor for model_path; returns the .so path."""
+    out_path = out_path or compiled_path(model_path)
+    cc = cc or os.environ.get("CC") or "cc"
+    if shutil.which(cc) is None:
+        raise RuntimeError(f"C compiler '{cc}' not found")
+    tmpdir = tempfile.mkdtemp(prefix="splicecov-model-")
+    try:
+        src = os.path.join(tmpdir, "model.c")
+        with open(src, "w") as f:
+            f.write(generate_c(model_path))
+        tmp_so = os.path.join(tmpdir, "model.so")
+        base = [cc, "-O2", "-fPIC", "-shared", "-ffp-contract=off", "-o", tmp_so, src, "-lm"]
+        # OpenMP only parallelizes over rows; fall back to a serial build without it
+        res = subprocess.run(base[:1] + ["-fopenmp"] + base[1:], capture_output=True, text=True)
+        if res.returncode != 0:
+            res = subprocess.run(base, capture_output=True, text=True)
+        if res.returncode != 0:
+            raise RuntimeError(f"compiling {model_path} failed:\n{res.stderr}")
+        shutil.move(tmp_so, out_path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return out_path
+
+
+class CompiledBooster:
+    """lgb.Booster stand-in (predict/best_iteration) backed by a compiled model."""
+
+    def __init__(self, so_path):
+        self.lib = ctypes.CDLL(os.path.abspath(so_path))
+        self.lib.splicecov_predict.argtypes = [ctypes.c_void_p, ctypes.c_long, ctypes.c_long, ctypes.c_void_p]
+        self.lib.splicecov_predict.restype = None
+        self.lib.splicecov_model_sha256.restype = ctypes.c_char_p
+        self.sha256 = self.lib.splicecov_model_sha256().decode()
+        self.num_trees = ctypes.c_long.in_dll(self.lib, "splicecov_model_trees").value
+        self.num_features = ctypes.c_long.in_dll(self.lib, "splicecov_model_features").value
+        self.best_iteration = -1  # as lgb.Booster loaded from a model file
+
+    def predict(self, X, num_iteration=None):
+        data = np.ascontiguousarray(np.asarray(X, dtype=np.float64))
+        if data.ndim != 2 or data.shape[1] != self.num_features:
+            raise ValueError(f"The number of features in data ({data.shape[-1]}) is not the same "
+                             f"as it was in training data ({self.num_features}).")
+        ntrees = self.num_trees
+        if num_iteration is not None and num_iteration > 0:
+            ntrees = min(num_iteration, ntrees)
+        out = np.empty(data.shape[0], dtype=np.float64)
+        if data.shape[0]:
+            self.lib.splicecov_predict(data.ctypes.data, data.shape[0], ntrees, out.ctypes.data)
+        return out
+
+
+def load_compiled(model_path):
+    """CompiledBooster for model_path if its .so exists and was built from this model text, else None."""
+    so_path = compiled_path(model_path)
+    if not os.path.exists(so_path) or not os.path.exists(model_path):
+        return None
+    try:
+        booster = CompiledBooster(so_path)
+    except OSError:
+        return None
+    return booster if booster.sha256 == model_sha256(model_path) else None
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} <model.txt|model_dir> [...]", file=sys.stderr)
+        sys.exit(1)
+    models = []
+    for arg in sys.argv[1:]:
+        models += sorted(glob.glob(os.path.join(arg, "*_lightgbm_model.txt"))) if os.path.isdir(arg) else [arg]
+    if not models:
+        print("No models to compile.", file=sys.stderr)
+        sys.exit(1)
+    for model in models:
+        try:
+            out = compile_model(model)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Compiled {model} -> {out}")
+
+
+if __name__ == "__main__":
+    main()
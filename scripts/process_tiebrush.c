@@ -1,7 +1,16 @@
+#define _POSIX_C_SOURCE 200809L
+
+#include <fcntl.h>
+#include <pthread.h>
+#include <stdarg.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 #include <math.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <zlib.h>
 
 // Global parameters
 static double lowcov = 10;
@@ -21,13 +30,13 @@ typedef struct {
     double cov;
 } CovgEntry;
 
+// 24 bytes; the chromosome is an index into the reader's ChromTable
 typedef struct {
-    char chrname[256];
     int start;
     int end;
     double cov;
+    int chrom;
     char strand;
-    double ps;
 } JuncEntry;
 
 typedef struct {
@@ -39,7 +48,7 @@ typedef struct {
 typedef struct {
     char type[8];  // "tstart", "tend", "jstart", "jend"
     int pos;
-    int *indices;
+    int first;  // indices are rec_idx[first .. first + num_indices) of the bundle
     int num_indices;
     double change_perc;
     double pos_cov;
@@ -53,186 +62,538 @@ typedef struct {
     int active;
 } TmpEntry;
 
-// Dynamic arrays
-static CovgEntry *covg = NULL;
-static int covg_size = 0;
-static int covg_cap = 0;
+// Line input. Plain files are mapped into memory; compressed files and
+// stdin are read through zlib in large blocks. Lines are handed out as
+// [start, end) ranges without the newline and are not NUL-terminated.
+typedef struct {
+    gzFile gz;
+    char *map;
+    size_t map_len;
+    char *buf;
+    size_t buf_cap;
+    size_t pos;
+    size_t len;
+    int eof;
+} LineReader;
+
+#define READ_BLOCK (1 << 20)
+
+static LineReader *open_lines(const char *path) {
+    LineReader *lr = calloc(1, sizeof(LineReader));
+    if (strcmp(path, "-") != 0) {
+        int fd = open(path, O_RDONLY);
+        if (fd < 0) {
+            free(lr);
+            return NULL;
+        }
+        struct stat st;
+        unsigned char magic[2] = {0, 0};
+        if (fstat(fd, &st) == 0 && S_ISREG(st.st_mode) && st.st_size > 0 &&
+            pread(fd, magic, 2, 0) == 2 && !(magic[0] == 0x1f && magic[1] == 0x8b)) {
+            void *m = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+            if (m != MAP_FAILED) {
+                posix_madvise(m, st.st_size, POSIX_MADV_SEQUENTIAL);
+                close(fd);
+                lr->map = m;
+                lr->map_len = st.st_size;
+                lr->buf = m;
+                lr->len = st.st_size;
+                lr->eof = 1;
+                return lr;
+            }
+        }
+        lr->gz = gzdopen(fd, "r");
+        if (!lr->gz) close(fd);
+    } else {
+        lr->gz = gzdopen(STDIN_FILENO, "r");
+    }
+    if (!lr->gz) {
+        free(lr);
+        return NULL;
+    }
+    gzbuffer(lr->gz, 1 << 17);
+    lr->buf_cap = 2 * READ_BLOCK;
+    lr->buf = malloc(lr->buf_cap);
+    return lr;
+}
+
+// Next line as [*line, *line_end); 0 at end of input
+static int next_line(LineReader *lr, const char **line, const char **line_end) {
+    for (;;) {
+        char *p = lr->buf + lr->pos;
+        char *nl = memchr(p, '\n', lr->len - lr->pos);
+        if (nl) {
+            *line = p;
+            *line_end = nl;
+            lr->pos = nl - lr->buf + 1;
+            return 1;
+        }
+        if (lr->eof) {
+            if (lr->pos == lr->len) return 0;
+            *line = p;
+            *line_end = lr->buf + lr->len;
+            lr->pos = lr->len;
+            return 1;
+        }
+        // Keep the partial line and read the next block behind it
+        size_t rest = lr->len - lr->pos;
+        memmove(lr->buf, p, rest);
+        lr->pos = 0;
+        lr->len = rest;
+        if (lr->buf_cap - rest < READ_BLOCK) {
+            lr->buf_cap = 2 * (rest + READ_BLOCK);
+            lr->buf = realloc(lr->buf, lr->buf_cap);
+        }
+        int n = gzread(lr->gz, lr->buf + rest, READ_BLOCK);
+        if (n <= 0) {
+            lr->eof = 1;
+        } else {
+            lr->len += n;
+        }
+    }
+}
+
+static void close_lines(LineReader *lr) {
+    if (lr->map) {
+        munmap(lr->map, lr->map_len);
+    } else {
+        gzclose(lr->gz);
+        free(lr->buf);
+    }
+    free(lr);
+}
+
+// Field parsers with the semantics of the sscanf conversions they replace:
+// whitespace before a field is skipped, %Ns stops after N characters.
+static int is_space(char c) {
+    return c == ' ' || c == '\t' || c == '\n' || c == '\r' || c == '\v' || c == '\f';
+}
+
+static const char *skip_space(const char *p, const char *end) {
+    while (p < end && is_space(*p)) p++;
+    return p;
+}
+
+static int parse_string(const char **pp, const char *end, char *dst, int maxlen) {
+    const char *p = skip_space(*pp, end);
+    int n = 0;
+    while (p < end && !is_space(*p) && n < maxlen) dst[n++] = *p++;
+    dst[n] = '\0';
+    *pp = p;
+    return n > 0;
+}
 
-static JuncEntry *junc = NULL;
-static int junc_size = 0;
-static int junc_cap = 0;
+static int parse_int(const char **pp, const char *end, int *out) {
+    const char *p = skip_space(*pp, end);
+    int neg = 0;
+    if (p < end && (*p == '-' || *p == '+')) neg = *p++ == '-';
+    const char *digits = p;
+    long long v = 0;
+    while (p < end && *p >= '0' && *p <= '9') {
+        if (v < 1000000000000LL) v = v * 10 + (*p - '0');
+        p++;
+    }
+    if (p == digits) return 0;
+    *out = (int)(neg ? -v : v);
+    *pp = p;
+    return 1;
+}
 
-static JuncEntry *unprocjunc = NULL;
-static int unprocjunc_size = 0;
-static int unprocjunc_cap = 0;
+static const double POW10[] = {1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10,
+                               1e11, 1e12, 1e13, 1e14, 1e15};
 
-static DropEntry *drop_arr = NULL;
-static int drop_size = 0;
-static int drop_cap = 0;
+// Plain decimals of up to 15 digits are exact integers divided by an exact
+// power of ten, which IEEE division rounds just like strtod; anything else
+// (exponents, long mantissas, inf/nan, hex) goes through strtod.
+static int parse_double(const char **pp, const char *end, double *out) {
+    const char *p = skip_space(*pp, end);
+    const char *s = p;
+    int neg = 0;
+    if (p < end && (*p == '-' || *p == '+')) neg = *p++ == '-';
+    long long m = 0;
+    int ndig = 0;
+    int nfrac = 0;
+    while (p < end && *p >= '0' && *p <= '9') {
+        m = m * 10 + (*p++ - '0');
+        ndig++;
+        if (ndig > 15) break;
+    }
+    if (ndig <= 15 && p < end && *p == '.') {
+        p++;
+        while (p < end && *p >= '0' && *p <= '9') {
+            m = m * 10 + (*p++ - '0');
+            ndig++;
+            nfrac++;
+            if (ndig > 15) break;
+        }
+    }
+    int simple = ndig > 0 && ndig <= 15 &&
+                 !(p < end && ((*p >= '0' && *p <= '9') || *p == '.' || *p == 'e' || *p == 'E' ||
+                               *p == 'x' || *p == 'X'));
+    if (simple) {
+        double v = (double)m;
+        if (nfrac) v /= POW10[nfrac];
+        *out = neg ? -v : v;
+        *pp = p;
+        return 1;
+    }
+    char tmp[128];
+    int n = 0;
+    while (s + n < end && !is_space(s[n]) && n < (int)sizeof(tmp) - 1) {
+        tmp[n] = s[n];
+        n++;
+    }
+    tmp[n] = '\0';
+    char *stop;
+    double v = strtod(tmp, &stop);
+    if (stop == tmp) return 0;
+    *out = v;
+    *pp = s + (stop - tmp);
+    return 1;
+}
 
-static RecordEntry *record = NULL;
-static int record_size = 0;
-static int record_cap = 0;
+// bedGraph: chrom start end value
+static int parse_cov_line(const char *p, const char *end, char *chrname, int *start, int *stop, double *cov) {
+    return parse_string(&p, end, chrname, 255) && parse_int(&p, end, start) &&
+           parse_int(&p, end, stop) && parse_double(&p, end, cov);
+}
 
-static int *jend = NULL;
-static int jend_size = 0;
+// Processed junctions: chrom start end name cov strand ps-po-pl-pr
+static int parse_junc_line(const char *p, const char *end, char *chrname, int *start, int *stop, double *cov,
+                           char *strand, double *ps, double *po, double *pl, double *pr) {
+    char name[256];
+    char strand_str[8];
+    char percs[256];
+    if (!(parse_string(&p, end, chrname, 255) && parse_int(&p, end, start) && parse_int(&p, end, stop) &&
+          parse_string(&p, end, name, 255) && parse_double(&p, end, cov) &&
+          parse_string(&p, end, strand_str, 7) && parse_string(&p, end, percs, 255))) {
+        return 0;
+    }
+    *strand = strand_str[0];
+    const char *q = percs;
+    const char *qend = percs + strlen(percs);
+    return parse_double(&q, qend, ps) && q < qend && *q++ == '-' &&
+           parse_double(&q, qend, po) && q < qend && *q++ == '-' &&
+           parse_double(&q, qend, pl) && q < qend && *q++ == '-' &&
+           parse_double(&q, qend, pr);
+}
+
+// Everything one bundle needs: its coverage and junctions as read, the
+// working arrays of the TSS/TES search and its printed output. Bundles are
+// independent of each other, so each one can be processed on its own thread.
+typedef struct {
+    char chr[256];
+
+    CovgEntry *covg;
+    int covg_size;
+    int covg_cap;
+
+    JuncEntry *junc;
+    int junc_size;
+    int junc_cap;
+
+    DropEntry *drop_arr;
+    int drop_size;
+    int drop_cap;
+
+    RecordEntry *record;
+    int record_size;
+    int record_cap;
+    int *rec_idx;  // junction/drop indices of all records, one slice per record
+    int rec_idx_size;
+    int rec_idx_cap;
+
+    int *jend;
+    int jend_size;
+    int jend_cap;
+
+    // Scratch of the changepoint scan (get_drop), reused from bundle to bundle
+    double *scan_c;
+    double *scan_as;
+    double *scan_ae;
+    int *scan_blk;
+    size_t scan_cap;
+    int *jp;
+    int jp_cap;
+    TmpEntry *tmps;
+    int tmps_cap;
+    TmpEntry *tmpe;
+    int tmpe_cap;
+
+    // Output; bundle numbers are filled in when it is written (see write_bundle)
+    char *out;
+    size_t out_len;
+    size_t out_cap;
+    size_t *numpos;  // offsets in out where a bundle number goes
+    int num_size;
+    int num_cap;
+} Bundle;
+
+// Chromosome names interned to small integer IDs
+typedef struct {
+    char **names;
+    int size;
+    int cap;
+    int *slots;  // open-addressing hash of names, -1 when empty
+    int nslots;
+    int last;    // ID returned by the previous lookup
+} ChromTable;
+
+// Reader state carried from one bundle to the next. unprocjunc holds the
+// junctions read past the current bundle; [unprocjunc_head, unprocjunc_size)
+// are still pending.
+typedef struct {
+    LineReader *fJ;
+    ChromTable chroms;
+    JuncEntry *unprocjunc;
+    int unprocjunc_head;
+    int unprocjunc_size;
+    int unprocjunc_cap;
+} Reader;
 
 // Function prototypes
-static void push_covg(int start, int end, double cov);
-static void push_junc(JuncEntry *arr, int *size, int *cap, const char *chrname, int start, int end, double cov, char strand, double ps);
-static void push_drop(int pos, double perc, double covdiff);
-static void push_record(const char *type, int pos, int *indices, int num_indices, double change_perc, double pos_cov, double cov_to_next);
-static void clear_covg(void);
-static void clear_junc(void);
-static void clear_drop(void);
-static void clear_record(void);
-static void clear_unprocjunc(void);
-
-static int process_bundle(const char *chr, int bundleno);
-static int process_records(const char *chr, int bundleno);
-static int print_small_bundle(const char *chr, int bundleno, int s, int e);
-static double get_next_cov(int i, int e);
-static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb, int nd, int nj, const char *chr);
+static void push_covg(Bundle *ctx, int start, int end, double cov);
+static void push_junc(JuncEntry **arr, int *size, int *cap, const JuncEntry *j);
+static void push_drop(Bundle *ctx, int pos, double perc, double covdiff);
+static void push_record(Bundle *ctx, const char *type, int pos, int *indices, int num_indices, double change_perc, double pos_cov, double cov_to_next);
+static void clear_covg(Bundle *ctx);
+static void clear_junc(Bundle *ctx);
+static void clear_drop(Bundle *ctx);
+static void clear_record(Bundle *ctx);
+
+static int process_bundle(Bundle *ctx, const char *chr, int bundleno);
+static int process_records(Bundle *ctx, const char *chr, int bundleno);
+static int print_small_bundle(Bundle *ctx, const char *chr, int bundleno, int s, int e);
+static double get_next_cov(const Bundle *ctx, int i, int e);
+static void get_record(Bundle *ctx, int *ib, int *id, int *js, int *je, int *prevpos, int nb, int nd, int nj, const char *chr);
 static int less_than(int n1, int n2);
-static void get_drop(int si, int se, int nb, int *js_out, int *je_out, int js, int je, int nj);
-static void compute_perc(int l, int r, int i, double *cov, double *adjs, double *adje, double *percl, double *percr, double *avgl, double *avgr);
-static double get_cov(int start, int end, int *si, int nb);
-static int add_procjunc_to_bundle(int *bundleend, const char *chr);
-static int add_junc_to_bundle(const char *chr, int bundleend, FILE *fJ);
-static void process_junctions(int nj);
+static void get_drop(Bundle *ctx, int si, int se, int nb, int *js_out, int *je_out, int js, int je, int nj);
+static double get_cov(const Bundle *ctx, int start, int end, int *si, int nb);
+static int add_procjunc_to_bundle(Reader *rd, Bundle *ctx, int *bundleend, int chrom);
+static int add_junc_to_bundle(Reader *rd, Bundle *ctx, int chrom, int bundleend);
+static void process_junctions(Bundle *ctx, int nj);
 static int equal_strand(char s1, char s2);
-static void sort_jend(int nj);
+static void sort_jend(Bundle *ctx, int nj);
 static int compare_jend(const void *a, const void *b);
 
 // Helper functions for dynamic arrays
-static void push_covg(int start, int end, double cov) {
-    if (covg_size >= covg_cap) {
-        covg_cap = covg_cap ? covg_cap * 2 : 1024;
-        covg = realloc(covg, covg_cap * sizeof(CovgEntry));
-    }
-    covg[covg_size].start = start;
-    covg[covg_size].end = end;
-    covg[covg_size].cov = cov;
-    covg_size++;
+static void push_covg(Bundle *ctx, int start, int end, double cov) {
+    if (ctx->covg_size >= ctx->covg_cap) {
+        ctx->covg_cap = ctx->covg_cap ? ctx->covg_cap * 2 : 1024;
+        ctx->covg = realloc(ctx->covg, ctx->covg_cap * sizeof(CovgEntry));
+    }
+    ctx->covg[ctx->covg_size].start = start;
+    ctx->covg[ctx->covg_size].end = end;
+    ctx->covg[ctx->covg_size].cov = cov;
+    ctx->covg_size++;
 }
 
-static void push_junc(JuncEntry *arr, int *size, int *cap, const char *chrname, int start, int end, double cov, char strand, double ps) {
+static void push_junc(JuncEntry **arr, int *size, int *cap, const JuncEntry *j) {
     if (*size >= *cap) {
         *cap = *cap ? *cap * 2 : 1024;
-        if (arr == junc) {
-            junc = realloc(junc, *cap * sizeof(JuncEntry));
-            arr = junc;
-        } else {
-            unprocjunc = realloc(unprocjunc, *cap * sizeof(JuncEntry));
-            arr = unprocjunc;
+        *arr = realloc(*arr, *cap * sizeof(JuncEntry));
+    }
+    (*arr)[(*size)++] = *j;
+}
+
+static unsigned hash_name(const char *name) {
+    unsigned h = 2166136261u;
+    for (const unsigned char *p = (const unsigned char *)name; *p; p++) {
+        h = (h ^ *p) * 16777619u;
+    }
+    return h;
+}
+
+// ID of a chromosome name, adding it on first sight
+static int intern_chrom(ChromTable *t, const char *name) {
+    if (t->size > 0 && strcmp(t->names[t->last], name) == 0) return t->last;
+    if (2 * (t->size + 1) > t->nslots) {
+        int nslots = t->nslots ? 2 * t->nslots : 64;
+        int *slots = malloc(nslots * sizeof(int));
+        for (int i = 0; i < nslots; i++) slots[i] = -1;
+        for (int id = 0; id < t->size; id++) {
+            unsigned h = hash_name(t->names[id]) & (nslots - 1);
+            while (slots[h] >= 0) h = (h + 1) & (nslots - 1);
+            slots[h] = id;
         }
+        free(t->slots);
+        t->slots = slots;
+        t->nslots = nslots;
     }
-    strncpy(arr[*size].chrname, chrname, 255);
-    arr[*size].chrname[255] = '\0';
-    arr[*size].start = start;
-    arr[*size].end = end;
-    arr[*size].cov = cov;
-    arr[*size].strand = strand;
-    arr[*size].ps = ps;
-    (*size)++;
+    unsigned h = hash_name(name) & (t->nslots - 1);
+    while (t->slots[h] >= 0) {
+        if (strcmp(t->names[t->slots[h]], name) == 0) return t->last = t->slots[h];
+        h = (h + 1) & (t->nslots - 1);
+    }
+    if (t->size >= t->cap) {
+        t->cap = t->cap ? t->cap * 2 : 64;
+        t->names = realloc(t->names, t->cap * sizeof(char *));
+    }
+    t->names[t->size] = strdup(name);
+    t->slots[h] = t->size;
+    return t->last = t->size++;
 }
 
-static void push_junc_main(const char *chrname, int start, int end, double cov, char strand, double ps) {
-    if (junc_size >= junc_cap) {
-        junc_cap = junc_cap ? junc_cap * 2 : 1024;
-        junc = realloc(junc, junc_cap * sizeof(JuncEntry));
-    }
-    strncpy(junc[junc_size].chrname, chrname, 255);
-    junc[junc_size].chrname[255] = '\0';
-    junc[junc_size].start = start;
-    junc[junc_size].end = end;
-    junc[junc_size].cov = cov;
-    junc[junc_size].strand = strand;
-    junc[junc_size].ps = ps;
-    junc_size++;
+// Coverage and junctions both come sorted by chromosome name (LC_ALL=C
+// byte order); a junction on a chromosome before the current coverage
+// chromosome can no longer join a bundle and must not hold up the stream
+static int chrom_passed(const ChromTable *t, int jchrom, int chrom) {
+    return jchrom != chrom && strcmp(t->names[jchrom], t->names[chrom]) < 0;
 }
 
-static void push_unprocjunc(const char *chrname, int start, int end, double cov, char strand, double ps) {
-    if (unprocjunc_size >= unprocjunc_cap) {
-        unprocjunc_cap = unprocjunc_cap ? unprocjunc_cap * 2 : 1024;
-        unprocjunc = realloc(unprocjunc, unprocjunc_cap * sizeof(JuncEntry));
-    }
-    strncpy(unprocjunc[unprocjunc_size].chrname, chrname, 255);
-    unprocjunc[unprocjunc_size].chrname[255] = '\0';
-    unprocjunc[unprocjunc_size].start = start;
-    unprocjunc[unprocjunc_size].end = end;
-    unprocjunc[unprocjunc_size].cov = cov;
-    unprocjunc[unprocjunc_size].strand = strand;
-    unprocjunc[unprocjunc_size].ps = ps;
-    unprocjunc_size++;
+static void free_chroms(ChromTable *t) {
+    for (int i = 0; i < t->size; i++) {
+        free(t->names[i]);
+    }
+    free(t->names);
+    free(t->slots);
 }
 
-static void push_drop(int pos, double perc, double covdiff) {
-    if (drop_size >= drop_cap) {
-        drop_cap = drop_cap ? drop_cap * 2 : 1024;
-        drop_arr = realloc(drop_arr, drop_cap * sizeof(DropEntry));
+static void push_drop(Bundle *ctx, int pos, double perc, double covdiff) {
+    if (ctx->drop_size >= ctx->drop_cap) {
+        ctx->drop_cap = ctx->drop_cap ? ctx->drop_cap * 2 : 1024;
+        ctx->drop_arr = realloc(ctx->drop_arr, ctx->drop_cap * sizeof(DropEntry));
     }
-    drop_arr[drop_size].pos = pos;
-    drop_arr[drop_size].perc = perc;
-    drop_arr[drop_size].covdiff = covdiff;
-    drop_size++;
+    ctx->drop_arr[ctx->drop_size].pos = pos;
+    ctx->drop_arr[ctx->drop_size].perc = perc;
+    ctx->drop_arr[ctx->drop_size].covdiff = covdiff;
+    ctx->drop_size++;
 }
 
-static void push_record(const char *type, int pos, int *indices, int num_indices, double change_perc, double pos_cov, double cov_to_next) {
-    if (record_size >= record_cap) {
-        record_cap = record_cap ? record_cap * 2 : 1024;
-        record = realloc(record, record_cap * sizeof(RecordEntry));
-    }
-    strncpy(record[record_size].type, type, 7);
-    record[record_size].type[7] = '\0';
-    record[record_size].pos = pos;
-    record[record_size].indices = malloc(num_indices * sizeof(int));
-    memcpy(record[record_size].indices, indices, num_indices * sizeof(int));
-    record[record_size].num_indices = num_indices;
-    record[record_size].change_perc = change_perc;
-    record[record_size].pos_cov = pos_cov;
-    record[record_size].cov_to_next = cov_to_next;
-    record_size++;
+static void push_record(Bundle *ctx, const char *type, int pos, int *indices, int num_indices, double change_perc, double pos_cov, double cov_to_next) {
+    if (ctx->record_size >= ctx->record_cap) {
+        ctx->record_cap = ctx->record_cap ? ctx->record_cap * 2 : 1024;
+        ctx->record = realloc(ctx->record, ctx->record_cap * sizeof(RecordEntry));
+    }
+    RecordEntry *r = &ctx->record[ctx->record_size];
+    strncpy(r->type, type, 7);
+    r->type[7] = '\0';
+    r->pos = pos;
+    if (ctx->rec_idx_size + num_indices > ctx->rec_idx_cap) {
+        while (ctx->rec_idx_size + num_indices > ctx->rec_idx_cap) {
+            ctx->rec_idx_cap = ctx->rec_idx_cap ? ctx->rec_idx_cap * 2 : 1024;
+        }
+        ctx->rec_idx = realloc(ctx->rec_idx, ctx->rec_idx_cap * sizeof(int));
+    }
+    memcpy(ctx->rec_idx + ctx->rec_idx_size, indices, num_indices * sizeof(int));
+    r->first = ctx->rec_idx_size;
+    r->num_indices = num_indices;
+    ctx->rec_idx_size += num_indices;
+    r->change_perc = change_perc;
+    r->pos_cov = pos_cov;
+    r->cov_to_next = cov_to_next;
+    ctx->record_size++;
 }
 
-static void clear_covg(void) {
-    covg_size = 0;
+// Indices of record i; valid until the next push_record
+static inline int *record_indices(const Bundle *ctx, int i) {
+    return ctx->rec_idx + ctx->record[i].first;
 }
 
-static void clear_junc(void) {
-    junc_size = 0;
+// Output buffer of a bundle
+static void out_printf(Bundle *ctx, const char *fmt, ...) {
+    va_list ap;
+    va_start(ap, fmt);
+    int n = vsnprintf(ctx->out + ctx->out_len, ctx->out_cap - ctx->out_len, fmt, ap);
+    va_end(ap);
+    if (ctx->out_len + n >= ctx->out_cap) {
+        while (ctx->out_len + n >= ctx->out_cap) {
+            ctx->out_cap = ctx->out_cap ? ctx->out_cap * 2 : 1 << 16;
+        }
+        ctx->out = realloc(ctx->out, ctx->out_cap);
+        va_start(ap, fmt);
+        vsnprintf(ctx->out + ctx->out_len, ctx->out_cap - ctx->out_len, fmt, ap);
+        va_end(ap);
+    }
+    ctx->out_len += n;
 }
 
-static void clear_drop(void) {
-    drop_size = 0;
+static void mark_bundleno(Bundle *ctx) {
+    if (ctx->num_size >= ctx->num_cap) {
+        ctx->num_cap = ctx->num_cap ? ctx->num_cap * 2 : 64;
+        ctx->numpos = realloc(ctx->numpos, ctx->num_cap * sizeof(size_t));
+    }
+    ctx->numpos[ctx->num_size++] = ctx->out_len;
 }
 
-static void clear_record(void) {
-    for (int i = 0; i < record_size; i++) {
-        free(record[i].indices);
+// Print a processed bundle, numbering its small bundles from *bundleno on
+static void write_bundle(Bundle *ctx, int *bundleno, FILE *f) {
+    if (ctx->out_len == 0) return;
+    size_t pos = 0;
+    for (int i = 0; i < ctx->num_size; i++) {
+        fwrite(ctx->out + pos, 1, ctx->numpos[i] - pos, f);
+        fprintf(f, "%d", (*bundleno)++);
+        pos = ctx->numpos[i];
     }
-    record_size = 0;
+    fwrite(ctx->out + pos, 1, ctx->out_len - pos, f);
+    ctx->out_len = 0;
+    ctx->num_size = 0;
+}
+
+static void free_bundle(Bundle *ctx) {
+    free(ctx->covg);
+    free(ctx->junc);
+    free(ctx->drop_arr);
+    free(ctx->record);
+    free(ctx->rec_idx);
+    free(ctx->jend);
+    free(ctx->scan_c);
+    free(ctx->scan_as);
+    free(ctx->scan_ae);
+    free(ctx->scan_blk);
+    free(ctx->jp);
+    free(ctx->tmps);
+    free(ctx->tmpe);
+    free(ctx->out);
+    free(ctx->numpos);
 }
 
-static void clear_unprocjunc(void) {
-    unprocjunc_size = 0;
+static void clear_covg(Bundle *ctx) {
+    ctx->covg_size = 0;
 }
 
-// Comparison function for sorting jend
+static void clear_junc(Bundle *ctx) {
+    ctx->junc_size = 0;
+}
+
+static void clear_drop(Bundle *ctx) {
+    ctx->drop_size = 0;
+}
+
+static void clear_record(Bundle *ctx) {
+    ctx->record_size = 0;
+    ctx->rec_idx_size = 0;
+}
+
+// Order junctions by end; ties keep input order so the output does not depend on the qsort
+typedef struct {
+    int end;
+    int idx;
+} JendKey;
+
 static int compare_jend(const void *a, const void *b) {
-    int ia = *(const int *)a;
-    int ib = *(const int *)b;
-    return junc[ia].end - junc[ib].end;
+    const JendKey *ka = a;
+    const JendKey *kb = b;
+    if (ka->end != kb->end) return ka->end < kb->end ? -1 : 1;
+    return ka->idx - kb->idx;
 }
 
-static void sort_jend(int nj) {
-    if (jend) free(jend);
-    jend = malloc(nj * sizeof(int));
-    jend_size = nj;
+static void sort_jend(Bundle *ctx, int nj) {
+    if (nj > ctx->jend_cap) {
+        ctx->jend_cap = nj;
+        ctx->jend = realloc(ctx->jend, nj * sizeof(int));
+    }
+    ctx->jend_size = nj;
+    JendKey *keys = malloc((nj ? nj : 1) * sizeof(JendKey));
     for (int i = 0; i < nj; i++) {
-        jend[i] = i;
+        keys[i].end = ctx->junc[i].end;
+        keys[i].idx = i;
     }
-    qsort(jend, nj, sizeof(int), compare_jend);
+    qsort(keys, nj, sizeof(JendKey), compare_jend);
+    for (int i = 0; i < nj; i++) {
+        ctx->jend[i] = keys[i].idx;
+    }
+    free(keys);
 }
 
 static int equal_strand(char s1, char s2) {
@@ -248,88 +609,172 @@ static int less_than(int n1, int n2) {
     return 0;
 }
 
-static double get_cov(int start, int end, int *si, int nb) {
+static double get_cov(const Bundle *ctx, int start, int end, int *si, int nb) {
     double cov_sum = 0;
     
-    while (*si < nb && start > covg[*si].end) {
+    while (*si < nb && start > ctx->covg[*si].end) {
         (*si)++;
     }
     
     if (*si == nb) return cov_sum;
     
-    if (start < covg[*si].start) {
-        start = covg[*si].start;
+    if (start < ctx->covg[*si].start) {
+        start = ctx->covg[*si].start;
     }
     
-    while (end > covg[*si].end) {
-        cov_sum += (covg[*si].end - start + 1) * covg[*si].cov;
+    while (end > ctx->covg[*si].end) {
+        cov_sum += (ctx->covg[*si].end - start + 1) * ctx->covg[*si].cov;
         (*si)++;
         if (*si == nb) return cov_sum;
-        start = covg[*si].start;
+        start = ctx->covg[*si].start;
     }
     
     if (end < start) return cov_sum;
     
-    cov_sum += (end - start + 1) * covg[*si].cov;
+    cov_sum += (end - start + 1) * ctx->covg[*si].cov;
     
     return cov_sum;
 }
 
-static void process_junctions(int nj) {
+// Binary min-heap of junction indices keyed by a double
+typedef struct {
+    double *key;
+    int *idx;
+    int size;
+    int cap;
+} JuncHeap;
+
+static void heap_push(JuncHeap *h, double key, int idx) {
+    if (h->size >= h->cap) {
+        h->cap = h->cap ? h->cap * 2 : 64;
+        h->key = realloc(h->key, h->cap * sizeof(double));
+        h->idx = realloc(h->idx, h->cap * sizeof(int));
+    }
+    int i = h->size++;
+    while (i > 0) {
+        int p = (i - 1) / 2;
+        if (h->key[p] <= key) break;
+        h->key[i] = h->key[p];
+        h->idx[i] = h->idx[p];
+        i = p;
+    }
+    h->key[i] = key;
+    h->idx[i] = idx;
+}
+
+static void heap_pop(JuncHeap *h) {
+    double key = h->key[--h->size];
+    int idx = h->idx[h->size];
+    int i = 0;
+    for (;;) {
+        int c = 2 * i + 1;
+        if (c >= h->size) break;
+        if (c + 1 < h->size && h->key[c + 1] < h->key[c]) c++;
+        if (key <= h->key[c]) break;
+        h->key[i] = h->key[c];
+        h->idx[i] = h->idx[c];
+        i = c;
+    }
+    h->key[i] = key;
+    h->idx[i] = idx;
+}
+
+// Active junctions of one strand that can still take part in a comparison
+// (cov < smallcov): `low` holds the ones not marked yet by cov, `high` all of
+// them by -cov. Retired junctions are dropped lazily when they reach the top.
+typedef struct {
+    JuncHeap low;
+    JuncHeap high;
+} StrandHeaps;
+
+static void process_junctions(Bundle *ctx, int nj) {
+    // Retiring a junction removes the oldest active junction with the same
+    // chr:start:strand key (one chromosome per bundle), i.e. the head of a
+    // per-key FIFO. Keys live in an open-addressing table.
     typedef struct {
-        char key[512];
-        int idx;
-    } ActiveEntry;
-    
-    ActiveEntry *active = malloc(nj * sizeof(ActiveEntry));
-    int active_size = 0;
-    
-    int *mark = calloc(nj, sizeof(int));
+        long long key;
+        int head;
+        int tail;
+    } KeyQueue;
+    
+    int tsize = 16;
+    while (tsize < 2 * nj) tsize *= 2;
+    KeyQueue *table = malloc(tsize * sizeof(KeyQueue));
+    for (int i = 0; i < tsize; i++) table[i].key = -1;
+    
+    int *next = malloc((nj ? nj : 1) * sizeof(int));
+    char *active = calloc(nj ? nj : 1, 1);
+    int *mark = calloc(nj ? nj : 1, sizeof(int));
+    
+    int strand_heap[256];
+    for (int i = 0; i < 256; i++) strand_heap[i] = -1;
+    StrandHeaps heaps[256];
+    unsigned char strands[256];
+    int nstrands = 0;
     
     int js = 0;
     int je = 0;
     
     while (js < nj) {
         // Remove junctions that ended before current start
-        while (je < nj && junc[jend[je]].end < junc[js].start) {
-            char key[512];
-            snprintf(key, sizeof(key), "%s:%d:%c", junc[jend[je]].chrname, junc[jend[je]].start, junc[jend[je]].strand);
-            
-            for (int i = 0; i < active_size; i++) {
-                if (strcmp(active[i].key, key) == 0) {
-                    // Remove by shifting
-                    for (int j = i; j < active_size - 1; j++) {
-                        active[j] = active[j + 1];
-                    }
-                    active_size--;
-                    break;
-                }
+        while (je < nj && ctx->junc[ctx->jend[je]].end < ctx->junc[js].start) {
+            const JuncEntry *r = &ctx->junc[ctx->jend[je]];
+            long long key = ((long long)(unsigned)r->start << 8) | (unsigned char)r->strand;
+            unsigned slot = (unsigned)((unsigned long long)key * 0x9E3779B97F4A7C15ULL >> 40) & (tsize - 1);
+            while (table[slot].key != -1 && table[slot].key != key) slot = (slot + 1) & (tsize - 1);
+            if (table[slot].key == key && table[slot].head >= 0) {
+                active[table[slot].head] = 0;
+                table[slot].head = next[table[slot].head];
             }
             je++;
         }
         
-        // Check against active junctions
-        for (int i = 0; i < active_size; i++) {
-            int ai = active[i].idx;
-            if (equal_strand(junc[ai].strand, junc[js].strand)) {
-                if (junc[js].cov > junc[ai].cov) {
-                    if (junc[js].cov < smallcov) {
-                        mark[ai] = 1;
-                    }
-                } else if (junc[js].cov < junc[ai].cov) {
-                    if (junc[ai].cov < smallcov) {
-                        mark[js] = 1;
-                    }
+        // Check against active junctions: with cov < smallcov, js marks every
+        // active junction of a compatible strand with lower coverage; js is
+        // marked if one of them has higher coverage but is below smallcov.
+        double cov = ctx->junc[js].cov;
+        unsigned char s = (unsigned char)ctx->junc[js].strand;
+        for (int k = 0; k < nstrands; k++) {
+            if (!equal_strand((char)strands[k], (char)s)) continue;
+            StrandHeaps *sh = &heaps[k];
+            if (cov < smallcov) {
+                while (sh->low.size && sh->low.key[0] < cov) {
+                    int ai = sh->low.idx[0];
+                    if (active[ai]) mark[ai] = 1;
+                    heap_pop(&sh->low);
                 }
             }
+            while (sh->high.size && !active[sh->high.idx[0]]) heap_pop(&sh->high);
+            if (sh->high.size && -sh->high.key[0] > cov) {
+                mark[js] = 1;
+            }
         }
         
         // Add current junction to active
-        char key[512];
-        snprintf(key, sizeof(key), "%s:%d:%c", junc[js].chrname, junc[js].start, junc[js].strand);
-        strcpy(active[active_size].key, key);
-        active[active_size].idx = js;
-        active_size++;
+        long long key = ((long long)(unsigned)ctx->junc[js].start << 8) | s;
+        unsigned slot = (unsigned)((unsigned long long)key * 0x9E3779B97F4A7C15ULL >> 40) & (tsize - 1);
+        while (table[slot].key != -1 && table[slot].key != key) slot = (slot + 1) & (tsize - 1);
+        next[js] = -1;
+        if (table[slot].key != key || table[slot].head < 0) {
+            table[slot].key = key;
+            table[slot].head = js;
+        } else {
+            next[table[slot].tail] = js;
+        }
+        table[slot].tail = js;
+        active[js] = 1;
+        
+        if (cov < smallcov) {
+            if (strand_heap[s] < 0) {
+                strand_heap[s] = nstrands;
+                strands[nstrands] = s;
+                memset(&heaps[nstrands], 0, sizeof(StrandHeaps));
+                nstrands++;
+            }
+            StrandHeaps *sh = &heaps[strand_heap[s]];
+            heap_push(&sh->low, cov, js);
+            heap_push(&sh->high, -cov, js);
+        }
         
         js++;
     }
@@ -337,16 +782,26 @@ static void process_junctions(int nj) {
     // Apply marks
     for (int j = 0; j < nj; j++) {
         if (mark[j]) {
-            junc[j].cov = 0;
+            ctx->junc[j].cov = 0;
         }
     }
     
+    for (int k = 0; k < nstrands; k++) {
+        free(heaps[k].low.key);
+        free(heaps[k].low.idx);
+        free(heaps[k].high.key);
+        free(heaps[k].high.idx);
+    }
+    free(table);
+    free(next);
     free(active);
     free(mark);
 }
 
-static void compute_perc(int l, int r, int i, double *cov, double *adjs, double *adje, 
-                         double *percl, double *percr, double *avgl, double *avgr) {
+// kwl and kwr are the block starts, x - (x - 1) % win, of i - 1 and r in the
+// windowed prefix sums
+static inline void compute_perc(int l, int r, int i, int kwl, int kwr, const double *cov, const double *adjs,
+                                const double *adje, double *percl, double *percr, double *avgl, double *avgr) {
     *percl = 1;
     *percr = 1;
     *avgl = 0;
@@ -354,21 +809,17 @@ static void compute_perc(int l, int r, int i, double *cov, double *adjs, double
     
     double sumleft = cov[i - 1] - cov[l - 1];
     double sumlefta = adjs[i - 1] - adjs[l - 1];
-    int k = (i - 2) % win;
-    int kw = i - 1 - k;
-    if (kw < i && kw >= l) {
-        sumleft += cov[kw - 1];
-        sumlefta += adjs[kw - 1];
+    if (kwl < i && kwl >= l) {
+        sumleft += cov[kwl - 1];
+        sumlefta += adjs[kwl - 1];
     }
     sumlefta = sumleft - sumlefta;
     
     double sumright = cov[r] - cov[i - 1];
     double sumrighta = adje[r] - adje[i - 1];
-    k = (r - 1) % win;
-    kw = r - k;
-    if (kw - 1 < r && kw >= i) {
-        sumright += cov[kw - 1];
-        sumrighta += adje[kw - 1];
+    if (kwr - 1 < r && kwr >= i) {
+        sumright += cov[kwr - 1];
+        sumrighta += adje[kwr - 1];
     }
     sumrighta = sumright - sumrighta;
     
@@ -383,50 +834,105 @@ static void compute_perc(int l, int r, int i, double *cov, double *adjs, double
     }
 }
 
-static void get_drop(int si, int se, int nb, int *js_out, int *je_out, int js, int je, int nj) {
-    int start = covg[si].start;
-    int end = covg[se].end;
+static void push_tmp(TmpEntry **arr, int *size, int *cap, int pos, double perc, double cov) {
+    if (*size >= *cap) {
+        *cap = *cap ? *cap * 2 : 256;
+        *arr = realloc(*arr, *cap * sizeof(TmpEntry));
+    }
+    (*arr)[*size].pos = pos;
+    (*arr)[*size].perc = perc;
+    (*arr)[*size].cov = cov;
+    (*arr)[*size].active = 1;
+    (*size)++;
+}
+
+// Keep at most one active candidate (the lowest perc) per win bases; same
+// rules for the start (tmps) and end (tmpe) candidates.
+static void add_tmp(TmpEntry **arr, int *size, int *cap, int *maxi, int i, double perc, double cov) {
+    if (*size == 0) {
+        push_tmp(arr, size, cap, i, perc, cov);
+        return;
+    }
+    push_tmp(arr, size, cap, i, perc, cov);
+    TmpEntry *t = *arr;
+    int n = *size;
+    if (i - t[*maxi].pos > win) {
+        if (t[n - 2].perc >= perc || i - t[n - 2].pos > win) {
+            *maxi = n - 1;
+            int k = *maxi - 1;
+            while (k >= 0 && i - t[k].pos <= win) {
+                if (perc > t[k].perc) {
+                    *maxi = k;
+                    t[n - 1].active = 0;
+                } else {
+                    t[k].active = 0;
+                }
+                k--;
+            }
+        } else {
+            t[n - 1].active = 0;
+        }
+    } else if (perc < t[*maxi].perc) {
+        t[*maxi].active = 0;
+        *maxi = n - 1;
+    } else {
+        t[n - 1].active = 0;
+    }
+}
+
+static void get_drop(Bundle *ctx, int si, int se, int nb, int *js_out, int *je_out, int js, int je, int nj) {
+    int start = ctx->covg[si].start;
+    int end = ctx->covg[se].end;
     
-    while (js < nj && junc[js].start < start) js++;
-    while (je < nj && junc[jend[je]].end < start) je++;
+    while (js < nj && ctx->junc[js].start < start) js++;
+    while (je < nj && ctx->junc[ctx->jend[je]].end < start) je++;
     
-    push_drop(start, 0, covg[si].cov);
+    push_drop(ctx, start, 0, ctx->covg[si].cov);
     
     int len = end - start + 1;
     if (len >= win + smallwin) {
-        // Allocate arrays
-        double *c = calloc(len + win + 10, sizeof(double));
-        double *as = calloc(len + win + 10, sizeof(double));
-        double *ae = calloc(len + win + 10, sizeof(double));
+        // Scratch arrays are kept in the bundle context and reused
+        size_t need = (size_t)len + win + 10;
+        if (need > ctx->scan_cap) {
+            ctx->scan_cap = need + need / 4;
+            ctx->scan_c = realloc(ctx->scan_c, ctx->scan_cap * sizeof(double));
+            ctx->scan_as = realloc(ctx->scan_as, ctx->scan_cap * sizeof(double));
+            ctx->scan_ae = realloc(ctx->scan_ae, ctx->scan_cap * sizeof(double));
+            ctx->scan_blk = realloc(ctx->scan_blk, ctx->scan_cap * sizeof(int));
+        }
+        double *c = ctx->scan_c;
+        double *as = ctx->scan_as;
+        double *ae = ctx->scan_ae;
+        int *blk = ctx->scan_blk;
+        memset(as, 0, need * sizeof(double));
+        memset(ae, 0, need * sizeof(double));
         
-        int *jp = NULL;
+        int *jp = ctx->jp;
         int jp_size = 0;
-        int jp_cap = 0;
         
         c[0] = 0;
-        as[0] = 0;
-        ae[0] = 0;
         
         int curr_si = si;
+        int r_mod = 0;  // i % win
         
-        for (int i = 0; i < len; i++) {
+        for (int i = 0; i < len; i++, r_mod = (r_mod + 1 == win) ? 0 : r_mod + 1) {
             int istart = i + start;
-            while (istart > covg[curr_si].end) curr_si++;
+            while (istart > ctx->covg[curr_si].end) curr_si++;
             int i1 = i + 1;
-            c[i1] = covg[curr_si].cov;
-            int r_mod = i % win;
+            c[i1] = ctx->covg[curr_si].cov;
             if (r_mod) {
                 c[i1] += c[i];
                 as[i1] += as[i];
                 ae[i1] += ae[i];
             }
+            blk[i1] = i1 - r_mod;
             
             int isjunc = 0;
-            if (js < nj && junc[js].start == istart) {
-                double jcov = junc[js].cov;
+            if (js < nj && ctx->junc[js].start == istart) {
+                double jcov = ctx->junc[js].cov;
                 js++;
-                while (js < nj && junc[js].start == istart) {
-                    jcov += junc[js].cov;
+                while (js < nj && ctx->junc[js].start == istart) {
+                    jcov += ctx->junc[js].cov;
                     js++;
                 }
                 
@@ -440,20 +946,19 @@ static void get_drop(int si, int se, int nb, int *js_out, int *je_out, int js, i
                     }
                 }
                 
-                // Push to jp
-                if (jp_size >= jp_cap) {
-                    jp_cap = jp_cap ? jp_cap * 2 : 256;
-                    jp = realloc(jp, jp_cap * sizeof(int));
+                if (jp_size >= ctx->jp_cap) {
+                    ctx->jp_cap = ctx->jp_cap ? ctx->jp_cap * 2 : 256;
+                    jp = ctx->jp = realloc(ctx->jp, ctx->jp_cap * sizeof(int));
                 }
                 jp[jp_size++] = i1;
                 isjunc = 1;
             }
             
-            if (je < nj && junc[jend[je]].end == istart) {
-                double jcov = junc[jend[je]].cov;
+            if (je < nj && ctx->junc[ctx->jend[je]].end == istart) {
+                double jcov = ctx->junc[ctx->jend[je]].cov;
                 je++;
-                while (je < nj && junc[jend[je]].end == istart) {
-                    jcov += junc[jend[je]].cov;
+                while (je < nj && ctx->junc[ctx->jend[je]].end == istart) {
+                    jcov += ctx->junc[ctx->jend[je]].cov;
                     je++;
                 }
                 
@@ -461,29 +966,29 @@ static void get_drop(int si, int se, int nb, int *js_out, int *je_out, int js, i
                     ae[i1 + j] += jcov;
                 }
                 if (!isjunc) {
-                    if (jp_size >= jp_cap) {
-                        jp_cap = jp_cap ? jp_cap * 2 : 256;
-                        jp = realloc(jp, jp_cap * sizeof(int));
+                    if (jp_size >= ctx->jp_cap) {
+                        ctx->jp_cap = ctx->jp_cap ? ctx->jp_cap * 2 : 256;
+                        jp = ctx->jp = realloc(ctx->jp, ctx->jp_cap * sizeof(int));
                     }
                     jp[jp_size++] = i1;
                 }
             }
         }
         
-        int j_idx = 0;
-        int i = smallwin + 1;
-        
-        TmpEntry *tmps = NULL;
         int tmps_size = 0;
-        int tmps_cap = 0;
-        
-        TmpEntry *tmpe = NULL;
         int tmpe_size = 0;
-        int tmpe_cap = 0;
-        
         int maxs = 0;
         int maxe = 0;
         
+        // Junction positions inside the window of i, as index ranges of jp:
+        // [kl, km) anchor the left edge (i - jp > smallwin), [kr, ke) the
+        // right edge (jp - i + 1 > smallwin); all bounds only move forward.
+        int kl = 0;
+        int km = 0;
+        int kr = 0;
+        int ke = 0;
+        int i = smallwin + 1;
+        
         while (i < len - smallwin) {
             int l = i - win;
             if (l < 1) l = 1;
@@ -494,121 +999,40 @@ static void get_drop(int si, int se, int nb, int *js_out, int *je_out, int js, i
                 l = 2 * i - r_val - 1;
             }
             
+            int kwl = blk[i - 1];
             double minpercl, minpercr, minavgl, minavgr;
-            compute_perc(l, r_val, i, c, as, ae, &minpercl, &minpercr, &minavgl, &minavgr);
+            compute_perc(l, r_val, i, kwl, blk[r_val], c, as, ae, &minpercl, &minpercr, &minavgl, &minavgr);
             
-            while (j_idx < jp_size && jp[j_idx] <= l) j_idx++;
+            while (kl < jp_size && jp[kl] <= l) kl++;
+            while (km < jp_size && i - jp[km] > smallwin) km++;
+            while (kr < jp_size && jp[kr] - i + 1 <= smallwin) kr++;
+            while (ke < jp_size && jp[ke] < r_val) ke++;
             
-            int k = j_idx;
-            while (k < jp_size && jp[k] < r_val) {
-                if (i - jp[k] > smallwin) {
-                    double percl, percr, avgl, avgr;
-                    compute_perc(jp[k], 2 * i - jp[k] - 1, i, c, as, ae, &percl, &percr, &avgl, &avgr);
-                    if (percl < minpercl) { minpercl = percl; minavgl = avgl; }
-                    if (percr < minpercr) { minpercr = percr; minavgr = avgr; }
-                } else if (jp[k] - i + 1 > smallwin) {
-                    double percl, percr, avgl, avgr;
-                    compute_perc(2 * i - jp[k] - 1, jp[k], i, c, as, ae, &percl, &percr, &avgl, &avgr);
-                    if (percl < minpercl) { minpercl = percl; minavgl = avgl; }
-                    if (percr < minpercr) { minpercr = percr; minavgr = avgr; }
-                }
-                k++;
+            int kend = km < ke ? km : ke;
+            for (int k = kl; k < kend; k++) {
+                int p = jp[k];
+                int r = 2 * i - p - 1;
+                double percl, percr, avgl, avgr;
+                compute_perc(p, r, i, kwl, blk[r], c, as, ae, &percl, &percr, &avgl, &avgr);
+                if (percl < minpercl) { minpercl = percl; minavgl = avgl; }
+                if (percr < minpercr) { minpercr = percr; minavgr = avgr; }
+            }
+            for (int k = kr > kl ? kr : kl; k < ke; k++) {
+                int p = jp[k];
+                double percl, percr, avgl, avgr;
+                compute_perc(2 * i - p - 1, p, i, kwl, blk[p], c, as, ae, &percl, &percr, &avgl, &avgr);
+                if (percl < minpercl) { minpercl = percl; minavgl = avgl; }
+                if (percr < minpercr) { minpercr = percr; minavgr = avgr; }
             }
             
             int plus = 0;
             if (minpercr < percnoise) {
-                if (tmps_size > 0) {
-                    if (tmps_size >= tmps_cap) {
-                        tmps_cap = tmps_cap ? tmps_cap * 2 : 256;
-                        tmps = realloc(tmps, tmps_cap * sizeof(TmpEntry));
-                    }
-                    tmps[tmps_size].pos = i;
-                    tmps[tmps_size].perc = minpercr;
-                    tmps[tmps_size].cov = minavgr;
-                    tmps[tmps_size].active = 1;
-                    tmps_size++;
-                    
-                    if (i - tmps[maxs].pos > win) {
-                        if (tmps[tmps_size - 2].perc >= minpercr || i - tmps[tmps_size - 2].pos > win) {
-                            maxs = tmps_size - 1;
-                            k = maxs - 1;
-                            while (k >= 0 && i - tmps[k].pos <= win) {
-                                if (minpercr > tmps[k].perc) {
-                                    maxs = k;
-                                    tmps[tmps_size - 1].active = 0;
-                                } else {
-                                    tmps[k].active = 0;
-                                }
-                                k--;
-                            }
-                        } else {
-                            tmps[tmps_size - 1].active = 0;
-                        }
-                    } else if (minpercr < tmps[maxs].perc) {
-                        tmps[maxs].active = 0;
-                        maxs = tmps_size - 1;
-                    } else {
-                        tmps[tmps_size - 1].active = 0;
-                    }
-                } else {
-                    if (tmps_size >= tmps_cap) {
-                        tmps_cap = tmps_cap ? tmps_cap * 2 : 256;
-                        tmps = realloc(tmps, tmps_cap * sizeof(TmpEntry));
-                    }
-                    tmps[tmps_size].pos = i;
-                    tmps[tmps_size].perc = minpercr;
-                    tmps[tmps_size].cov = minavgr;
-                    tmps[tmps_size].active = 1;
-                    tmps_size++;
-                }
+                add_tmp(&ctx->tmps, &tmps_size, &ctx->tmps_cap, &maxs, i, minpercr, minavgr);
                 plus = 1;
             }
             
             if (minpercl < percnoise) {
-                if (tmpe_size > 0) {
-                    if (tmpe_size >= tmpe_cap) {
-                        tmpe_cap = tmpe_cap ? tmpe_cap * 2 : 256;
-                        tmpe = realloc(tmpe, tmpe_cap * sizeof(TmpEntry));
-                    }
-                    tmpe[tmpe_size].pos = i;
-                    tmpe[tmpe_size].perc = minpercl;
-                    tmpe[tmpe_size].cov = minavgl;
-                    tmpe[tmpe_size].active = 1;
-                    tmpe_size++;
-                    
-                    if (i - tmpe[maxe].pos > win) {
-                        if (tmpe[tmpe_size - 2].perc >= minpercl || i - tmpe[tmpe_size - 2].pos > win) {
-                            maxe = tmpe_size - 1;
-                            k = maxe - 1;
-                            while (k >= 0 && i - tmpe[k].pos <= win) {
-                                if (minpercl > tmpe[k].perc) {
-                                    maxe = k;
-                                    tmpe[tmpe_size - 1].active = 0;
-                                } else {
-                                    tmpe[k].active = 0;
-                                }
-                                k--;
-                            }
-                        } else {
-                            tmpe[tmpe_size - 1].active = 0;
-                        }
-                    } else if (minpercl < tmpe[maxe].perc) {
-                        tmpe[maxe].active = 0;
-                        maxe = tmpe_size - 1;
-                    } else {
-                        tmpe[tmpe_size - 1].active = 0;
-                    }
-                } else {
-                    if (tmpe_size >= tmpe_cap) {
-                        tmpe_cap = tmpe_cap ? tmpe_cap * 2 : 256;
-                        tmpe = realloc(tmpe, tmpe_cap * sizeof(TmpEntry));
-                    }
-                    tmpe[tmpe_size].pos = i;
-                    tmpe[tmpe_size].perc = minpercl;
-                    tmpe[tmpe_size].cov = minavgl;
-                    tmpe[tmpe_size].active = 1;
-                    tmpe_size++;
-                }
+                add_tmp(&ctx->tmpe, &tmpe_size, &ctx->tmpe_cap, &maxe, i, minpercl, minavgl);
                 plus = 1;
             }
             
@@ -621,6 +1045,8 @@ static void get_drop(int si, int se, int nb, int *js_out, int *je_out, int js, i
             i += plus;
         }
         
+        const TmpEntry *tmps = ctx->tmps;
+        const TmpEntry *tmpe = ctx->tmpe;
         int ns = tmps_size;
         int ne = tmpe_size;
         
@@ -630,7 +1056,7 @@ static void get_drop(int si, int se, int nb, int *js_out, int *je_out, int js, i
         while (s_idx < ns && e_idx < ne) {
             if (tmpe[e_idx].pos < tmps[s_idx].pos) {
                 if (tmpe[e_idx].active) {
-                    push_drop(-(tmpe[e_idx].pos + start - 2), tmpe[e_idx].perc, tmpe[e_idx].cov);
+                    push_drop(ctx, -(tmpe[e_idx].pos + start - 2), tmpe[e_idx].perc, tmpe[e_idx].cov);
                 }
                 e_idx++;
             } else {
@@ -638,61 +1064,54 @@ static void get_drop(int si, int se, int nb, int *js_out, int *je_out, int js, i
                     if (tmpe[e_idx].active && tmpe[e_idx].pos == tmps[s_idx].pos) {
                         exit(1);
                     }
-                    push_drop(tmps[s_idx].pos + start - 1, tmps[s_idx].perc, tmps[s_idx].cov);
+                    push_drop(ctx, tmps[s_idx].pos + start - 1, tmps[s_idx].perc, tmps[s_idx].cov);
                 }
                 s_idx++;
             }
         }
         while (s_idx < ns) {
             if (tmps[s_idx].active) {
-                push_drop(tmps[s_idx].pos + start - 1, tmps[s_idx].perc, tmps[s_idx].cov);
+                push_drop(ctx, tmps[s_idx].pos + start - 1, tmps[s_idx].perc, tmps[s_idx].cov);
             }
             s_idx++;
         }
         while (e_idx < ne) {
             if (tmpe[e_idx].active) {
-                push_drop(-(tmpe[e_idx].pos + start - 2), tmpe[e_idx].perc, tmpe[e_idx].cov);
+                push_drop(ctx, -(tmpe[e_idx].pos + start - 2), tmpe[e_idx].perc, tmpe[e_idx].cov);
             }
             e_idx++;
         }
-        
-        free(c);
-        free(as);
-        free(ae);
-        free(jp);
-        free(tmps);
-        free(tmpe);
     }
     
     if (js > 0) js--;
-    while (js < nj && junc[js].start < end) js++;
+    while (js < nj && ctx->junc[js].start < end) js++;
     
-    push_drop(-end, 0, covg[se].cov);
+    push_drop(ctx, -end, 0, ctx->covg[se].cov);
     
     *js_out = js;
     *je_out = je;
 }
 
-static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb, int nd, int nj, const char *chr) {
+static void get_record(Bundle *ctx, int *ib, int *id, int *js, int *je, int *prevpos, int nb, int nd, int nj, const char *chr) {
     int nextd = 0;
     int nextjs = 0;
     int nextje = 0;
     
     if (*id < nd) {
-        nextd = abs(drop_arr[*id].pos);
+        nextd = abs(ctx->drop_arr[*id].pos);
     }
     
     while (*js < nj) {
-        if (junc[*js].cov > 0) {
-            nextjs = junc[*js].start;
+        if (ctx->junc[*js].cov > 0) {
+            nextjs = ctx->junc[*js].start;
             break;
         }
         (*js)++;
     }
     
     while (*je < nj) {
-        if (junc[jend[*je]].cov > 0) {
-            nextje = junc[jend[*je]].end;
+        if (ctx->junc[ctx->jend[*je]].cov > 0) {
+            nextje = ctx->junc[ctx->jend[*je]].end;
             break;
         }
         (*je)++;
@@ -708,33 +1127,33 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
             // start/stop is smallest
             if (nextd > *prevpos + 1) {
                 int tmpib = *ib;
-                double avgcov = get_cov(*prevpos + 1, nextd - 1, &tmpib, nb);
-                record[record_size - 1].cov_to_next += avgcov;
+                double avgcov = get_cov(ctx, *prevpos + 1, nextd - 1, &tmpib, nb);
+                ctx->record[ctx->record_size - 1].cov_to_next += avgcov;
             }
             
             int tmpib = *ib;
-            double pos_cov = get_cov(nextd, nextd, &tmpib, nb);
+            double pos_cov = get_cov(ctx, nextd, nextd, &tmpib, nb);
             *ib = tmpib;
             
-            while (*id < nd && abs(drop_arr[*id].pos) == nextd) {
+            while (*id < nd && abs(ctx->drop_arr[*id].pos) == nextd) {
                 const char *type = "tstart";
-                if (drop_arr[*id].pos < 0) type = "tend";
+                if (ctx->drop_arr[*id].pos < 0) type = "tend";
                 
                 // Check if should delete previous junctions
-                if (drop_arr[*id].perc == 0 && *prevpos > nextd - delta_param) {
+                if (ctx->drop_arr[*id].perc == 0 && *prevpos > nextd - delta_param) {
                     if (strcmp(type, "tstart") == 0) {
-                        if (record[record_size - 1].pos == nextd && strcmp(record[record_size - 1].type, "jstart") == 0) {
-                            for (int j = 0; j < record[record_size - 1].num_indices; j++) {
-                                junc[record[record_size - 1].indices[j]].cov = 0;
+                        if (ctx->record[ctx->record_size - 1].pos == nextd && strcmp(ctx->record[ctx->record_size - 1].type, "jstart") == 0) {
+                            for (int j = 0; j < ctx->record[ctx->record_size - 1].num_indices; j++) {
+                                ctx->junc[record_indices(ctx, ctx->record_size - 1)[j]].cov = 0;
                             }
                         }
                     } else {
-                        int nr = record_size;
+                        int nr = ctx->record_size;
                         int i = nr - 1;
-                        while (i >= 0 && record[i].pos > nextd - delta_param) {
-                            if (strcmp(record[i].type, "jend") == 0) {
-                                for (int j = 0; j < record[i].num_indices; j++) {
-                                    junc[record[i].indices[j]].cov = 0;
+                        while (i >= 0 && ctx->record[i].pos > nextd - delta_param) {
+                            if (strcmp(ctx->record[i].type, "jend") == 0) {
+                                for (int j = 0; j < ctx->record[i].num_indices; j++) {
+                                    ctx->junc[record_indices(ctx, i)[j]].cov = 0;
                                 }
                             }
                             i--;
@@ -743,7 +1162,7 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
                 }
                 
                 int idx = *id;
-                push_record(type, nextd, &idx, 1, drop_arr[*id].perc, pos_cov, 0);
+                push_record(ctx, type, nextd, &idx, 1, ctx->drop_arr[*id].perc, pos_cov, 0);
                 
                 (*id)++;
             }
@@ -757,14 +1176,14 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
             double count = 0;
             int present = 0;
             
-            while (*je < nj && junc[jend[*je]].end == nextje) {
-                if (junc[jend[*je]].cov > 0) {
+            while (*je < nj && ctx->junc[ctx->jend[*je]].end == nextje) {
+                if (ctx->junc[ctx->jend[*je]].cov > 0) {
                     if (tmpr_size >= tmpr_cap) {
                         tmpr_cap = tmpr_cap ? tmpr_cap * 2 : 16;
                         tmpr = realloc(tmpr, tmpr_cap * sizeof(int));
                     }
-                    tmpr[tmpr_size++] = jend[*je];
-                    count += junc[jend[*je]].cov;
+                    tmpr[tmpr_size++] = ctx->jend[*je];
+                    count += ctx->junc[ctx->jend[*je]].cov;
                 }
                 (*je)++;
             }
@@ -774,29 +1193,29 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
                 
                 int tmpib = *ib;
                 int leftstart = nextje - delta_param;
-                if (leftstart < covg[0].start) {
-                    leftstart = covg[0].start;
+                if (leftstart < ctx->covg[0].start) {
+                    leftstart = ctx->covg[0].start;
                     tmpib = 0;
                 } else {
-                    while (covg[tmpib].start > leftstart) tmpib--;
+                    while (ctx->covg[tmpib].start > leftstart) tmpib--;
                 }
-                double leftcov = get_cov(leftstart, nextje - 1, &tmpib, nb);
+                double leftcov = get_cov(ctx, leftstart, nextje - 1, &tmpib, nb);
                 
                 int rightend = nextje + delta_param - 1;
-                if (rightend > covg[nb - 1].end) rightend = covg[nb - 1].end;
-                double rightcov = get_cov(nextje, rightend, &tmpib, nb);
+                if (rightend > ctx->covg[nb - 1].end) rightend = ctx->covg[nb - 1].end;
+                double rightcov = get_cov(ctx, nextje, rightend, &tmpib, nb);
                 
                 if (leftcov < rightcov) {
                     double prevcount = 0;
                     int prevjend = 0;
                     if (*prevpos > nextje - 2) {
-                        int nr = record_size;
+                        int nr = ctx->record_size;
                         int i = nr - 1;
-                        while (i >= 0 && record[i].pos > nextje - 2) {
-                            if (record[i].pos == nextje - 1 && strcmp(record[i].type, "jend") == 0) {
+                        while (i >= 0 && ctx->record[i].pos > nextje - 2) {
+                            if (ctx->record[i].pos == nextje - 1 && strcmp(ctx->record[i].type, "jend") == 0) {
                                 prevjend = i;
-                                for (int j = 0; j < record[i].num_indices; j++) {
-                                    prevcount += junc[record[i].indices[j]].cov;
+                                for (int j = 0; j < ctx->record[i].num_indices; j++) {
+                                    prevcount += ctx->junc[record_indices(ctx, i)[j]].cov;
                                 }
                             }
                             i--;
@@ -805,22 +1224,22 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
                     
                     if (prevcount < count) {
                         if (prevcount > 0) {
-                            for (int j = 0; j < record[prevjend].num_indices; j++) {
-                                junc[record[prevjend].indices[j]].cov = 0;
+                            for (int j = 0; j < ctx->record[prevjend].num_indices; j++) {
+                                ctx->junc[record_indices(ctx, prevjend)[j]].cov = 0;
                             }
                         }
                         
                         if (nextje > *prevpos + 1) {
                             int tmp_ib = *ib;
-                            double avgcov = get_cov(*prevpos + 1, nextje - 1, &tmp_ib, nb);
-                            record[record_size - 1].cov_to_next += avgcov;
+                            double avgcov = get_cov(ctx, *prevpos + 1, nextje - 1, &tmp_ib, nb);
+                            ctx->record[ctx->record_size - 1].cov_to_next += avgcov;
                         }
                         
                         tmpib = *ib;
-                        double pos_cov = get_cov(nextje, nextje, &tmpib, nb);
+                        double pos_cov = get_cov(ctx, nextje, nextje, &tmpib, nb);
                         *ib = tmpib;
                         
-                        push_record("jend", nextje, tmpr, tmpr_size, leftcov / rightcov, pos_cov, 0);
+                        push_record(ctx, "jend", nextje, tmpr, tmpr_size, leftcov / rightcov, pos_cov, 0);
                         
                         *prevpos = nextje;
                     } else {
@@ -833,7 +1252,7 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
             
             if (present && count == 0) {
                 for (int j = 0; j < tmpr_size; j++) {
-                    junc[tmpr[j]].cov = 0;
+                    ctx->junc[tmpr[j]].cov = 0;
                 }
             }
             
@@ -848,14 +1267,14 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
             double count = 0;
             int present = 0;
             
-            while (*js < nj && junc[*js].start == nextjs) {
-                if (junc[*js].cov > 0) {
+            while (*js < nj && ctx->junc[*js].start == nextjs) {
+                if (ctx->junc[*js].cov > 0) {
                     if (tmpr_size >= tmpr_cap) {
                         tmpr_cap = tmpr_cap ? tmpr_cap * 2 : 16;
                         tmpr = realloc(tmpr, tmpr_cap * sizeof(int));
                     }
                     tmpr[tmpr_size++] = *js;
-                    count += junc[*js].cov;
+                    count += ctx->junc[*js].cov;
                 }
                 (*js)++;
             }
@@ -866,17 +1285,17 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
                 double prevcount = 0;
                 int prevjstart = 0;
                 if (*prevpos > nextjs - delta_param) {
-                    int nr = record_size;
+                    int nr = ctx->record_size;
                     int i = nr - 1;
-                    while (i >= 0 && record[i].pos > nextjs - delta_param) {
-                        if ((record[i].change_perc == 0 && strcmp(record[i].type, "tstart") == 0) ||
-                            (record[i].pos == nextjs && strcmp(record[i].type, "jend") == 0)) {
+                    while (i >= 0 && ctx->record[i].pos > nextjs - delta_param) {
+                        if ((ctx->record[i].change_perc == 0 && strcmp(ctx->record[i].type, "tstart") == 0) ||
+                            (ctx->record[i].pos == nextjs && strcmp(ctx->record[i].type, "jend") == 0)) {
                             count = 0;
                             break;
-                        } else if (record[i].pos == nextjs - 1 && strcmp(record[i].type, "jstart") == 0) {
+                        } else if (ctx->record[i].pos == nextjs - 1 && strcmp(ctx->record[i].type, "jstart") == 0) {
                             prevjstart = i;
-                            for (int j = 0; j < record[i].num_indices; j++) {
-                                prevcount += junc[record[i].indices[j]].cov;
+                            for (int j = 0; j < ctx->record[i].num_indices; j++) {
+                                prevcount += ctx->junc[record_indices(ctx, i)[j]].cov;
                             }
                         }
                         i--;
@@ -886,36 +1305,36 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
                 if (prevcount < count && count > 0) {
                     int tmpib = *ib;
                     int leftstart = nextjs - delta_param + 1;
-                    if (leftstart < covg[0].start) {
-                        leftstart = covg[0].start;
+                    if (leftstart < ctx->covg[0].start) {
+                        leftstart = ctx->covg[0].start;
                         tmpib = 0;
                     } else {
-                        while (covg[tmpib].start > leftstart) tmpib--;
+                        while (ctx->covg[tmpib].start > leftstart) tmpib--;
                     }
-                    double leftcov = get_cov(leftstart, nextjs, &tmpib, nb);
+                    double leftcov = get_cov(ctx, leftstart, nextjs, &tmpib, nb);
                     
                     int rightend = nextjs + delta_param;
-                    if (rightend > covg[nb - 1].end) rightend = covg[nb - 1].end;
-                    double rightcov = get_cov(nextjs + 1, rightend, &tmpib, nb);
+                    if (rightend > ctx->covg[nb - 1].end) rightend = ctx->covg[nb - 1].end;
+                    double rightcov = get_cov(ctx, nextjs + 1, rightend, &tmpib, nb);
                     
                     if (leftcov > rightcov) {
                         if (prevcount > 0) {
-                            for (int j = 0; j < record[prevjstart].num_indices; j++) {
-                                junc[record[prevjstart].indices[j]].cov = 0;
+                            for (int j = 0; j < ctx->record[prevjstart].num_indices; j++) {
+                                ctx->junc[record_indices(ctx, prevjstart)[j]].cov = 0;
                             }
                         }
                         
                         if (nextjs > *prevpos + 1) {
                             int tmp_ib = *ib;
-                            double avgcov = get_cov(*prevpos + 1, nextjs - 1, &tmp_ib, nb);
-                            record[record_size - 1].cov_to_next += avgcov;
+                            double avgcov = get_cov(ctx, *prevpos + 1, nextjs - 1, &tmp_ib, nb);
+                            ctx->record[ctx->record_size - 1].cov_to_next += avgcov;
                         }
                         
                         tmpib = *ib;
-                        double pos_cov = get_cov(nextjs, nextjs, &tmpib, nb);
+                        double pos_cov = get_cov(ctx, nextjs, nextjs, &tmpib, nb);
                         *ib = tmpib;
                         
-                        push_record("jstart", nextjs, tmpr, tmpr_size, rightcov / leftcov, pos_cov, 0);
+                        push_record(ctx, "jstart", nextjs, tmpr, tmpr_size, rightcov / leftcov, pos_cov, 0);
                         
                         *prevpos = nextjs;
                     } else {
@@ -928,7 +1347,7 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
             
             if (present && count == 0) {
                 for (int j = 0; j < tmpr_size; j++) {
-                    junc[tmpr[j]].cov = 0;
+                    ctx->junc[tmpr[j]].cov = 0;
                 }
             }
             
@@ -941,14 +1360,14 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
             double count = 0;
             int present = 0;
             
-            while (*je < nj && junc[jend[*je]].end == nextje) {
-                if (junc[jend[*je]].cov > 0) {
+            while (*je < nj && ctx->junc[ctx->jend[*je]].end == nextje) {
+                if (ctx->junc[ctx->jend[*je]].cov > 0) {
                     if (tmpr_size >= tmpr_cap) {
                         tmpr_cap = tmpr_cap ? tmpr_cap * 2 : 16;
                         tmpr = realloc(tmpr, tmpr_cap * sizeof(int));
                     }
-                    tmpr[tmpr_size++] = jend[*je];
-                    count += junc[jend[*je]].cov;
+                    tmpr[tmpr_size++] = ctx->jend[*je];
+                    count += ctx->junc[ctx->jend[*je]].cov;
                 }
                 (*je)++;
             }
@@ -958,29 +1377,29 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
                 
                 int tmpib = *ib;
                 int leftstart = nextje - delta_param;
-                if (leftstart < covg[0].start) {
-                    leftstart = covg[0].start;
+                if (leftstart < ctx->covg[0].start) {
+                    leftstart = ctx->covg[0].start;
                     tmpib = 0;
                 } else {
-                    while (covg[tmpib].start > leftstart) tmpib--;
+                    while (ctx->covg[tmpib].start > leftstart) tmpib--;
                 }
-                double leftcov = get_cov(leftstart, nextje - 1, &tmpib, nb);
+                double leftcov = get_cov(ctx, leftstart, nextje - 1, &tmpib, nb);
                 
                 int rightend = nextje + delta_param - 1;
-                if (rightend > covg[nb - 1].end) rightend = covg[nb - 1].end;
-                double rightcov = get_cov(nextje, rightend, &tmpib, nb);
+                if (rightend > ctx->covg[nb - 1].end) rightend = ctx->covg[nb - 1].end;
+                double rightcov = get_cov(ctx, nextje, rightend, &tmpib, nb);
                 
                 if (leftcov < rightcov) {
                     double prevcount = 0;
                     int prevjend = 0;
                     if (*prevpos > nextje - 2) {
-                        int nr = record_size;
+                        int nr = ctx->record_size;
                         int i = nr - 1;
-                        while (i >= 0 && record[i].pos > nextje - 2) {
-                            if (record[i].pos == nextje - 1 && strcmp(record[i].type, "jend") == 0) {
+                        while (i >= 0 && ctx->record[i].pos > nextje - 2) {
+                            if (ctx->record[i].pos == nextje - 1 && strcmp(ctx->record[i].type, "jend") == 0) {
                                 prevjend = i;
-                                for (int j = 0; j < record[i].num_indices; j++) {
-                                    prevcount += junc[record[i].indices[j]].cov;
+                                for (int j = 0; j < ctx->record[i].num_indices; j++) {
+                                    prevcount += ctx->junc[record_indices(ctx, i)[j]].cov;
                                 }
                             }
                             i--;
@@ -989,22 +1408,22 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
                     
                     if (prevcount < count) {
                         if (prevcount > 0) {
-                            for (int j = 0; j < record[prevjend].num_indices; j++) {
-                                junc[record[prevjend].indices[j]].cov = 0;
+                            for (int j = 0; j < ctx->record[prevjend].num_indices; j++) {
+                                ctx->junc[record_indices(ctx, prevjend)[j]].cov = 0;
                             }
                         }
                         
                         if (nextje > *prevpos + 1) {
                             int tmp_ib = *ib;
-                            double avgcov = get_cov(*prevpos + 1, nextje - 1, &tmp_ib, nb);
-                            record[record_size - 1].cov_to_next += avgcov;
+                            double avgcov = get_cov(ctx, *prevpos + 1, nextje - 1, &tmp_ib, nb);
+                            ctx->record[ctx->record_size - 1].cov_to_next += avgcov;
                         }
                         
                         tmpib = *ib;
-                        double pos_cov = get_cov(nextje, nextje, &tmpib, nb);
+                        double pos_cov = get_cov(ctx, nextje, nextje, &tmpib, nb);
                         *ib = tmpib;
                         
-                        push_record("jend", nextje, tmpr, tmpr_size, leftcov / rightcov, pos_cov, 0);
+                        push_record(ctx, "jend", nextje, tmpr, tmpr_size, leftcov / rightcov, pos_cov, 0);
                         
                         *prevpos = nextje;
                     } else {
@@ -1017,7 +1436,7 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
             
             if (present && count == 0) {
                 for (int j = 0; j < tmpr_size; j++) {
-                    junc[tmpr[j]].cov = 0;
+                    ctx->junc[tmpr[j]].cov = 0;
                 }
             }
             
@@ -1026,34 +1445,34 @@ static void get_record(int *ib, int *id, int *js, int *je, int *prevpos, int nb,
     }
 }
 
-static double get_next_cov(int i, int e) {
-    double cov_val = record[i].cov_to_next;
-    int start = record[i].pos;
+static double get_next_cov(const Bundle *ctx, int i, int e) {
+    double cov_val = ctx->record[i].cov_to_next;
+    int start = ctx->record[i].pos;
     
-    if (strcmp(record[i].type, "tstart") == 0 || strcmp(record[i].type, "jend") == 0) {
-        cov_val += record[i].pos_cov;
+    if (strcmp(ctx->record[i].type, "tstart") == 0 || strcmp(ctx->record[i].type, "jend") == 0) {
+        cov_val += ctx->record[i].pos_cov;
     } else {
         start++;
     }
     
     i++;
-    while (i < e && record[i].pos == 0) {
-        cov_val += record[i].pos_cov + record[i].cov_to_next;
+    while (i < e && ctx->record[i].pos == 0) {
+        cov_val += ctx->record[i].pos_cov + ctx->record[i].cov_to_next;
         i++;
     }
     
     int len_val = 0;
     
     if (i < e) {
-        if (strcmp(record[i].type, "tend") == 0 || strcmp(record[i].type, "jstart") == 0) {
-            cov_val += record[i].pos_cov;
+        if (strcmp(ctx->record[i].type, "tend") == 0 || strcmp(ctx->record[i].type, "jstart") == 0) {
+            cov_val += ctx->record[i].pos_cov;
             len_val += 1;
         }
     } else {
         return 0;
     }
     
-    len_val += record[i].pos - start;
+    len_val += ctx->record[i].pos - start;
     
     if (len_val > 0) {
         cov_val /= len_val;
@@ -1062,7 +1481,7 @@ static double get_next_cov(int i, int e) {
     return cov_val;
 }
 
-static int print_small_bundle(const char *chr, int bundleno, int s, int e) {
+static int print_small_bundle(Bundle *ctx, const char *chr, int bundleno, int s, int e) {
     int b = s;
     double sum = 0;
     double sumb = 0;
@@ -1071,21 +1490,21 @@ static int print_small_bundle(const char *chr, int bundleno, int s, int e) {
     int reale = e - 1;
     
     for (int i = s; i < e; i++) {
-        if (record[i].pos == 0) {
-            sum += record[i].pos_cov + record[i].cov_to_next;
+        if (ctx->record[i].pos == 0) {
+            sum += ctx->record[i].pos_cov + ctx->record[i].cov_to_next;
             if (b >= 0) {
-                sumb += record[i].pos_cov + record[i].cov_to_next;
+                sumb += ctx->record[i].pos_cov + ctx->record[i].cov_to_next;
             }
-        } else if (strcmp(record[i].type, "tend") == 0) {
-            sum += record[i].pos_cov + record[i].cov_to_next;
-            sumb += record[i].pos_cov + record[i].cov_to_next;
+        } else if (strcmp(ctx->record[i].type, "tend") == 0) {
+            sum += ctx->record[i].pos_cov + ctx->record[i].cov_to_next;
+            sumb += ctx->record[i].pos_cov + ctx->record[i].cov_to_next;
             nl++;
-            if (record[i].change_perc == 0) {
-                int len_val = record[i].pos - record[b].pos + 1;
+            if (ctx->record[i].change_perc == 0) {
+                int len_val = ctx->record[i].pos - ctx->record[b].pos + 1;
                 if (!found && (len_val < win || sumb / len_val < lowcov)) {
                     for (int j = b; j <= i; j++) {
-                        if (record[j].pos) {
-                            record[j].pos = 0;
+                        if (ctx->record[j].pos) {
+                            ctx->record[j].pos = 0;
                             nl--;
                         }
                     }
@@ -1096,53 +1515,55 @@ static int print_small_bundle(const char *chr, int bundleno, int s, int e) {
                 sumb = 0;
                 found = 0;
             }
-        } else if (strcmp(record[i].type, "tstart") == 0) {
-            sum += record[i].pos_cov + record[i].cov_to_next;
-            sumb += record[i].pos_cov + record[i].cov_to_next;
+        } else if (strcmp(ctx->record[i].type, "tstart") == 0) {
+            sum += ctx->record[i].pos_cov + ctx->record[i].cov_to_next;
+            sumb += ctx->record[i].pos_cov + ctx->record[i].cov_to_next;
             nl++;
-            if (record[i].change_perc == 0) {
+            if (ctx->record[i].change_perc == 0) {
                 b = i;
                 found = 0;
             }
         } else {
-            sum += record[i].pos_cov + record[i].cov_to_next;
-            sumb += record[i].pos_cov + record[i].cov_to_next;
+            sum += ctx->record[i].pos_cov + ctx->record[i].cov_to_next;
+            sumb += ctx->record[i].pos_cov + ctx->record[i].cov_to_next;
             nl++;
             found = 1;
         }
     }
     
     if (nl > 0) {
-        double avg = sum / (record[reale].pos - record[s].pos + 1);
+        double avg = sum / (ctx->record[reale].pos - ctx->record[s].pos + 1);
         
-        printf("bundle\t%s\t%d\t%d\t%d\t", chr, bundleno, record[s].pos, record[reale].pos);
-        printf("%.2f\n", avg);
+        out_printf(ctx, "bundle\t%s\t", chr);
+        mark_bundleno(ctx);
+        out_printf(ctx, "\t%d\t%d\t", ctx->record[s].pos, ctx->record[reale].pos);
+        out_printf(ctx, "%.2f\n", avg);
         bundleno++;
         
         for (int i = s; i < e; i++) {
-            if (record[i].pos) {
+            if (ctx->record[i].pos) {
                 int pos = 0;
-                if (strcmp(record[i].type, "jend") == 0) pos = 1;
-                else if (strcmp(record[i].type, "jstart") == 0) pos = 2;
-                double cov_val = get_next_cov(i, e);
+                if (strcmp(ctx->record[i].type, "jend") == 0) pos = 1;
+                else if (strcmp(ctx->record[i].type, "jstart") == 0) pos = 2;
+                double cov_val = get_next_cov(ctx, i, e);
                 
-                printf("%s\t%d\t", record[i].type, record[i].pos);
-                printf("%.6f\t", record[i].change_perc);
-                printf("%.0f\t", record[i].pos_cov);
-                printf("%.3f", cov_val);
+                out_printf(ctx, "%s\t%d\t", ctx->record[i].type, ctx->record[i].pos);
+                out_printf(ctx, "%.6f\t", ctx->record[i].change_perc);
+                out_printf(ctx, "%.0f\t", ctx->record[i].pos_cov);
+                out_printf(ctx, "%.3f", cov_val);
                 
                 if (pos) {
-                    int nj_rec = record[i].num_indices;
+                    int nj_rec = ctx->record[i].num_indices;
                     for (int j = 0; j < nj_rec; j++) {
-                        if (junc[record[i].indices[j]].cov > 0) {
-                            int junc_pos = (pos == 1) ? junc[record[i].indices[j]].start : junc[record[i].indices[j]].end;
-                            printf("\t%d:%c:%.0f", junc_pos, junc[record[i].indices[j]].strand, junc[record[i].indices[j]].cov);
+                        if (ctx->junc[record_indices(ctx, i)[j]].cov > 0) {
+                            int junc_pos = (pos == 1) ? ctx->junc[record_indices(ctx, i)[j]].start : ctx->junc[record_indices(ctx, i)[j]].end;
+                            out_printf(ctx, "\t%d:%c:%.0f", junc_pos, ctx->junc[record_indices(ctx, i)[j]].strand, ctx->junc[record_indices(ctx, i)[j]].cov);
                         }
                     }
                 } else {
-                    printf("\t%.2f", drop_arr[record[i].indices[0]].covdiff);
+                    out_printf(ctx, "\t%.2f", ctx->drop_arr[record_indices(ctx, i)[0]].covdiff);
                 }
-                printf("\n");
+                out_printf(ctx, "\n");
             }
         }
     }
@@ -1150,10 +1571,10 @@ static int print_small_bundle(const char *chr, int bundleno, int s, int e) {
     return bundleno;
 }
 
-static int process_records(const char *chr, int bundleno) {
-    int n = record_size;
+static int process_records(Bundle *ctx, const char *chr, int bundleno) {
+    int n = ctx->record_size;
     
-    if (strcmp(record[n - 1].type, "tend") != 0) {
+    if (strcmp(ctx->record[n - 1].type, "tend") != 0) {
         exit(1);
     }
     
@@ -1162,104 +1583,104 @@ static int process_records(const char *chr, int bundleno) {
     int laste = 0;
     int lastjs = 0;
     int lastje = 0;
-    int bundlend = record[0].pos;
+    int bundlend = ctx->record[0].pos;
     int s = 0;
     
     while (i < n) {
-        if (strcmp(record[i].type, "tstart") == 0) {
-            if (record[i].change_perc > 0) {
-                if (lastje && record[i].pos - record[lastje].pos < smallwin && record[lastje].change_perc < 0.5) {
+        if (strcmp(ctx->record[i].type, "tstart") == 0) {
+            if (ctx->record[i].change_perc > 0) {
+                if (lastje && ctx->record[i].pos - ctx->record[lastje].pos < smallwin && ctx->record[lastje].change_perc < 0.5) {
                     int j = i - 1;
-                    while (j >= 0 && (record[j].pos == 0 || record[j].pos == record[i].pos)) {
-                        if (record[i].pos == record[j].pos) {
-                            record[i].pos_cov = 0;
+                    while (j >= 0 && (ctx->record[j].pos == 0 || ctx->record[j].pos == ctx->record[i].pos)) {
+                        if (ctx->record[i].pos == ctx->record[j].pos) {
+                            ctx->record[i].pos_cov = 0;
                             break;
                         }
                         j--;
                     }
-                    record[i].pos = 0;
+                    ctx->record[i].pos = 0;
                 } else {
                     lasts = i;
                 }
             } else {
-                if (record[i - 1].pos == record[i].pos && strcmp(record[i - 1].type, "jend") == 0) {
-                    record[i].pos = 0;
-                    record[i].pos_cov = 0;
-                } else if (record[i].pos > bundlend) {
-                    bundleno = print_small_bundle(chr, bundleno, s, i);
+                if (ctx->record[i - 1].pos == ctx->record[i].pos && strcmp(ctx->record[i - 1].type, "jend") == 0) {
+                    ctx->record[i].pos = 0;
+                    ctx->record[i].pos_cov = 0;
+                } else if (ctx->record[i].pos > bundlend) {
+                    bundleno = print_small_bundle(ctx, chr, bundleno, s, i);
                     s = i;
                 }
             }
-        } else if (strcmp(record[i].type, "tend") == 0) {
-            if (record[i].change_perc > 0) {
-                if (lastjs && record[i].pos - record[lastjs].pos < smallwin && record[lastjs].change_perc < 0.5) {
+        } else if (strcmp(ctx->record[i].type, "tend") == 0) {
+            if (ctx->record[i].change_perc > 0) {
+                if (lastjs && ctx->record[i].pos - ctx->record[lastjs].pos < smallwin && ctx->record[lastjs].change_perc < 0.5) {
                     int j = i - 1;
-                    while (j >= 0 && (record[j].pos == 0 || record[j].pos == record[i].pos)) {
-                        if (record[i].pos == record[j].pos) {
-                            record[i].pos_cov = 0;
+                    while (j >= 0 && (ctx->record[j].pos == 0 || ctx->record[j].pos == ctx->record[i].pos)) {
+                        if (ctx->record[i].pos == ctx->record[j].pos) {
+                            ctx->record[i].pos_cov = 0;
                             break;
                         }
                         j--;
                     }
-                    record[i].pos = 0;
+                    ctx->record[i].pos = 0;
                 } else {
                     laste = i;
                 }
-            } else if (record[i - 1].pos == record[i].pos && strcmp(record[i - 1].type, "jstart") == 0) {
-                record[i].pos = 0;
-                record[i].pos_cov = 0;
+            } else if (ctx->record[i - 1].pos == ctx->record[i].pos && strcmp(ctx->record[i - 1].type, "jstart") == 0) {
+                ctx->record[i].pos = 0;
+                ctx->record[i].pos_cov = 0;
             }
-        } else if (strcmp(record[i].type, "jstart") == 0) {
-            int nj_rec = record[i].num_indices;
+        } else if (strcmp(ctx->record[i].type, "jstart") == 0) {
+            int nj_rec = ctx->record[i].num_indices;
             int found_valid = 0;
             for (int j = 0; j < nj_rec; j++) {
-                if (junc[record[i].indices[j]].cov > 0) {
+                if (ctx->junc[record_indices(ctx, i)[j]].cov > 0) {
                     found_valid = 1;
-                    if (junc[record[i].indices[j]].end > bundlend) {
-                        bundlend = junc[record[i].indices[j]].end;
+                    if (ctx->junc[record_indices(ctx, i)[j]].end > bundlend) {
+                        bundlend = ctx->junc[record_indices(ctx, i)[j]].end;
                     }
                 }
             }
             if (found_valid) {
-                if (record[i].change_perc < 0.5 && laste && record[i].pos - record[laste].pos < smallwin) {
+                if (ctx->record[i].change_perc < 0.5 && laste && ctx->record[i].pos - ctx->record[laste].pos < smallwin) {
                     int j = laste - 1;
-                    while (j >= 0 && (record[j].pos == 0 || record[j].pos == record[laste].pos)) {
-                        if (record[laste].pos == record[j].pos) {
-                            record[laste].pos_cov = 0;
+                    while (j >= 0 && (ctx->record[j].pos == 0 || ctx->record[j].pos == ctx->record[laste].pos)) {
+                        if (ctx->record[laste].pos == ctx->record[j].pos) {
+                            ctx->record[laste].pos_cov = 0;
                             break;
                         }
                         j--;
                     }
-                    record[laste].pos = 0;
+                    ctx->record[laste].pos = 0;
                     laste = 0;
                 }
                 lastjs = i;
             } else {
                 int j = i - 1;
-                while (j >= 0 && (record[j].pos == 0 || record[j].pos == record[i].pos)) {
-                    if (record[i].pos == record[j].pos) {
-                        record[i].pos_cov = 0;
+                while (j >= 0 && (ctx->record[j].pos == 0 || ctx->record[j].pos == ctx->record[i].pos)) {
+                    if (ctx->record[i].pos == ctx->record[j].pos) {
+                        ctx->record[i].pos_cov = 0;
                         break;
                     }
                     j--;
                 }
-                record[i].pos = 0;
+                ctx->record[i].pos = 0;
             }
         } else {
-            int nj_rec = record[i].num_indices;
+            int nj_rec = ctx->record[i].num_indices;
             int found_valid = 0;
             for (int j = 0; j < nj_rec; j++) {
-                if (junc[record[i].indices[j]].cov > 0) {
-                    if (record[i].change_perc < 0.5 && lasts && record[i].pos - record[lasts].pos < smallwin) {
+                if (ctx->junc[record_indices(ctx, i)[j]].cov > 0) {
+                    if (ctx->record[i].change_perc < 0.5 && lasts && ctx->record[i].pos - ctx->record[lasts].pos < smallwin) {
                         int k = lasts - 1;
-                        while (k >= 0 && (record[k].pos == 0 || record[k].pos == record[lasts].pos)) {
-                            if (record[lasts].pos == record[k].pos) {
-                                record[lasts].pos_cov = 0;
+                        while (k >= 0 && (ctx->record[k].pos == 0 || ctx->record[k].pos == ctx->record[lasts].pos)) {
+                            if (ctx->record[lasts].pos == ctx->record[k].pos) {
+                                ctx->record[lasts].pos_cov = 0;
                                 break;
                             }
                             k--;
                         }
-                        record[lasts].pos = 0;
+                        ctx->record[lasts].pos = 0;
                         lasts = 0;
                     }
                     lastje = i;
@@ -1268,19 +1689,19 @@ static int process_records(const char *chr, int bundleno) {
                 }
             }
             if (!found_valid) {
-                record[i].pos = 0;
+                ctx->record[i].pos = 0;
             }
         }
         i++;
     }
     
-    bundleno = print_small_bundle(chr, bundleno, s, i);
+    bundleno = print_small_bundle(ctx, chr, bundleno, s, i);
     
     return bundleno;
 }
 
-static int process_bundle(const char *chr, int bundleno) {
-    int nb = covg_size;
+static int process_bundle(Bundle *ctx, const char *chr, int bundleno) {
+    int nb = ctx->covg_size;
     if (nb == 0) return bundleno;
     
     double avg = 0;
@@ -1300,9 +1721,9 @@ static int process_bundle(const char *chr, int bundleno) {
     double runavg = 0;
     
     for (int i = 0; i < nb; i++) {
-        if (covg[i].start - 1 > preve) {
+        if (ctx->covg[i].start - 1 > preve) {
             if (!seengoodavg && runavg > 0 && s_size > 0) {
-                double region_len = covg[s_arr[s_size - 1].ei].end - covg[s_arr[s_size - 1].si].start + 1;
+                double region_len = ctx->covg[s_arr[s_size - 1].ei].end - ctx->covg[s_arr[s_size - 1].si].start + 1;
                 if (runavg / region_len > lowcov) seengoodavg = 1;
             }
             runavg = 0;
@@ -1316,40 +1737,36 @@ static int process_bundle(const char *chr, int bundleno) {
         }
         
         s_arr[s_size - 1].ei = i;
-        preve = covg[i].end;
-        int clen = covg[i].end - covg[i].start + 1;
-        avg += covg[i].cov * clen;
-        if (!seengoodavg) runavg += covg[i].cov * clen;
+        preve = ctx->covg[i].end;
+        int clen = ctx->covg[i].end - ctx->covg[i].start + 1;
+        avg += ctx->covg[i].cov * clen;
+        if (!seengoodavg) runavg += ctx->covg[i].cov * clen;
         len += clen;
     }
     
     avg /= len;
     if (runavg > 0 && s_size > 0) {
-        double region_len = covg[s_arr[s_size - 1].ei].end - covg[s_arr[s_size - 1].si].start + 1;
+        double region_len = ctx->covg[s_arr[s_size - 1].ei].end - ctx->covg[s_arr[s_size - 1].si].start + 1;
         if (runavg / region_len > lowcov) seengoodavg = 1;
     }
     
     if (len > win && seengoodavg) {
-        int nj = junc_size;
-        sort_jend(nj);
+        int nj = ctx->junc_size;
+        sort_jend(ctx, nj);
         
-        process_junctions(nj);
+        process_junctions(ctx, nj);
         
-        clear_drop();
+        clear_drop(ctx);
         
         int js = 0;
         int je = 0;
         for (int i = 0; i < s_size; i++) {
-            get_drop(s_arr[i].si, s_arr[i].ei, nb, &js, &je, js, je, nj);
+            get_drop(ctx, s_arr[i].si, s_arr[i].ei, nb, &js, &je, js, je, nj);
         }
         
-        int nd = drop_size - 1;
+        int nd = ctx->drop_size - 1;
         
-        // Clear records
-        for (int i = 0; i < record_size; i++) {
-            free(record[i].indices);
-        }
-        record_size = 0;
+        clear_record(ctx);
         
         int ib = 0;
         int id = 0;
@@ -1357,101 +1774,77 @@ static int process_bundle(const char *chr, int bundleno) {
         je = 0;
         
         int idx0 = 0;
-        push_record("tstart", covg[0].start, &idx0, 1, 0, covg[0].cov, 0);
+        push_record(ctx, "tstart", ctx->covg[0].start, &idx0, 1, 0, ctx->covg[0].cov, 0);
         id++;
         
-        int prevpos = covg[0].start;
+        int prevpos = ctx->covg[0].start;
         
         while (id < nd || js < nj || je < nj) {
-            get_record(&ib, &id, &js, &je, &prevpos, nb, nd, nj, chr);
+            get_record(ctx, &ib, &id, &js, &je, &prevpos, nb, nd, nj, chr);
         }
         
-        if (covg[nb - 1].end > prevpos + 1) {
+        if (ctx->covg[nb - 1].end > prevpos + 1) {
             int tmpib = ib;
-            double avgcov = get_cov(prevpos + 1, covg[nb - 1].end - 1, &tmpib, nb);
-            record[record_size - 1].cov_to_next += avgcov;
+            double avgcov = get_cov(ctx, prevpos + 1, ctx->covg[nb - 1].end - 1, &tmpib, nb);
+            ctx->record[ctx->record_size - 1].cov_to_next += avgcov;
         }
         
         int idx_nd = nd;
-        push_record("tend", covg[nb - 1].end, &idx_nd, 1, 0, covg[nb - 1].cov, 0);
+        push_record(ctx, "tend", ctx->covg[nb - 1].end, &idx_nd, 1, 0, ctx->covg[nb - 1].cov, 0);
         
-        bundleno = process_records(chr, bundleno);
+        bundleno = process_records(ctx, chr, bundleno);
     }
     
     free(s_arr);
-    clear_covg();
-    clear_junc();
+    clear_covg(ctx);
+    clear_junc(ctx);
     
     return bundleno;
 }
 
-static int add_procjunc_to_bundle(int *bundleend, const char *chr) {
-    int nj = unprocjunc_size;
-    
-    if (nj == 0) return 1;
-    
-    int j = 0;
-    while (j < nj) {
-        if (strcmp(unprocjunc[j].chrname, chr) != 0 || unprocjunc[j].start > *bundleend) {
-            if (j > 0) {
-                for (int i = 0; i < j; i++) {
-                    push_junc_main(unprocjunc[i].chrname, unprocjunc[i].start, unprocjunc[i].end,
-                                   unprocjunc[i].cov, unprocjunc[i].strand, unprocjunc[i].ps);
-                }
-                // Shift remaining
-                for (int i = j; i < nj; i++) {
-                    unprocjunc[i - j] = unprocjunc[i];
-                }
-                unprocjunc_size -= j;
-            }
-            return 0;
-        }
-        if (unprocjunc[j].end > *bundleend) {
-            *bundleend = unprocjunc[j].end;
+// Move the pending junctions that fall into the bundle over to it; 0 if
+// some are still pending (no new junctions are read then)
+static int add_procjunc_to_bundle(Reader *rd, Bundle *ctx, int *bundleend, int chrom) {
+    while (rd->unprocjunc_head < rd->unprocjunc_size) {
+        const JuncEntry *j = &rd->unprocjunc[rd->unprocjunc_head];
+        if (chrom_passed(&rd->chroms, j->chrom, chrom)) {
+            rd->unprocjunc_head++;
+            continue;
         }
-        j++;
-    }
-    
-    if (j > 0) {
-        for (int i = 0; i < j; i++) {
-            push_junc_main(unprocjunc[i].chrname, unprocjunc[i].start, unprocjunc[i].end,
-                           unprocjunc[i].cov, unprocjunc[i].strand, unprocjunc[i].ps);
+        if (j->chrom != chrom || j->start > *bundleend) return 0;
+        if (j->end > *bundleend) {
+            *bundleend = j->end;
         }
-        unprocjunc_size = 0;
+        push_junc(&ctx->junc, &ctx->junc_size, &ctx->junc_cap, j);
+        rd->unprocjunc_head++;
     }
+    rd->unprocjunc_head = 0;
+    rd->unprocjunc_size = 0;
     return 1;
 }
 
-static int add_junc_to_bundle(const char *chr, int bundleend, FILE *fJ) {
-    char line[4096];
+static int add_junc_to_bundle(Reader *rd, Bundle *ctx, int chrom, int bundleend) {
+    const char *line;
+    const char *line_end;
     
-    while (fgets(line, sizeof(line), fJ)) {
+    while (next_line(rd->fJ, &line, &line_end)) {
         char chrname[256];
         int start, end;
-        char name[256];
         double cov_val;
         char strand;
-        char percs[256];
-        
-        // Parse line
-        char strand_str[8];
-        if (sscanf(line, "%255s\t%d\t%d\t%255s\t%lf\t%7s\t%255s",
-                   chrname, &start, &end, name, &cov_val, strand_str, percs) != 7) {
-            continue;
-        }
-        strand = strand_str[0];
-        
-        // Parse percentages
         double ps, po, pl, pr;
-        if (sscanf(percs, "%lf-%lf-%lf-%lf", &ps, &po, &pl, &pr) != 4) {
+        
+        if (!parse_junc_line(line, line_end, chrname, &start, &end, &cov_val, &strand, &ps, &po, &pl, &pr)) {
             continue;
         }
         
         double d = (ps < po) ? ps : po;
         double p = (pl < pr) ? pl : pr;
         
+        JuncEntry j = {start, end, cov_val, intern_chrom(&rd->chroms, chrname), strand};
+        if (chrom_passed(&rd->chroms, j.chrom, chrom)) continue;
         int last = 0;
-        if (strcmp(chrname, chr) != 0 || start > bundleend) {
+        if (j.chrom != chrom || start > bundleend) {
             last = 1;
         }
         
@@ -1461,14 +1854,14 @@ static int add_junc_to_bundle(const char *chr, int bundleend, FILE *fJ) {
             if ((cov_val > highcov && strand != '.') || 
                 (p > splicenoise && (d > splicenoise || (d > highnoise && cov_val > smallcov && strand != '.')))) {
                 
-                end++;  // Adjust end
+                j.end++;  // Adjust end
                 if (!last) {
-                    if (end > bundleend) {
-                        bundleend = end;
+                    if (j.end > bundleend) {
+                        bundleend = j.end;
                     }
-                    push_junc_main(chrname, start, end, cov_val, strand, ps);
+                    push_junc(&ctx->junc, &ctx->junc_size, &ctx->junc_cap, &j);
                 } else {
-                    push_unprocjunc(chrname, start, end, cov_val, strand, ps);
+                    push_junc(&rd->unprocjunc, &rd->unprocjunc_size, &rd->unprocjunc_cap, &j);
                 }
             }
         }
@@ -1479,83 +1872,229 @@ static int add_junc_to_bundle(const char *chr, int bundleend, FILE *fJ) {
     return bundleend;
 }
 
+// Bundles are handed from the reader to the workers through a ring of
+// slots; finished bundles are printed strictly in the order they were read.
+enum { SLOT_FREE, SLOT_FILLING, SLOT_QUEUED, SLOT_DONE };
+
+typedef struct {
+    Bundle *slots;
+    int *state;
+    int nslots;
+    long nfilled;   // bundles handed over by the reader
+    long nstarted;  // bundles taken by a worker
+    long nwritten;  // bundles printed
+    int eof;
+    int bundleno;
+    int nthreads;
+    pthread_t *threads;
+    pthread_mutex_t lock;
+    pthread_cond_t has_work;
+    pthread_cond_t has_free;
+} Pool;
+
+// Print the finished bundles that are next in line; called with the lock held
+static void flush_done(Pool *pool) {
+    while (pool->nwritten < pool->nfilled && pool->state[pool->nwritten % pool->nslots] == SLOT_DONE) {
+        int slot = pool->nwritten % pool->nslots;
+        write_bundle(&pool->slots[slot], &pool->bundleno, stdout);
+        pool->state[slot] = SLOT_FREE;
+        pool->nwritten++;
+        pthread_cond_broadcast(&pool->has_free);
+    }
+}
+
+static void *worker_main(void *arg) {
+    Pool *pool = arg;
+    pthread_mutex_lock(&pool->lock);
+    for (;;) {
+        while (pool->nstarted == pool->nfilled && !pool->eof) {
+            pthread_cond_wait(&pool->has_work, &pool->lock);
+        }
+        if (pool->nstarted == pool->nfilled) break;
+        int slot = pool->nstarted++ % pool->nslots;
+        pthread_mutex_unlock(&pool->lock);
+
+        Bundle *ctx = &pool->slots[slot];
+        process_bundle(ctx, ctx->chr, 0);
+
+        pthread_mutex_lock(&pool->lock);
+        pool->state[slot] = SLOT_DONE;
+        flush_done(pool);
+    }
+    pthread_mutex_unlock(&pool->lock);
+    return NULL;
+}
+
+// With nthreads <= 1 bundles are processed on the reading thread
+static void start_pool(Pool *pool, int nthreads) {
+    memset(pool, 0, sizeof(*pool));
+    pool->nthreads = nthreads > 1 ? nthreads : 0;
+    pool->nslots = pool->nthreads ? 4 * pool->nthreads : 1;
+    pool->slots = calloc(pool->nslots, sizeof(Bundle));
+    pool->state = calloc(pool->nslots, sizeof(int));
+    pthread_mutex_init(&pool->lock, NULL);
+    pthread_cond_init(&pool->has_work, NULL);
+    pthread_cond_init(&pool->has_free, NULL);
+    pool->threads = calloc(pool->nthreads ? pool->nthreads : 1, sizeof(pthread_t));
+    for (int i = 0; i < pool->nthreads; i++) {
+        if (pthread_create(&pool->threads[i], NULL, worker_main, pool) != 0) {
+            fprintf(stderr, "Cannot start worker thread\n");
+            exit(1);
+        }
+    }
+}
+
+// Next free bundle for the reader to fill
+static Bundle *get_bundle(Pool *pool) {
+    int slot = pool->nfilled % pool->nslots;
+    pthread_mutex_lock(&pool->lock);
+    while (pool->state[slot] != SLOT_FREE) {
+        pthread_cond_wait(&pool->has_free, &pool->lock);
+    }
+    pool->state[slot] = SLOT_FILLING;
+    pthread_mutex_unlock(&pool->lock);
+    return &pool->slots[slot];
+}
+
+static void submit_bundle(Pool *pool, Bundle *ctx, const char *chr) {
+    strcpy(ctx->chr, chr);
+    if (!pool->nthreads) {
+        process_bundle(ctx, ctx->chr, 0);
+        write_bundle(ctx, &pool->bundleno, stdout);
+        pool->state[0] = SLOT_FREE;
+        pool->nfilled++;
+        pool->nwritten++;
+        return;
+    }
+    pthread_mutex_lock(&pool->lock);
+    pool->state[ctx - pool->slots] = SLOT_QUEUED;
+    pool->nfilled++;
+    pthread_cond_signal(&pool->has_work);
+    pthread_mutex_unlock(&pool->lock);
+}
+
+static void finish_pool(Pool *pool) {
+    pthread_mutex_lock(&pool->lock);
+    pool->eof = 1;
+    pthread_cond_broadcast(&pool->has_work);
+    pthread_mutex_unlock(&pool->lock);
+    for (int i = 0; i < pool->nthreads; i++) {
+        pthread_join(pool->threads[i], NULL);
+    }
+    for (int i = 0; i < pool->nslots; i++) {
+        free_bundle(&pool->slots[i]);
+    }
+    free(pool->slots);
+    free(pool->state);
+    free(pool->threads);
+    pthread_mutex_destroy(&pool->lock);
+    pthread_cond_destroy(&pool->has_work);
+    pthread_cond_destroy(&pool->has_free);
+}
+
+static void usage(const char *prog) {
+    fprintf(stderr, "Usage: %s [-t threads] <coverage.bedgraph[.gz]|-> <junctions.bed[.gz]|->\n", prog);
+}
+
 int main(int argc, char *argv[]) {
-    if (argc != 3) {
-        fprintf(stderr, "Usage: %s <coverage.bedgraph> <junctions.bed>\n", argv[0]);
+    int nthreads = 1;
+    int opt;
+    while ((opt = getopt(argc, argv, "t:")) != -1) {
+        if (opt == 't') {
+            char *endp;
+            long v = strtol(optarg, &endp, 10);
+            if (*endp || v < 1 || v > 1024) {
+                fprintf(stderr, "-t must be a positive integer, got '%s'\n", optarg);
+                return 1;
+            }
+            nthreads = (int)v;
+        } else {
+            usage(argv[0]);
+            return 1;
+        }
+    }
+    if (argc - optind != 2) {
+        usage(argv[0]);
         return 1;
     }
     
-    const char *covfile = argv[1];
-    const char *juncfile = argv[2];
+    const char *covfile = argv[optind];
+    const char *juncfile = argv[optind + 1];
+    if (strcmp(covfile, "-") == 0 && strcmp(juncfile, "-") == 0) {
+        fprintf(stderr, "Only one of the inputs can be read from stdin\n");
+        return 1;
+    }
     
-    FILE *C = fopen(covfile, "r");
+    // Plain or gzip/bgzip-compressed inputs; "-" reads standard input
+    LineReader *C = open_lines(covfile);
     if (!C) {
         fprintf(stderr, "Cannot open coverage file: %s\n", covfile);
         return 1;
     }
     
-    FILE *fJ = fopen(juncfile, "r");
-    if (!fJ) {
+    Reader rd = {0};
+    rd.fJ = open_lines(juncfile);
+    if (!rd.fJ) {
         fprintf(stderr, "Cannot open junction file: %s\n", juncfile);
-        fclose(C);
+        close_lines(C);
         return 1;
     }
     
     // Skip first lines (track lines)
-    char line[4096];
-    fgets(line, sizeof(line), C);
-    fgets(line, sizeof(line), fJ);
+    const char *line;
+    const char *line_end;
+    next_line(C, &line, &line_end);
+    next_line(rd.fJ, &line, &line_end);
+    
+    Pool pool;
+    start_pool(&pool, nthreads);
+    Bundle *ctx = get_bundle(&pool);
     
-    int bundleno = 0;
     char chr[256] = "";
+    int chrom = -1;
     int bundleend = 0;
     
-    while (fgets(line, sizeof(line), C)) {
+    while (next_line(C, &line, &line_end)) {
         char chrname[256];
         int start, end;
         double cov_val;
         
-        if (sscanf(line, "%255s\t%d\t%d\t%lf", chrname, &start, &end, &cov_val) != 4) {
+        if (!parse_cov_line(line, line_end, chrname, &start, &end, &cov_val)) {
             continue;
         }
         start++;  // Adjust to 1-based
         
         if (start > bundleend + 1 || strcmp(chrname, chr) != 0) {
-            bundleno = process_bundle(chr, bundleno);
+            submit_bundle(&pool, ctx, chr);
+            ctx = get_bundle(&pool);
             if (strcmp(chr, chrname) != 0) {
                 strncpy(chr, chrname, 255);
                 chr[255] = '\0';
+                chrom = intern_chrom(&rd.chroms, chr);
                 fprintf(stderr, "Finding %s TSS/TES candidates\n", chr);
             }
             bundleend = 0;
         }
         
         if (end > bundleend) bundleend = end;
-        push_covg(start, end, cov_val);
+        push_covg(ctx, start, end, cov_val);
         
-        int toadd = add_procjunc_to_bundle(&bundleend, chr);
+        int toadd = add_procjunc_to_bundle(&rd, ctx, &bundleend, chrom);
         
         if (toadd) {
-            bundleend = add_junc_to_bundle(chr, bundleend, fJ);
+            bundleend = add_junc_to_bundle(&rd, ctx, chrom, bundleend);
         }
     }
     
-    fclose(C);
-    fclose(fJ);
+    close_lines(C);
+    close_lines(rd.fJ);
     
     // Process last bundle
-    bundleno = process_bundle(chr, bundleno);
+    submit_bundle(&pool, ctx, chr);
+    finish_pool(&pool);
     
-    // Cleanup
-    free(covg);
-    free(junc);
-    free(unprocjunc);
-    free(drop_arr);
-    for (int i = 0; i < record_size; i++) {
-        free(record[i].indices);
-    }
-    free(record);
-    free(jend);
+    free(rd.unprocjunc);
+    free_chroms(&rd.chroms);
     
     return 0;
-}
\ No newline at end of file
+}
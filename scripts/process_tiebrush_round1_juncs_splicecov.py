@@ -3,8 +3,11 @@ import sys
 import pyBigWig
 import numpy as np
 
+from coverage_cache import open_coverage
+
 SMALL_DELTA = 5   # for left/right mean windows
 W = 50            # for smoothness window (±W around pos)
+BLOCK = 1 << 22   # coverage fetched per chromosome block for the batched path
 
 def window_vals(bw, chrom, pos, chrom_len, w=W):
     """Return coverage array for [pos-w, pos+w] ∩ [0, chrom_len), and index of pos within it."""
@@ -90,9 +93,123 @@ def smoothness_from_window(arr, center, which):
     part = np.partition(a, idx)
     return float(part[idx])
 
+def side_metrics(bw, chrom, pos, chrom_len, strand, which, small_delta=SMALL_DELTA, w=W):
+    """
+    Round-1 features for one side of a junction ('JSTART' or 'JEND').
+    Returns (perc_change, abs_change, smoothness_metric, cov_change_dir).
+    """
+    arr, center, _, _ = window_vals(bw, chrom, pos, chrom_len, w)
+    _, lmean, rmean, perc_change, abs_change = left_right_means(arr, center, strand, small_delta)
+    second = smoothness_from_window(arr, center, which)
+    # NOTE: your original 'smoothness_metric = abs(change_at_pos)/second_largest or abs(change_at_pos)'
+    # here change_at_pos ~ abs_change (magnitude difference across sides near junction)
+    smooth = abs_change if second == 0.0 else abs(abs_change / second)
+
+    # your original directional flag logic:
+    if which == 'JSTART':
+        flag = (strand == "+" and (rmean - lmean) < 0) or (strand == "-" and (rmean - lmean) > 0)
+    else:
+        flag = (strand == "+" and (rmean - lmean) > 0) or (strand == "-" and (rmean - lmean) < 0)
+    return perc_change, abs_change, smooth, 1 if flag else 0
+
+def block_values(bw, chrom, start, end):
+    """Coverage of [start, end) as one contiguous float32 array, NaN -> 0 (as window_vals)."""
+    if pyBigWig.numpy:
+        arr = np.asarray(bw.values(chrom, start, end, numpy=True), dtype=np.float32)
+    else:
+        arr = np.array(bw.values(chrom, start, end), dtype=np.float32)
+    np.nan_to_num(arr, copy=False)
+    return arr
+
+def _mean_cols(m):
+    """Row means of a float32 matrix with np.mean's float32 semantics for short rows (sequential sum / n)."""
+    acc = np.zeros(m.shape[0], dtype=np.float32)
+    for j in range(m.shape[1]):
+        acc += m[:, j]
+    return (acc / np.float32(m.shape[1])).astype(np.float64)
+
+def _window_metrics(win, strands, which, small_delta, w):
+    """side_metrics over a (n, 2w+1) matrix of full windows centred on the positions."""
+    plus, minus = strands == '+', strands == '-'
+    lmean = _mean_cols(win[:, w - small_delta:w])
+    rmean = _mean_cols(win[:, w + 1:w + 1 + small_delta])
+    lmean, rmean = np.where(minus, rmean, lmean), np.where(minus, lmean, rmean)
+
+    both_zero = (lmean == 0.0) & (rmean == 0.0)
+    lm = np.where((lmean == 0.0) & (rmean != 0.0), 0.5, lmean)
+    rm = np.where((rmean == 0.0) & (lmean != 0.0), 0.5, rmean)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.maximum(lm, rm) / np.minimum(lm, rm)
+        perc_change = np.where(both_zero, 0.0, 1.0 - np.minimum(ratio, 1.0 / ratio))
+    abs_change = np.abs(rmean - lmean)
+
+    if which == 'JSTART':
+        others = np.diff(win[:, w:2 * w + 1], axis=1)[:, 1:]
+    else:
+        others = np.diff(win[:, 0:w + 1], axis=1)[:, :-1]
+    second = np.partition(np.abs(others), -2, axis=1)[:, -2].astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        smooth = np.where(second == 0.0, abs_change, np.abs(abs_change / second))
+
+    change = rmean - lmean
+    if which == 'JSTART':
+        flag = (plus & (change < 0)) | (minus & (change > 0))
+    else:
+        flag = (plus & (change > 0)) | (minus & (change < 0))
+    return perc_change, abs_change, smooth, flag.astype(np.int64)
+
+def chrom_side_metrics(bw, chrom, positions, strands, chrom_len, which, small_delta=SMALL_DELTA, w=W, block=BLOCK):
+    """
+    Batched side_metrics for many positions of one chromosome. Coverage is
+    read once per `block` bases; positions whose ±w window is clipped by
+    the chromosome ends go through the scalar side_metrics.
+    Returns four arrays (perc_change, abs_change, smooth, cov_change_dir).
+    """
+    pos = np.asarray(positions, dtype=np.int64)
+    strands = np.asarray(strands, dtype=object)
+    n = pos.size
+    perc, absc, smooth = np.zeros(n), np.zeros(n), np.zeros(n)
+    flag = np.zeros(n, dtype=np.int64)
+
+    interior = (pos >= w) & (pos + w + 1 <= chrom_len)
+    for i in np.flatnonzero(~interior):
+        perc[i], absc[i], smooth[i], flag[i] = side_metrics(bw, chrom, int(pos[i]), chrom_len, strands[i], which, small_delta, w)
+
+    idx = np.flatnonzero(interior)
+    idx = idx[np.argsort(pos[idx], kind='stable')]
+    offsets = np.arange(-w, w + 1)
+    for grp in np.split(idx, np.flatnonzero(np.diff(pos[idx] // block)) + 1):
+        if grp.size == 0:
+            continue
+        lo = int(pos[grp[0]]) - w
+        vals = block_values(bw, chrom, lo, int(pos[grp[-1]]) + w + 1)
+        win = vals[(pos[grp] - lo)[:, None] + offsets]
+        perc[grp], absc[grp], smooth[grp], flag[grp] = _window_metrics(win, strands[grp], which, small_delta, w)
+    return perc, absc, smooth, flag
+
+
+def _write_run(bw, chrom, recs, chrom_len, small_delta, w):
+    """Batched features and output lines for a run of junctions on one chromosome."""
+    if chrom_len is None:
+        for _ in recs:
+            print(f"Chromosome {chrom} not found in BigWig file.", file=sys.stderr)
+        return
+    strands = [r[4] for r in recs]
+    sides = (chrom_side_metrics(bw, chrom, [r[0] for r in recs], strands, chrom_len, 'JSTART', small_delta, w),
+             chrom_side_metrics(bw, chrom, [r[1] for r in recs], strands, chrom_len, 'JEND', small_delta, w))
+    out = []
+    for i, (start, end, name, cov, strand, percs) in enumerate(recs):
+        jlen = end - start
+        for (pc, abschg, sm, enc), pos, which in zip(sides, (start, end + 1), ('JSTART', 'JEND')):
+            out.append(
+                f"{chrom}\t{pos}\t{name}\t{cov}\t{strand}\t{percs}\t{jlen}"
+                f"\t{pc[i]:.4f}\t{abs(abschg[i]):.0f}\t{sm[i]:.4f}\t{enc[i]}\t{which}\n"
+            )
+    sys.stdout.writelines(out)
+
 def process_junctions(bw_file, junc_file, small_delta=SMALL_DELTA, w=W):
     try:
-        bw = pyBigWig.open(bw_file)
+        bw = open_coverage(bw_file)
     except Exception as e:
         print(f"Error opening BigWig file '{bw_file}': {e}", file=sys.stderr)
         sys.exit(1)
@@ -104,6 +221,7 @@ def process_junctions(bw_file, junc_file, small_delta=SMALL_DELTA, w=W):
         print(f"Error reading chrom sizes: {e}", file=sys.stderr)
         sys.exit(1)
 
+    cur_chr, recs = None, []
     try:
         with open(junc_file, 'r') as jf:
             for line in jf:
@@ -122,45 +240,15 @@ def process_junctions(bw_file, junc_file, small_delta=SMALL_DELTA, w=W):
                     print(f"Warning: Non-integer values found in line: {line.strip()}", file=sys.stderr)
                     continue
 
-                chrom_len = chrom_len_map.get(chrom)
-                if chrom_len is None:
-                    print(f"Chromosome {chrom} not found in BigWig file.", file=sys.stderr)
-                    continue
+                # junctions are batched per run of the same chromosome
+                if recs and chrom != cur_chr:
+                    _write_run(bw, cur_chr, recs, chrom_len_map.get(cur_chr), small_delta, w)
+                    recs = []
+                cur_chr = chrom
+                recs.append((start, end, name, cov, strand, percs))
 
-                jlen = end - start
-
-                # ------- START side -------
-                arrS, cS, _, _ = window_vals(bw, chrom, start, chrom_len, w)
-                cov_pos_S, lS, rS, pcS, abschgS = left_right_means(arrS, cS, strand, small_delta)
-                secS = smoothness_from_window(arrS, cS, 'JSTART')
-                # NOTE: your original 'smoothness_metric = abs(change_at_pos)/second_largest or abs(change_at_pos)'
-                # here change_at_pos ~ abschgS (magnitude difference across sides near junction)
-                smS = abschgS if secS == 0.0 else abs(abschgS / secS)
-
-                # your original directional flag logic:
-                jstart_flag = "TRUE" if ((strand == "+" and (rS - lS) < 0) or
-                                          (strand == "-" and (rS - lS) > 0)) else "FALSE"
-                encS = 1 if jstart_flag == "TRUE" else 0
-
-                sys.stdout.write(
-                    f"{chrom}\t{start}\t{name}\t{cov}\t{strand}\t{percs}\t{jlen}"
-                    f"\t{pcS:.4f}\t{abs(abschgS):.0f}\t{smS:.4f}\t{encS}\tJSTART\n"
-                )
-
-                # ------- END side -------
-                arrE, cE, _, _ = window_vals(bw, chrom, end, chrom_len, w)
-                cov_pos_E, lE, rE, pcE, abschgE = left_right_means(arrE, cE, strand, small_delta)
-                secE = smoothness_from_window(arrE, cE, 'JEND')
-                smE = abschgE if secE == 0.0 else abs(abschgE / secE)
-
-                jend_flag = "TRUE" if ((strand == "+" and (rE - lE) > 0) or
-                                        (strand == "-" and (rE - lE) < 0)) else "FALSE"
-                encE = 1 if jend_flag == "TRUE" else 0
-
-                sys.stdout.write(
-                    f"{chrom}\t{end+1}\t{name}\t{cov}\t{strand}\t{percs}\t{jlen}"
-                    f"\t{pcE:.4f}\t{abs(abschgE):.0f}\t{smE:.4f}\t{encE}\tJEND\n"
-                )
+            if recs:
+                _write_run(bw, cur_chr, recs, chrom_len_map.get(cur_chr), small_delta, w)
 
     except FileNotFoundError:
         print(f"Error: Junctions file '{junc_file}' not found.", file=sys.stderr)
@@ -169,6 +257,7 @@ def process_junctions(bw_file, junc_file, small_delta=SMALL_DELTA, w=W):
         print(f"Error processing junctions file: {e}", file=sys.stderr)
         sys.exit(1)
     finally:
+        print(bw.report(), file=sys.stderr)
         try:
             bw.close()
         except Exception:
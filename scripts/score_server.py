@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Long-lived scoring server for back-to-back runs.
+
+Loads the model_output boosters (junction, TSS, CPAS) and their encoders
+once and evaluates feature batches sent over a Unix socket, so each run
+skips the lightgbm/sklearn imports and model parsing. LightGBM_no_normscale.py
+and LightGBM_tss.py use a running server automatically when it serves the
+same model and encoder files (see remote_models()), and load the models
+themselves otherwise; scores are identical either way.
+
+Protocol: one request per connection. The client sends a JSON header line;
+"predict" is followed by rows*cols little-endian float64 values. The reply
+is a JSON line ({"ok": false, "error": ...} on failure); "predict" replies
+are followed by rows float64 values.
+
+  {"op": "info"}                                 -> models, files, encoders
+  {"op": "predict", "model", "rows", "cols", "num_iteration"}
+  {"op": "encode", "model", "values": [...]}     -> {"codes": [...]} (value8)
+  {"op": "stop"}
+
+The socket is $SPLICECOV_SCORE_SOCKET, or splicecov-score.sock in a
+directory only the user can reach: $XDG_RUNTIME_DIR, else a 0700
+splicecov-<uid> directory in the temp directory. The socket is created
+0600, and clients only connect to a socket owned by their own uid.
+
+Usage:
+  score_server.py serve [--socket PATH] [--model-dir DIR]
+  score_server.py status|stop [--socket PATH]
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+F8 = np.dtype("<f8")
+
+
+def socket_dir():
+    """Per-user directory of the default socket."""
+    run = os.environ.get("XDG_RUNTIME_DIR")
+    if run and os.path.isdir(run):
+        return run
+    return os.path.join(tempfile.gettempdir(), f"splicecov-{os.getuid()}")
+
+
+def default_socket():
+    return os.environ.get("SPLICECOV_SCORE_SOCKET") or os.path.join(socket_dir(), "splicecov-score.sock")
+
+
+def check_private_dir(path):
+    """PermissionError unless `path` is a directory owned by this user with no group/other access."""
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(f"{path} is not a private directory of uid {os.getuid()}")
+
+
+def check_socket(sock_path):
+    """PermissionError unless `sock_path` is a socket owned by this user (OSError if missing)."""
+    st = os.stat(sock_path)
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(f"{sock_path} is not a socket owned by uid {os.getuid()}")
+
+
+def file_id(path):
+    """(real path, size, mtime) identifying a model/encoder file, None if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.realpath(path), st.st_size, st.st_mtime_ns]
+
+
+# -- client ------------------------------------------------------------------
+def _read_exact(f, n):
+    buf = f.read(n)
+    if len(buf) != n:
+        raise ConnectionError("scoring server closed the connection")
+    return buf
+
+
+def request(header, payload=b"", sock_path=None):
+    """Send one request; returns (reply header, reply payload bytes)."""
+    sock_path = sock_path or default_socket()
+    check_socket(sock_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(sock_path)
+        s.sendall(json.dumps(header).encode() + b"\n" + payload)
+        with s.makefile("rb") as f:
+            reply = json.loads(f.readline() or b"null")
+            if not reply or not reply.get("ok"):
+                raise RuntimeError((reply or {}).get("error", "no reply from scoring server"))
+            body = _read_exact(f, reply.get("rows", 0) * F8.itemsize) if header.get("op") == "predict" else b""
+    return reply, body
+
+
+class RemoteBooster:
+    """Stand-in for lgb.Booster whose predict() runs on the scoring server."""
+
+    def __init__(self, sock_path, name, best_iteration):
+        self.sock_path = sock_path
+        self.name = name
+        self.best_iteration = best_iteration
+
+    def predict(self, X, num_iteration=None):
+        data = np.ascontiguousarray(np.asarray(X, dtype=np.float64), dtype=F8)
+        if data.ndim != 2:
+            raise ValueError("predict expects a 2-D feature matrix")
+        header = {"op": "predict", "model": self.name, "rows": data.shape[0],
+                  "cols": data.shape[1], "num_iteration": num_iteration}
+        _, body = request(header, data.tobytes(), self.sock_path)
+        return np.frombuffer(body, dtype=F8).astype(np.float64)
+
+
+class RemoteLabelEncoder:
+    """Stand-in for the TSS/CPAS value8 LabelEncoder; transform() runs on the server."""
+
+    def __init__(self, sock_path, name):
+        self.sock_path = sock_path
+        self.name = name
+
+    def transform(self, values):
+        uniq, inverse = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+        reply, _ = request({"op": "encode", "model": self.name, "values": uniq.tolist()},
+                           sock_path=self.sock_path)
+        return np.asarray(reply["codes"], dtype=np.int64)[inverse.reshape(-1)]
+
+
+def remote_models(files, sock_path=None):
+    """
+    {name: (RemoteBooster, encoders)} for `files` ({name: (model path, encoder
+    path)}) when a scoring server is running and serves exactly those files;
+    None otherwise (caller loads the models locally).
+    """
+    sock_path = sock_path or default_socket()
+    try:
+        info, _ = request({"op": "info"}, sock_path=sock_path)
+    except (OSError, RuntimeError, ValueError):
+        return None
+    served = info["models"]
+    out = {}
+    for name, (model_path, enc_path) in files.items():
+        m = served.get(name)
+        if m is None or m["files"] != [file_id(model_path), file_id(enc_path)]:
+            return None
+        enc = dict(m["encoders"])
+        if "value8" in m:
+            enc["le_value8"] = RemoteLabelEncoder(sock_path, name)
+        out[name] = (RemoteBooster(sock_path, name, m["best_iteration"]), enc)
+    return out
+
+
+# -- server ------------------------------------------------------------------
+def load_served_models(model_dir):
+    """{name: (booster, encoders, model path, encoder path)} for the models present in model_dir."""
+    os.environ["SPLICECOV_MODEL_DIR"] = model_dir
+    import LightGBM_no_normscale as jmodel
+    import LightGBM_tss as tssmodel
+
+    served = {}
+    if os.path.exists(jmodel.MODEL_FILE) and os.path.exists(jmodel.ENCODERS_FILE):
+        model, enc = jmodel.load_scoring_model(use_server=False)
+        served["junction"] = (model, enc, jmodel.MODEL_FILE, jmodel.ENCODERS_FILE)
+    paths = {rt: (os.path.join(model_dir, m), os.path.join(model_dir, e)) for rt, m, e in (
+        ("TSS", tssmodel.TSS_MODEL_BASENAME, tssmodel.TSS_ENC_BASENAME),
+        ("CPAS", tssmodel.CPAS_MODEL_BASENAME, tssmodel.CPAS_ENC_BASENAME))}
+    models = tssmodel.load_models(paths["TSS"][0], paths["CPAS"][0], paths["TSS"][1], paths["CPAS"][1],
+                                  use_server=False)
+    for rt, (model, enc) in models.items():
+        served[rt] = (model, enc, *paths[rt])
+    return served
+
+
+def _describe(name, model, enc, model_path, enc_path):
+    d = {"files": [file_id(model_path), file_id(enc_path)], "best_iteration": model.best_iteration}
+    if name == "junction":
+        d["encoders"] = {k: float(v) for k, v in enc.items()}
+    else:
+        d["encoders"] = {"value3_max": None if enc.get("value3_max") is None else float(enc["value3_max"])}
+        d["value8"] = True
+    return d
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            header = json.loads(self.rfile.readline())
+            op = header.get("op")
+            if op == "info":
+                self._reply({"models": {n: _describe(n, *m) for n, m in self.server.models.items()},
+                             "pid": os.getpid()})
+            elif op == "predict":
+                model = self.server.models[header["model"]][0]
+                rows, cols = int(header["rows"]), int(header["cols"])
+                X = np.frombuffer(_read_exact(self.rfile, rows * cols * F8.itemsize), dtype=F8).reshape(rows, cols)
+                y = np.asarray(model.predict(X, num_iteration=header.get("num_iteration")), dtype=F8)
+                self._reply({"rows": int(y.size)}, y.tobytes())
+            elif op == "encode":
+                import pandas as pd
+                import LightGBM_tss
+                le = LightGBM_tss.value8_encoder(self.server.models[header["model"]][1])
+                codes = le.transform(pd.Series(header["values"]).astype(str))
+                self._reply({"codes": np.asarray(codes).tolist()})
+            elif op == "stop":
+                self._reply({})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else:
+                self._reply_error(f"unknown op {op!r}")
+        except Exception as e:  # report to the client, keep serving
+            self._reply_error(f"{type(e).__name__}: {e}")
+
+    def _reply(self, header, payload=b""):
+        header["ok"] = True
+        self.wfile.write(json.dumps(header).encode() + b"\n" + payload)
+
+    def _reply_error(self, msg):
+        try:
+            self.wfile.write(json.dumps({"ok": False, "error": msg}).encode() + b"\n")
+        except OSError:
+            pass
+
+
+class ScoreServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, sock_path, models):
+        self.models = models
+        super().__init__(sock_path, _Handler)
+
+    def server_bind(self):
+        # Created 0600: no window in which other users can connect
+        old = os.umask(0o077)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old)
+
+
+def serve(sock_path, model_dir):
+    sock_dir = os.path.dirname(sock_path)
+    try:
+        if sock_dir == socket_dir():
+            try:
+                os.mkdir(sock_dir, 0o700)
+            except FileExistsError:
+                pass
+            check_private_dir(sock_dir)
+        if os.path.lexists(sock_path):
+            check_socket(sock_path)
+    except PermissionError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if os.path.lexists(sock_path):
+        try:
+            request({"op": "info"}, sock_path=sock_path)
+            print(f"Error: a scoring server is already running on {sock_path}", file=sys.stderr)
+            sys.exit(1)
+        except (OSError, RuntimeError, ValueError):
+            os.remove(sock_path)  # stale socket
+    models = load_served_models(model_dir)
+    if not models:
+        print(f"Error: no models found in {model_dir}", file=sys.stderr)
+        sys.exit(1)
+    server = ScoreServer(sock_path, models)
+    print(f"[serve] {', '.join(models)} from {model_dir} on {sock_path} (pid {os.getpid()})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(sock_path):
+            os.remove(sock_path)
+    print("[serve] stopped.")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Scoring server keeping the SpliceCOV LightGBM models loaded.")
+    p.add_argument("command", choices=("serve", "status", "stop"))
+    p.add_argument("--socket", default=None, help="Unix socket path (default: $SPLICECOV_SCORE_SOCKET, else in $XDG_RUNTIME_DIR or a private temp dir).")
+    p.add_argument("--model-dir", default=None, help="Model directory (default: as the scorers resolve it).")
+    args = p.parse_args()
+    sock_path = args.socket or default_socket()
+
+    if args.command == "serve":
+        import LightGBM_tss
+        serve(sock_path, os.path.abspath(args.model_dir or LightGBM_tss.MODEL_DIR_DEFAULT))
+        return
+    try:
+        info, _ = request({"op": "info" if args.command == "status" else "stop"}, sock_path=sock_path)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"No scoring server on {sock_path} ({e})", file=sys.stderr)
+        sys.exit(1)
+    if args.command == "status":
+        print(f"scoring server pid {info['pid']} on {sock_path}")
+        for name, m in info["models"].items():
+            print(f"  {name}: {m['files'][0][0]}")
+    else:
+        print(f"Stopped scoring server on {sock_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+.scov: memory-mapped run-length coverage for repeated runs on one bigWig.
+
+Layout (little-endian):
+  preamble   64 bytes: b"SCOV", uint32 version, uint64 directory offset,
+             uint64 directory length, zero padding
+  records    per chromosome, in bigWig order: (uint32 start, uint32 end,
+             float32 value) for every bigWig interval
+  directory  JSON {"version", "source", "chroms": [[name, length, offset, count], ...]}
+
+The records are exactly the bigWig's intervals (values stay float32), so
+every consumer gives the same results as with the bigWig; reads are
+zero-copy numpy views into the mapping. Written by `splicecov index`.
+
+Usage: scov.py <coverage.bigWig> <out.scov>
+"""
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+from coverage_cache import CoverageCache, fill_values
+
+MAGIC = b"SCOV"
+VERSION = 1
+PREAMBLE = struct.Struct("<4sIQQ")
+PREAMBLE_SIZE = 64
+RECORD = np.dtype([("start", "<u4"), ("end", "<u4"), ("value", "<f4")])
+CHUNK = 1 << 20  # records per block handed out by iter_blocks
+
+
+def is_scov(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_scov(bigwig_file, out_path):
+    """Convert a bigWig into a .scov file; returns the number of intervals written."""
+    src = CoverageCache(bigwig_file, budget_mb=0)
+    chroms = []
+    total = 0
+    tmp = f"{out_path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(b"\0" * PREAMBLE_SIZE)
+            for chrom, length in src.chroms().items():
+                offset, count = f.tell(), 0
+                for s, e, v in src.iter_blocks(chrom):
+                    rec = np.empty(s.size, dtype=RECORD)
+                    rec["start"], rec["end"], rec["value"] = s, e, v
+                    f.write(rec.tobytes())
+                    count += s.size
+                chroms.append([chrom, length, offset, count])
+                total += count
+            directory = json.dumps({"version": VERSION, "source": os.path.basename(bigwig_file),
+                                    "chroms": chroms}).encode()
+            dir_offset = f.tell()
+            f.write(directory)
+            f.seek(0)
+            f.write(PREAMBLE.pack(MAGIC, VERSION, dir_offset, len(directory)))
+        os.replace(tmp, out_path)
+    finally:
+        src.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return total
+
+
+class ScovCoverage:
+    """Read-only .scov reader with the coverage API of CoverageCache."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, dir_offset, dir_len = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path}: not a version {VERSION} .scov file")
+            f.seek(dir_offset)
+            directory = json.loads(f.read(dir_len))
+        self.mm = np.memmap(path, dtype=np.uint8, mode="r")
+        self._chroms = {name: length for name, length, _, _ in directory["chroms"]}
+        self._records = {name: self.mm[off:off + n * RECORD.itemsize].view(RECORD)
+                         for name, _, off, n in directory["chroms"]}
+
+    def chroms(self, chrom=None):
+        if chrom is None:
+            return dict(self._chroms)
+        return self._chroms.get(chrom)
+
+    def _overlapping(self, chrom, start, end):
+        rec = self._records[chrom]
+        lo = np.searchsorted(rec["end"], start, side="right")
+        hi = np.searchsorted(rec["start"], end, side="left")
+        rec = rec[lo:hi]
+        return rec["start"], rec["end"], rec["value"]
+
+    def values(self, chrom, start, end, numpy=False):
+        out = np.full(end - start, np.nan, dtype=np.float32)
+        fill_values(out, start, end, *self._overlapping(chrom, start, end))
+        return out if numpy else out.tolist()
+
+    def intervals(self, chrom, start=None, end=None):
+        start = 0 if start is None else start
+        end = self._chroms[chrom] if end is None else end
+        s, e, v = self._overlapping(chrom, start, end)
+        return tuple(zip(s.tolist(), e.tolist(), v.tolist()))
+
+    def iter_blocks(self, chrom):
+        rec = self._records[chrom]
+        for i in range(0, rec.size, CHUNK):
+            blk = rec[i:i + CHUNK]
+            yield blk["start"], blk["end"], blk["value"]
+
+    def stats(self):
+        return {"hits": 0, "misses": 0, "evictions": 0, "resident_mb": 0.0}
+
+    def report(self, label="coverage"):
+        return f"{label}: memory-mapped {self.path}"
+
+    def close(self):
+        self._records = {}
+        self.mm = None
+
+
+def main():
+    if len(sys.argv) != 3:
+        print(f"Usage: {sys.argv[0]} <coverage.bigWig> <out.scov>", file=sys.stderr)
+        sys.exit(1)
+    n = write_scov(sys.argv[1], sys.argv[2])
+    print(f"Wrote {n} intervals to {sys.argv[2]}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,14 +13,32 @@ usage() {
   cat <<'USAGE'
 Usage:
   Full run:
-    splicecov -j <input_tiebrush_junc> -c <input_tiebrush_bigwig> [-a <annotation_gtf>] [-b <basename>] [-s <threshold>]
+    splicecov -j <input_tiebrush_junc> -c <input_tiebrush_bigwig> [-a <annotation_gtf>] [-b <basename>] [-s <threshold>] [-t <threads>]
+
+  Full run, single in-memory process (same options and outputs):
+    splicecov run -j <input_tiebrush_junc> -c <input_tiebrush_bigwig> [-a <annotation_gtf>] [-b <basename>] [-s <threshold>] [-t <threads>]
+
+  Many samples on a worker pool, one summary table (manifest: <junc> <bigwig> [basename] per line):
+    splicecov batch -m <manifest.tsv> [-a <annotation_gtf>] [-s <threshold>] [-t <cpus>] [--mem-gb <GB>] [--job-mem-gb <GB>]
+
+  Build a memory-mapped coverage index (usable as -c in place of the BigWig):
+    splicecov index -c <input_tiebrush_bigwig> [-o <out.scov>]
+
+  Index an annotation GTF once; evaluation then reuses it while the GTF is unchanged:
+    splicecov annotate-index -a <annotation_gtf>
+
+  Keep the LightGBM models loaded for back-to-back runs (used automatically while running):
+    splicecov serve [status|stop]
 
   Eval-only (no pipeline; reads outputs from out/):
     splicecov -b <basename> -a <annotation_gtf>
 
+  Precision/recall at many thresholds from one run's out/ scores:
+    splicecov sweep -b <basename> -a <annotation_gtf> [-s <t1,t2,...>] [--curve]
+
 Required for full run:
   -j <file> : input TieBrush junction file
-  -c <file> : input coverage BigWig file
+  -c <file> : input coverage BigWig file (or its .scov index)
 
 Required for eval-only:
   -b <str>  : basename used in out/<basename>.{jscore,tsstes.scores}.txt
@@ -30,6 +48,7 @@ Optional:
   -a <file> : annotation (GTF). If provided, evaluation will run *based on generated out/ files*.
   -b <str>  : basename to use for ALL output files; overrides default from -j.
   -s <num>  : LightGBM scoring threshold [0,1], default is 0.4.
+  -t <int>  : process chromosomes in parallel on <int> processes (runs the in-memory engine), default is 1.
 
 Core outputs (written to out/ when running full pipeline):
   <basename>.jscore.txt
@@ -43,19 +62,36 @@ USAGE
   exit 1
 }
 
+# Subcommands implemented by the Python engine
+case "${1:-}" in
+  run|index|annotate-index|batch|sweep)
+    engine_dir="${SPLICECOV_HELPERS_DIR:-$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)}"
+    exec python3 "${engine_dir}/splicecov_engine.py" "$@"
+    ;;
+  serve)
+    engine_dir="${SPLICECOV_HELPERS_DIR:-$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)}"
+    case "${2:-}" in
+      status|stop) exec python3 "${engine_dir}/score_server.py" "$2" "${@:3}" ;;
+      *)           exec python3 "${engine_dir}/score_server.py" serve "${@:2}" ;;
+    esac
+    ;;
+esac
+
 input_tiebrush_junc=""
 input_tiebrush_bigwig=""
 input_annotation=""
 basename_arg=""
 score_arg=""
+threads_arg=""
 
-while getopts ":j:c:a:b:s:h" opt; do
+while getopts ":j:c:a:b:s:t:h" opt; do
   case $opt in
     j) input_tiebrush_junc="$OPTARG" ;;
     c) input_tiebrush_bigwig="$OPTARG" ;;
     a) input_annotation="$OPTARG" ;;
     b) basename_arg="$OPTARG" ;;
     s) score_arg="$OPTARG" ;;
+    t) threads_arg="$OPTARG" ;;
     h) usage ;;
     \?) echo "Invalid option -$OPTARG" >&2; usage ;;
     :)  echo "Option -$OPTARG requires an argument." >&2; usage ;;
@@ -74,6 +110,14 @@ if [[ -n "$score_arg" ]]; then
   fi
 fi
 
+# Validate -t if provided
+if [[ -n "$threads_arg" ]]; then
+  if ! [[ "$threads_arg" =~ ^[1-9][0-9]*$ ]]; then
+    echo "ERROR: -t must be a positive integer, got '$threads_arg'." >&2
+    exit 2
+  fi
+fi
+
 # Determine mode:
 # - Full run if (-j and -c) provided
 # - Eval-only if (-b and -a) provided and (-j/-c) not provided
@@ -120,19 +164,32 @@ MODEL_DIR="${SPLICECOV_MODEL_DIR:-${helpers_dir%/}/model_output}"
 export SPLICECOV_MODEL_DIR="$MODEL_DIR"
 log "Models dir: $MODEL_DIR"
 
+# Multi-process full run: shard by chromosome inside the engine
+if $full_run && [[ -n "$threads_arg" && "$threads_arg" -gt 1 ]]; then
+  engine_args=(run -j "$input_tiebrush_junc" -c "$input_tiebrush_bigwig" -t "$threads_arg")
+  [[ -n "$input_annotation" ]] && engine_args+=(-a "$input_annotation")
+  [[ -n "$basename_arg" ]] && engine_args+=(-b "$basename_arg")
+  [[ -n "$score_arg" ]] && engine_args+=(-s "$score_arg")
+  export SPLICECOV_HELPERS_DIR="$helpers_dir"
+  exec python3 "${helpers_dir%/}/splicecov_engine.py" "${engine_args[@]}"
+fi
+
 common_helpers=(
-  "process_junctions_perc.pl"
+  "junction_percs.py"
   "process_tiebrush_round1_juncs_splicecov.py"
   "LightGBM_no_normscale.py"
+  "score_server.py"
+  "model_compiler.py"
   # "process_tiebrush_original.pl"
   "process_tiebrush"
   "compute_round2_tsstes_metrics.py"
-  "splicecov_bundle2ptf.pl"
+  "bigwig_to_bedgraph.py"
+  "bundle2ptf.py"
   "LightGBM_tss.py"
   "combine_ptfs.sh"
 )
 anno_helpers=(
-  "gtf_to_intron_bed.py"
+  "annotation_index.py"
   "evaluate_ptf_new.py"
   "evaluate_TSSTES_new.py"
 )
@@ -177,99 +234,6 @@ filter_pos_from_tsstes_scores() {
   awk 'NR==1{next} ($NF==1 || $NF==1.0)' "$1"
 }
 
-build_annotation_splice_sites() {
-  # outputs a 2-col file: chr <space/tab> pos
-  local gtf="$1"
-  local out="$2"
-  local tmp_introns="$3"
-
-  python3 "${helpers_dir}/gtf_to_intron_bed.py" "$gtf" "$tmp_introns"
-
-  # intron bed is expected: chr start end ...
-  awk 'BEGIN{OFS="\t"} {print $1,$2; print $1,$3}' "$tmp_introns" \
-    | sort -k1,1 -k2,2n | uniq > "$out"
-}
-
-build_annotation_tsstes() {
-  # outputs: chr \t pos \t TYPE  where TYPE in {TSS,CPAS}
-  # Prefers 'transcript' features if present; else infers per transcript_id from exons.
-  local gtf="$1"
-  local out="$2"
-
-  python3 - "$gtf" "$out" <<'PY'
-import sys, re
-gtf, outp = sys.argv[1], sys.argv[2]
-
-attr_re = re.compile(r'(\S+)\s+"([^"]+)"')
-
-def parse_attrs(s):
-    d={}
-    for m in attr_re.finditer(s):
-        d[m.group(1)] = m.group(2)
-    return d
-
-# We will collect:
-# - transcript features if present: tid -> (chr,strand,start,end)
-# - else exon extrema per transcript_id: tid -> min_start, max_end, chr,strand
-tx = {}
-exon_ext = {}
-
-with open(gtf, "r", encoding="utf-8", errors="replace") as f:
-    for line in f:
-        if not line or line[0] == "#":
-            continue
-        parts = line.rstrip("\n").split("\t")
-        if len(parts) < 9:
-            continue
-        chrom, source, feature, start, end, score, strand, frame, attrs = parts
-        try:
-            start_i = int(start)
-            end_i = int(end)
-        except:
-            continue
-        a = parse_attrs(attrs)
-        tid = a.get("transcript_id") or a.get("transcriptId") or a.get("transcript")  # last one is rare
-        if not tid:
-            continue
-
-        if feature == "transcript":
-            tx[tid] = (chrom, strand, start_i, end_i)
-        elif feature == "exon":
-            v = exon_ext.get(tid)
-            if v is None:
-                exon_ext[tid] = [chrom, strand, start_i, end_i]
-            else:
-                # keep chrom/strand as first-seen; update bounds
-                v[2] = min(v[2], start_i)
-                v[3] = max(v[3], end_i)
-
-# Choose transcript coords source
-coords = tx if tx else exon_ext
-
-# Emit unique positions
-seen = set()
-out = []
-for tid, (chrom, strand, s, e) in coords.items():
-    if strand == "+":
-        tss = s
-        cpas = e
-    else:
-        tss = e
-        cpas = s
-    k1 = (chrom, tss, "TSS")
-    k2 = (chrom, cpas, "CPAS")
-    if k1 not in seen:
-        seen.add(k1); out.append(k1)
-    if k2 not in seen:
-        seen.add(k2); out.append(k2)
-
-out.sort(key=lambda x: (x[0], x[1], x[2]))
-with open(outp, "w") as w:
-    for chrom, pos, typ in out:
-        w.write(f"{chrom}\t{pos}\t{typ}\n")
-PY
-}
-
 run_evaluation_from_outputs() {
   # Requires: out/<base>.jscore.txt and out/<base>.tsstes.scores.txt exist
   # Requires: -a provided
@@ -280,25 +244,36 @@ run_evaluation_from_outputs() {
   workdir="$(mktemp -d "${outdir}/.eval.${base}.XXXX")"
   trap 'rm -rf "$workdir"' RETURN
 
-  local ann_introns="$workdir/ann.introns.bed"
-  local ann_ss="$workdir/ann.uniquess.bed"
-  local ann_tsstes="$workdir/ann.tsstes.bed"
+  # SPLICECOV_EVAL_REFS: directory where the annotation references are kept
+  # and reused (splicecov batch evaluates every sample against one GTF)
+  local refdir="${SPLICECOV_EVAL_REFS:-$workdir}"
+  local ann_ss="$refdir/ann.uniquess.bed"
+  local ann_tsstes="$refdir/ann.tsstes.bed"
 
   local jpos="$workdir/${base}.jscore.pos.txt"
   local tspos="$workdir/${base}.tsstes.pos.txt"
 
-  log "Eval: building annotation references from GTF..."
-  build_annotation_splice_sites "$gtf" "$ann_ss" "$ann_introns"
-  build_annotation_tsstes "$gtf" "$ann_tsstes"
+  if [[ -s "$ann_ss" && -f "$ann_tsstes" ]]; then
+    log "Eval: reusing annotation references in $refdir"
+  else
+    # Splice sites and TSS/CPAS of the GTF; read from <gtf>.annidx when it
+    # matches the GTF (splicecov annotate-index), else parsed from the GTF
+    log "Eval: building annotation references from GTF..."
+    python3 "${helpers_dir}/annotation_index.py" refs "$gtf" "$ann_ss" "$ann_tsstes"
+  fi
 
   log "Eval: extracting predicted positives from out/ scores..."
-  filter_pos_from_jscore "$jscore_out" > "$jpos" || true
+  # Sorted like the annotation references, so evaluate_ptf_new.py can merge-join them
+  filter_pos_from_jscore "$jscore_out" | LC_ALL=C sort -s -t $'\t' -k1,1 -k2,2n > "$jpos" || true
   filter_pos_from_tsstes_scores "$tsstes_scores_out" > "$tspos" || true
 
   log "Eval: junctions -> ${eval_junc_out}"
   if [[ -s "$jpos" && -s "$ann_ss" ]]; then
-    # evaluate_ptf_new.py prints to stdout; capture to file
-    python3 "${helpers_dir}/evaluate_ptf_new.py" "$jpos" "$ann_ss" > "$eval_junc_out" || true
+    # evaluate_ptf_new.py prints to stdout; capture to file.
+    # SPLICECOV_EVAL_ROW_FILES=0 skips its per-category row files under out/.
+    local row_flags=()
+    [[ "${SPLICECOV_EVAL_ROW_FILES:-1}" == "0" ]] && row_flags=(--no-row-files)
+    python3 "${helpers_dir}/evaluate_ptf_new.py" "${row_flags[@]}" "$jpos" "$ann_ss" > "$eval_junc_out" || true
   else
     printf "No junction positives or empty annotation splice-site set.\n" > "$eval_junc_out"
   fi
@@ -329,7 +304,6 @@ fi
 # FULL PIPELINE MODE
 # ---------------------------
 log "Mode: full pipeline"
-need_cmd bigWigToBedGraph
 
 [[ -f "$input_tiebrush_junc" ]]   || die "Junction file not found: $input_tiebrush_junc"
 [[ -f "$input_tiebrush_bigwig" ]] || die "BigWig file not found: $input_tiebrush_bigwig"
@@ -350,14 +324,12 @@ processed_junc_bundle="$workdir/${base_name}.jbund.txt"
 jpos_source="$workdir/${base_name}.jpos.txt"
 tsstes_pos_tmp="$workdir/${base_name}.tsstes.pos.txt"
 jpos_ptf_tmp="$workdir/${base_name}.jpos.ptf"
-converted_bedgraph="$workdir/${base_name}.bw.bedGraph"
 round2_processed_bundles="$workdir/${base_name}.bund.txt"
 round2_processed_bundles_w_metrics="$workdir/${base_name}.r2.metrics.txt"
-round2_processed_bundles_w_metrics_ptf="$workdir/${base_name}.r2.metrics.ptf"
-round2_processed_bundles_w_metrics_tsstes_ptf="$workdir/${base_name}.tsstes.ptf"
 
 log "Step 1a: Sorting junctions by chr,start,end (header preserved)..."
-sort_args=(-k1,1 -k2,2n -k3,3n)
+sort_keys=(-k1,1 -k2,2n -k3,3n)
+sort_args=("${sort_keys[@]}")
 if LC_ALL=C sort --help 2>/dev/null | grep -q -- '--parallel'; then
   cpus="$(getconf _NPROCESSORS_ONLN 2>/dev/null || nproc 2>/dev/null || echo 1)"
   sort_args+=(--parallel="$cpus")
@@ -367,18 +339,35 @@ if LC_ALL=C sort --help 2>/dev/null | grep -q -- '-T'; then
 fi
 
 first_line="$(head -n1 "$input_tiebrush_junc")"
-{
-  if [[ "$first_line" =~ ^(track|#) ]]; then
-    printf '%s\n' "$first_line"
-    tail -n +2 "$input_tiebrush_junc" | LC_ALL=C sort "${sort_args[@]}"
-  else
-    printf 'track name=junctions\n'
-    LC_ALL=C sort "${sort_args[@]}" "$input_tiebrush_junc"
-  fi
-} > "$sorted_junc"
+if [[ "$first_line" =~ ^(track|#) ]]; then
+  junc_header="$first_line"
+  junc_body_from=2
+else
+  junc_header='track name=junctions'
+  junc_body_from=1
+fi
+
+# TieBrush output is usually sorted already: `sort -c` streams the file once
+# (stopping at the first line out of order) and the sort and its copy of the
+# file are skipped when it passes. Otherwise sort does an external merge sort.
+if tail -n +"$junc_body_from" "$input_tiebrush_junc" | LC_ALL=C sort -c "${sort_keys[@]}" 2>/dev/null; then
+  log "  junctions already sorted; not re-sorting"
+  junc_sorted=true
+else
+  junc_sorted=false
+  {
+    printf '%s\n' "$junc_header"
+    tail -n +"$junc_body_from" "$input_tiebrush_junc" | LC_ALL=C sort "${sort_args[@]}"
+  } > "$sorted_junc"
+fi
 
 log "Step 1b: Processing junctions (sorted input)..."
-"${helpers_dir}/process_junctions_perc.pl" "$sorted_junc" > "$processed_junc"
+if $junc_sorted; then
+  { printf '%s\n' "$junc_header"; tail -n +"$junc_body_from" "$input_tiebrush_junc"; } \
+    | python3 "${helpers_dir}/junction_percs.py" /dev/stdin > "$processed_junc"
+else
+  python3 "${helpers_dir}/junction_percs.py" "$sorted_junc" > "$processed_junc"
+fi
 
 log "Step 2: Adding bigWig signal..."
 python3 "${helpers_dir}/process_tiebrush_round1_juncs_splicecov.py" \
@@ -388,6 +377,7 @@ log "Step 4: LightGBM scoring (junctions) -> ${jscore_out}"
 python3 "${helpers_dir}/LightGBM_no_normscale.py" \
   -i "$processed_junc_bundle" \
   -o "$jscore_out" \
+  -c "${SPLICECOV_SCORE_CHUNK_ROWS:-1000000}" \
   ${score_flags[@]+"${score_flags[@]}"}
 
 log "Step 5: Filtering score-positive junctions (temp)..."
@@ -396,17 +386,16 @@ awk 'NR==1{next} ($NF==1 || $NF==1.0)' "$jscore_out" > "$jpos_source" || true
 log "Step 7: Emit PTF (junctions) -> temp"
 awk 'BEGIN{OFS="\t"} { print $1, $2, $5, $12 }' "$jpos_source" > "$jpos_ptf_tmp" || true
 
-log "Step 8a: Converting BigWig -> BedGraph for round 2..."
-bigWigToBedGraph "$input_tiebrush_bigwig" "$converted_bedgraph"
-
 # log "Step 8b: Re-processing original bedGraph for round 2..."
 # "${helpers_dir}/process_tiebrush_original.pl" \
 #   "$converted_bedgraph" "$processed_junc" \
 #   > "$round2_processed_bundles"
 
-log "Step 8b: Re-processing original bedGraph for round 2..."
-"${helpers_dir}/process_tiebrush" \
-  "$converted_bedgraph" "$processed_junc" \
+log "Step 8: Re-processing coverage for round 2 (streamed from BigWig)..."
+# Bundles are processed on a thread pool; output is the same for any count
+tiebrush_threads="${SPLICECOV_TIEBRUSH_THREADS:-${threads_arg:-$(getconf _NPROCESSORS_ONLN 2>/dev/null || echo 1)}}"
+python3 "${helpers_dir}/bigwig_to_bedgraph.py" "$input_tiebrush_bigwig" \
+  | "${helpers_dir}/process_tiebrush" -t "$tiebrush_threads" - "$processed_junc" \
   > "$round2_processed_bundles"
   
 log "Step 9: Computing TSSTES metrics (round 2)..."
@@ -414,21 +403,13 @@ python3 "${helpers_dir}/compute_round2_tsstes_metrics.py" \
   "$round2_processed_bundles" "$input_tiebrush_bigwig" \
   > "$round2_processed_bundles_w_metrics"
 
-log "Step 10: Bundles -> PTF (round 2 TSSTES)..."
-"${helpers_dir}/splicecov_bundle2ptf.pl" \
-  "$round2_processed_bundles_w_metrics" \
-  > "$round2_processed_bundles_w_metrics_ptf"
-
-log "Step 11: Extract TSS/CPAS..."
-awk '($4=="TSS" || $4=="CPAS")' \
-  "$round2_processed_bundles_w_metrics_ptf" \
-  > "$round2_processed_bundles_w_metrics_tsstes_ptf"
-
-log "Step 12: LightGBM scoring (TSSTES) -> ${tsstes_scores_out}"
-python3 "${helpers_dir}/LightGBM_tss.py" \
-  -i "$round2_processed_bundles_w_metrics_tsstes_ptf" \
-  -o "$tsstes_scores_out" \
-  ${score_flags[@]+"${score_flags[@]}"}
+log "Steps 10-12: Bundles -> TSS/CPAS PTF rows -> LightGBM scoring (TSSTES) -> ${tsstes_scores_out}"
+# The TSS/CPAS rows are streamed into the scorer; no PTF file is written
+python3 "${helpers_dir}/bundle2ptf.py" --tsstes "$round2_processed_bundles_w_metrics" \
+  | python3 "${helpers_dir}/LightGBM_tss.py" \
+      -i - \
+      -o "$tsstes_scores_out" \
+      ${score_flags[@]+"${score_flags[@]}"}
 
 log "Step 13: Filter TSSTES score-positive -> temp"
 awk 'NR==1{next} ($NF==1 || $NF==1.0)' "$tsstes_scores_out" > "$tsstes_pos_tmp" || true
@@ -0,0 +1,773 @@
+#!/usr/bin/env python3
+"""
+Single-process SpliceCOV pipeline ("splicecov run"), multi-sample batches
+("splicecov batch"), coverage indexing ("splicecov index"), annotation
+indexing ("splicecov annotate-index") and threshold sweeps ("splicecov sweep").
+
+Runs the same stages as spliceCOV.sh -- junction percs, round-1 bigWig
+features, LightGBM junction scoring, round-2 bundle segmentation
+(process_tiebrush), TSS/TES metrics, TSS/CPAS scoring and PTF combination --
+but hands columnar tables from one stage to the next in memory instead of
+writing and re-parsing a TSV per step. The coverage for process_tiebrush is
+streamed from the bigWig through a pipe, so no whole-genome bedGraph is
+materialized. Intermediate files are written to out/.work.<basename>.XXXX
+only when KEEP_TEMP is set.
+
+Usage:
+  splicecov run -j <junctions.bed> -c <coverage.bigWig> [-a <annotation.gtf>] [-b <basename>] [-s <threshold>] [-t <threads>]
+
+With -t N > 1 the junctions and coverage are sharded by chromosome and the
+shards run in a pool of N processes; outputs are merged back into the
+whole-genome order.
+
+  splicecov batch -m <manifest.tsv> [-a <annotation.gtf>] [-s <threshold>] [-t <cpus>] [--mem-gb <GB>] [--job-mem-gb <GB>]
+
+runs every sample of the manifest (one "<junctions> <coverage> [basename]"
+line each) on a pool of worker processes, as many at a time as the CPU and
+memory budgets allow. Each worker loads the models once and keeps them for
+all of its samples; with -a the annotation references are built once and
+shared by every evaluation. Per-sample outputs go to out/<basename>.* as
+with run, plus one out/<manifest name>.summary.tsv row per sample.
+
+  splicecov index -c <coverage.bigWig> [-o <coverage.scov>]
+
+writes the bigWig's intervals to a memory-mapped .scov file (see scov.py)
+that -c accepts in place of the bigWig, skipping bigWig decompression on
+repeated runs.
+
+  splicecov annotate-index -a <annotation.gtf>
+
+writes the GTF's splice sites and TSS/CPAS to <gtf>.annidx (see
+annotation_index.py); evaluation reads it instead of parsing the GTF while
+the GTF is unchanged.
+
+  splicecov sweep -b <basename> -a <annotation.gtf> [-s <t1,t2,...>] [--curve]
+
+evaluates out/<basename> at many thresholds at once from the scores already
+written (see threshold_sweep.py).
+"""
+import os
+import re
+import sys
+import argparse
+import itertools
+import shutil
+import subprocess
+import concurrent.futures
+import tempfile
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+HELPERS_DIR = os.path.abspath(os.environ.get("SPLICECOV_HELPERS_DIR") or os.path.dirname(os.path.abspath(__file__)))
+if HELPERS_DIR not in sys.path:
+    sys.path.insert(0, HELPERS_DIR)
+
+import junction_percs
+from bigwig_to_bedgraph import bedgraph_lines, junction_order
+from coverage_cache import open_coverage
+import scov
+import annotation_index
+import threshold_sweep
+import process_tiebrush_round1_juncs_splicecov as round1
+import compute_round2_tsstes_metrics as round2
+from bundle2ptf import ptf_rows
+import LightGBM_no_normscale as jmodel
+import LightGBM_tss as tssmodel
+
+OUTDIR = "out"
+
+TSS_DTYPES = {
+    "position": int, "value1": float, "value2": int, "value3": float, "value4": float,
+    "value5": float, "value6": float, "value7": float,
+}
+
+
+def log(msg):
+    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {msg}", file=sys.stderr, flush=True)
+
+
+def die(msg):
+    print(f"FATAL: {msg}", file=sys.stderr)
+    sys.exit(1)
+
+
+def _num(s):
+    """Leading integer of a field, as `sort -n` reads it (0 if none)."""
+    m = re.match(r"\s*(-?\d+)", s)
+    return int(m.group(1)) if m else 0
+
+
+class Workspace:
+    """Intermediate-file sink; a no-op unless KEEP_TEMP is set."""
+
+    def __init__(self, base_name, keep):
+        self.base_name = base_name
+        self.dir = tempfile.mkdtemp(prefix=f".work.{base_name}.", dir=OUTDIR) if keep else None
+
+    def write(self, suffix, lines):
+        if self.dir is None:
+            return
+        with open(os.path.join(self.dir, f"{self.base_name}.{suffix}"), "w") as f:
+            for line in lines:
+                f.write(line + "\n")
+
+    def write_frame(self, suffix, df, header=False):
+        if self.dir is not None:
+            df.to_csv(os.path.join(self.dir, f"{self.base_name}.{suffix}"), sep="\t", index=False, header=header)
+
+
+# ---------------------------------------------------------------------------
+# Stage 1: junctions (sort + percs)
+# ---------------------------------------------------------------------------
+def read_junctions(path):
+    """
+    Read a TieBrush junction BED and order it like
+    `LC_ALL=C sort -k1,1 -k2,2n -k3,3n` (whole line as last resort).
+    Returns (header_line, [lines]).
+    """
+    with open(path, "r") as f:
+        lines = f.read().splitlines()
+    header = "track name=junctions"
+    if lines and (lines[0].startswith("track") or lines[0].startswith("#")):
+        header = lines[0]
+        lines = lines[1:]
+
+    def key(line):
+        a = re.split(r"[ \t]+", line.lstrip(" \t"), maxsplit=3)
+        return (a[0].encode(), _num(a[1]) if len(a) > 1 else 0, _num(a[2]) if len(a) > 2 else 0, line.encode())
+
+    lines.sort(key=key)
+    return header, lines
+
+
+def junction_table(lines):
+    """
+    Percs stage: returns a dict of equal-length columns
+    (chrom, start, end, name, count, strand, percs) in output order.
+    """
+    cols = {k: [] for k in ("chrom", "start", "end", "name", "count", "strand", "percs")}
+
+    def flush(chrom, recs):
+        zs = [junction_percs.strand_idx(r[4]) for r in recs]
+        res = junction_percs.chrom_percs([r[0] for r in recs], [r[1] for r in recs], [r[3] for r in recs], zs)
+        if res is None:
+            return
+        for (s, e, name, c, _), z, a, b, l, r in zip(recs, zs, *res):
+            cols["chrom"].append(chrom)
+            cols["start"].append(s)
+            cols["end"].append(e)
+            cols["name"].append(name)
+            cols["count"].append(c)
+            cols["strand"].append(junction_percs.STRAND_CHARS[z])
+            cols["percs"].append(junction_percs.format_percs(a, b, l, r))
+
+    cur_chr = ""
+    buf = []
+    for line in lines:
+        if line.startswith("track") or line.startswith("#"):
+            continue
+        a = line.split("\t")
+        if len(a) < 6:
+            continue
+        if cur_chr != "" and a[0] != cur_chr:
+            flush(cur_chr, buf)
+            buf = []
+        cur_chr = a[0]
+        buf.append((int(a[1]), int(a[2]), a[3], int(a[4]), a[5]))
+    if buf:
+        flush(cur_chr, buf)
+    return cols
+
+
+def junction_lines(jt):
+    for c, s, e, n, k, st, p in zip(jt["chrom"], jt["start"], jt["end"], jt["name"], jt["count"], jt["strand"], jt["percs"]):
+        yield f"{c}\t{s}\t{e}\t{n}\t{k}\t{st}\t{p}"
+
+
+# ---------------------------------------------------------------------------
+# Stage 2: round-1 bigWig features
+# ---------------------------------------------------------------------------
+def round1_frame(bw, jt):
+    """
+    Round-1 junction features as a DataFrame with LightGBM_no_normscale's
+    testing columns (positional, as the scorer reads the .jbund.txt file).
+    """
+    chrom_len_map = bw.chroms()
+    rows = {k: [] for k in jmodel.COLUMNS_TESTING}
+
+    def add(chrom, pos, name, cov, strand, percs, jlen, side, event):
+        pc, abschg, sm, enc = side
+        rows["chromosome"].append(chrom)
+        rows["position"].append(pos)
+        rows["junction_id"].append(name)
+        rows["num_samples"].append(cov)
+        rows["strand"].append(strand)
+        rows["perc"].append(percs)
+        rows["cov_diff"].append(jlen)
+        rows["perc_cov_diff"].append(float(f"{pc:.4f}"))
+        rows["junc_len"].append(int(f"{abs(abschg):.0f}"))
+        rows["smooth_metric"].append(float(f"{sm:.4f}"))
+        rows["cov_change_dir"].append(enc)
+        rows["event"].append(event)
+
+    n = len(jt["chrom"])
+    lo = 0
+    while lo < n:
+        chrom = jt["chrom"][lo]
+        hi = lo
+        while hi < n and jt["chrom"][hi] == chrom:
+            hi += 1
+        chrom_len = chrom_len_map.get(chrom)
+        if chrom_len is None:
+            for _ in range(lo, hi):
+                print(f"Chromosome {chrom} not found in BigWig file.", file=sys.stderr)
+            lo = hi
+            continue
+        strands = jt["strand"][lo:hi]
+        js = round1.chrom_side_metrics(bw, chrom, jt["start"][lo:hi], strands, chrom_len, 'JSTART')
+        je = round1.chrom_side_metrics(bw, chrom, jt["end"][lo:hi], strands, chrom_len, 'JEND')
+        for k in range(hi - lo):
+            i = lo + k
+            start, end, name, cov, strand, percs = (jt[c][i] for c in ("start", "end", "name", "count", "strand", "percs"))
+            add(chrom, start, name, cov, strand, percs, end - start, tuple(x[k] for x in js), "JSTART")
+            add(chrom, end + 1, name, cov, strand, percs, end - start, tuple(x[k] for x in je), "JEND")
+        lo = hi
+    return pd.DataFrame(rows, columns=jmodel.COLUMNS_TESTING)
+
+
+def round1_lines(jf):
+    """The round-1 table formatted exactly like process_tiebrush_round1_juncs_splicecov.py output."""
+    for r in jf.itertuples(index=False):
+        yield (f"{r.chromosome}\t{r.position}\t{r.junction_id}\t{r.num_samples}\t{r.strand}\t{r.perc}\t{r.cov_diff}"
+               f"\t{r.perc_cov_diff:.4f}\t{r.junc_len}\t{r.smooth_metric:.4f}\t{r.cov_change_dir}\t{r.event}")
+
+
+# ---------------------------------------------------------------------------
+# Stage 3: round-2 bundles (process_tiebrush) + TSS/TES metrics
+# ---------------------------------------------------------------------------
+def _feed(fd, lines):
+    try:
+        with os.fdopen(fd, "w") as w:
+            for line in lines:
+                w.write(line)
+    except BrokenPipeError:
+        pass
+
+
+def run_tiebrush(binary, cov_lines, junc_lines):
+    """
+    Run process_tiebrush with coverage and junctions fed through pipes;
+    yields its bundle lines as they are produced.
+    """
+    cov_r, cov_w = os.pipe()
+    junc_r, junc_w = os.pipe()
+    proc = subprocess.Popen([binary, f"/dev/fd/{cov_r}", f"/dev/fd/{junc_r}"],
+                            pass_fds=(cov_r, junc_r), stdout=subprocess.PIPE, text=True)
+    os.close(cov_r)
+    os.close(junc_r)
+    feeders = [threading.Thread(target=_feed, args=(cov_w, cov_lines), daemon=True),
+               threading.Thread(target=_feed, args=(junc_w, junc_lines), daemon=True)]
+    for t in feeders:
+        t.start()
+    for line in proc.stdout:
+        yield line.rstrip("\n")
+    for t in feeders:
+        t.join()
+    if proc.wait() != 0:
+        die(f"process_tiebrush exited with status {proc.returncode}")
+
+
+def tsstes_frame(rows):
+    """TSS/CPAS PTF rows -> DataFrame typed the way read_csv types the .tsstes.ptf file."""
+    df = pd.DataFrame(rows, columns=tssmodel.COLS_TEST)
+    for col, typ in TSS_DTYPES.items():
+        df[col] = df[col].astype(typ)
+    df["value8"] = df["value8"] == "TRUE"
+    return df
+
+
+# ---------------------------------------------------------------------------
+# Stage 4: combine
+# ---------------------------------------------------------------------------
+def combine_positives(jpos, tpos):
+    """combine_ptfs.sh: union of both positive sets, `sort -k1,1 -k2,2n -k3,3 -k4,4 -u` order."""
+    rows = set()
+    for df, cols in ((jpos, ["chromosome", "position", "strand", "event"]),
+                     (tpos, ["chromosome", "position", "unused", "row_type"])):
+        for r in zip(*(df[c].astype(str) for c in cols)):
+            rows.add(r)
+    return sorted(rows, key=lambda r: (r[0].encode(), _num(r[1]), r[2].encode(), r[3].encode()))
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+_MODELS = {}
+
+
+def scoring_models():
+    """Junction and TSS/CPAS models, loaded once per process."""
+    if not _MODELS:
+        _MODELS["junc"] = jmodel.load_scoring_model()
+        _MODELS["tss"] = tssmodel.load_models(*(os.path.join(tssmodel.MODEL_DIR_DEFAULT, b) for b in (
+            tssmodel.TSS_MODEL_BASENAME, tssmodel.CPAS_MODEL_BASENAME,
+            tssmodel.TSS_ENC_BASENAME, tssmodel.CPAS_ENC_BASENAME)))
+    return _MODELS["junc"], _MODELS["tss"]
+
+
+def process_shard(bigwig_file, binary, lines, threshold, chroms=None, lead_header=False, keep=False, say=log):
+    """
+    Run every stage on sorted junction lines and the coverage of `chroms`
+    (whole bigWig when None). process_tiebrush drops the first coverage line
+    it reads, so a shard that does not start the genome gets a dummy
+    `track` line in front (lead_header) to keep its first interval.
+    All stages read coverage through one CoverageCache.
+    Returns (scored junction frame, scored TSS/CPAS frame, {suffix: lines},
+    cache stats); the dict holds the intermediates only when keep is set.
+    """
+    inter = {}
+    (model, encoders), tss_models = scoring_models()
+    jt = junction_table(lines)
+    if keep:
+        inter["jproc.txt"] = list(junction_lines(jt))
+
+    bw = open_coverage(bigwig_file)
+    try:
+        say("Step 2: Adding bigWig signal...")
+        jf = round1_frame(bw, jt)
+        if keep:
+            inter["jbund.txt"] = list(round1_lines(jf))
+
+        say("Step 4: LightGBM scoring (junctions)...")
+        if len(jf):
+            jmodel.score_frame(jf, model, encoders, threshold)
+        else:
+            # e.g. a shard whose chromosome is missing from the bigWig
+            jf["confidence_score"] = pd.Series(dtype="float64")
+            jf["predicted_label"] = pd.Series(dtype="int64")
+
+        say("Step 8: Round-2 bundles and TSSTES metrics (coverage streamed from bigWig)...")
+        cov = bedgraph_lines(bw, chroms)
+        if lead_header:
+            cov = itertools.chain(["track type=bedGraph\n"], cov)
+        bundles = run_tiebrush(binary, cov,
+                               (line + "\n" for line in [junction_percs.HEADER] + list(junction_lines(jt))))
+        if keep:
+            bundles = inter["bund.txt"] = list(bundles)
+        metrics = round2.annotate_bundles(bundles, bw)
+        if keep:
+            metrics = inter["r2.metrics.txt"] = list(metrics)
+        ptf = ptf_rows(metrics, tsstes_only=not keep)
+        if keep:
+            ptf = list(ptf)
+            inter["r2.metrics.ptf"] = ["\t".join(r) for r in ptf]
+        tsstes = [r for r in ptf if r[3] in ("TSS", "CPAS")]
+        if keep:
+            inter["tsstes.ptf"] = ["\t".join(r) for r in tsstes]
+        say(bw.report())
+        cache_stats = bw.stats()
+    finally:
+        bw.close()
+
+    say("Step 12: LightGBM scoring (TSSTES)...")
+    tf = tsstes_frame(tsstes)
+    tssmodel.score_frame(tf, tss_models, threshold)
+    return jf, tf, inter, cache_stats
+
+
+def _init_worker():
+    # The scorers report progress on stdout; keep per-shard chatter out of the way.
+    sys.stdout = open(os.devnull, "w")
+
+
+def _shard_task(bigwig_file, binary, chrom, lines, threshold, lead_header, keep):
+    return process_shard(bigwig_file, binary, lines, threshold, chroms=[chrom] if chrom is not None else [],
+                         lead_header=lead_header, keep=keep, say=lambda msg: None)
+
+
+def run_sharded(bigwig_file, binary, lines, threshold, threads, keep):
+    """
+    Shard the sorted junction lines and the coverage by chromosome and run
+    process_shard for each in a process pool. Junction frames are merged in
+    junction (sort) order, TSS/CPAS frames in the order the whole-genome run
+    streams the coverage (junction_order), so the outputs are those of a
+    single-process run.
+    """
+    by_chrom = {c: list(g) for c, g in itertools.groupby(lines, key=lambda line: line.split("\t", 1)[0])}
+    bw = open_coverage(bigwig_file, budget_mb=0)
+    chrom_len = bw.chroms()
+    bw.close()
+    cov_chroms = junction_order(chrom_len)
+    shards = cov_chroms + [c for c in by_chrom if c not in chrom_len]
+
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=threads, initializer=_init_worker) as pool:
+        futures = {}
+        # Largest chromosomes first so they do not end up as the tail.
+        for chrom in sorted(shards, key=lambda c: -chrom_len.get(c, 0)):
+            lead_header = bool(cov_chroms) and chrom != cov_chroms[0]
+            futures[pool.submit(_shard_task, bigwig_file, binary, chrom if chrom in chrom_len else None,
+                                by_chrom.get(chrom, []), threshold, lead_header, keep)] = chrom
+        for fut in concurrent.futures.as_completed(futures):
+            results[futures[fut]] = fut.result()
+            log(f"  {futures[fut]}: done ({len(results)}/{len(shards)})")
+    hits = sum(r[3]["hits"] for r in results.values())
+    misses = sum(r[3]["misses"] for r in results.values())
+    if hits or misses:
+        log(f"coverage cache (all shards): {hits} hits, {misses} misses")
+
+    def merge(col, order):
+        frames = [results[c][col] for c in order if len(results[c][col])]
+        return pd.concat(frames, ignore_index=True) if frames else results[shards[0]][col]
+
+    junc_order = list(by_chrom)
+    jf = merge(0, junc_order)
+    tf = merge(1, shards)
+    inter = {}
+    if keep:
+        for suffix, order in (("jproc.txt", junc_order), ("jbund.txt", junc_order), ("bund.txt", shards),
+                              ("r2.metrics.txt", shards), ("r2.metrics.ptf", shards), ("tsstes.ptf", shards)):
+            inter[suffix] = [line for c in order for line in results[c][2][suffix]]
+    return jf, tf, inter
+
+
+def run_sample(junctions, coverage, base_name, threshold, threads, binary, say=log):
+    """
+    Run every stage for one sample and write out/<base_name>.{jscore.txt,
+    tsstes.scores.txt,combined.ptf}. Returns the row counts reported in the
+    batch summary.
+    """
+    jscore_out = os.path.join(OUTDIR, f"{base_name}.jscore.txt")
+    tsstes_scores_out = os.path.join(OUTDIR, f"{base_name}.tsstes.scores.txt")
+    combined_out = os.path.join(OUTDIR, f"{base_name}.combined.ptf")
+
+    ws = Workspace(base_name, bool(os.environ.get("KEEP_TEMP")))
+    keep = ws.dir is not None
+
+    say("Step 1: Sorting and processing junctions...")
+    header, lines = read_junctions(junctions)
+    ws.write("sorted.bed", [header] + lines)
+
+    if threads > 1:
+        say(f"Running per-chromosome shards on {threads} processes...")
+        jf, tf, inter = run_sharded(coverage, binary, lines, threshold, threads, keep)
+    else:
+        jf, tf, inter, _ = process_shard(coverage, binary, lines, threshold, keep=keep, say=say)
+
+    for suffix, out in inter.items():
+        ws.write(suffix, [junction_percs.HEADER] + out if suffix == "jproc.txt" else out)
+
+    say(f"Writing junction scores -> {jscore_out}")
+    jf.to_csv(jscore_out, sep="\t", index=False)
+    jpos = jf[jf["predicted_label"] == 1]
+    ws.write_frame("jpos.txt", jpos)
+
+    say(f"Writing TSSTES scores -> {tsstes_scores_out}")
+    tf.to_csv(tsstes_scores_out, sep="\t", index=False)
+    tpos = tf[tf["predicted_label"] == 1]
+    ws.write_frame("tsstes.pos.txt", tpos)
+
+    say(f"Step 15: Combine ptfs -> {combined_out}")
+    combined = combine_positives(jpos, tpos)
+    with open(combined_out, "w") as w:
+        for r in combined:
+            w.write("\t".join(r) + "\n")
+
+    if keep:
+        say(f"KEEP_TEMP set; leaving workspace: {ws.dir}")
+    return {"junction_rows": len(jf), "junction_pos": len(jpos), "tsstes_rows": len(tf),
+            "tsstes_pos": len(tpos), "combined_rows": len(combined)}
+
+
+def evaluate(base_name, annotation, refs_dir=None, quiet=False):
+    """
+    spliceCOV.sh's evaluation of out/<base_name> against `annotation`. With
+    refs_dir the annotation references are built there once and reused.
+    """
+    env = dict(os.environ, SPLICECOV_EVAL_REFS=refs_dir) if refs_dir else None
+    out = subprocess.DEVNULL if quiet else None
+    subprocess.run(["bash", os.path.join(HELPERS_DIR, "spliceCOV.sh"), "-b", base_name, "-a", annotation],
+                   check=True, env=env, stdout=out, stderr=out)
+
+
+def run(args):
+    if not (0.0 <= args.threshold <= 1.0):
+        die(f"-s must be a number in [0,1], got '{args.threshold}'.")
+    if args.threads < 1:
+        die(f"-t must be a positive integer, got '{args.threads}'.")
+    if args.basename and re.search(r"[/ ]", args.basename):
+        die("-b basename must not contain slashes or spaces.")
+    if not os.path.isfile(args.junctions):
+        die(f"Junction file not found: {args.junctions}")
+    if not os.path.isfile(args.coverage):
+        die(f"BigWig file not found: {args.coverage}")
+    if args.annotation and not os.path.isfile(args.annotation):
+        die(f"Annotation GTF not found: {args.annotation}")
+    binary = os.path.join(HELPERS_DIR, "process_tiebrush")
+    if not os.access(binary, os.X_OK):
+        die(f"Missing helper binary: {binary}")
+
+    base_name = args.basename or os.path.splitext(os.path.basename(args.junctions))[0]
+    os.makedirs(OUTDIR, exist_ok=True)
+    log("Mode: in-memory engine")
+    run_sample(args.junctions, args.coverage, base_name, args.threshold, args.threads, binary)
+
+    if args.annotation:
+        log("Evaluation requested (-a): evaluating based on generated out/ files...")
+        evaluate(base_name, args.annotation)
+    log("spliceCOV complete!")
+
+
+# ---------------------------------------------------------------------------
+# Batch: many samples from a manifest
+# ---------------------------------------------------------------------------
+SUMMARY_COLUMNS = ["basename", "status", "seconds", "junction_rows", "junction_pos", "tsstes_rows", "tsstes_pos",
+                   "combined_rows", "junction_precision", "junction_recall", "junction_f1", "tsstes_precision", "tsstes_sensitivity"]
+
+
+def read_manifest(path):
+    """
+    [(junctions, coverage, basename)] from a manifest with one sample per
+    line: <junctions.bed> <coverage.bigWig|.scov> [basename], tab- or
+    space-separated; blank lines and '#' comments are skipped.
+    """
+    rows = []
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            a = line.split()
+            if not a or a[0].startswith("#"):
+                continue
+            if len(a) not in (2, 3):
+                die(f"{path}:{n}: expected <junctions> <coverage> [basename], got {len(a)} fields")
+            base_name = a[2] if len(a) == 3 else os.path.splitext(os.path.basename(a[0]))[0]
+            rows.append((a[0], a[1], base_name))
+    return rows
+
+
+def _init_batch_worker():
+    _init_worker()
+    # Loaded once per worker and reused for every sample it runs
+    scoring_models()
+
+
+def _batch_task(junctions, coverage, base_name, threshold, binary):
+    t0 = datetime.now()
+    try:
+        counts = run_sample(junctions, coverage, base_name, threshold, 1, binary, say=lambda msg: None)
+        status = "ok"
+    except (Exception, SystemExit) as e:  # keep the other samples going
+        counts, status = {}, " ".join(f"failed: {type(e).__name__}: {e}".split())
+    return dict(counts, basename=base_name, status=status, seconds=f"{(datetime.now() - t0).total_seconds():.1f}")
+
+
+def _eval_metrics(base_name):
+    """Precision/recall figures from out/<base_name>.eval.*.txt (missing ones are left out)."""
+    m = {}
+    for suffix, fields in (("eval.junctions.txt", (("junction_precision", "Precision"), ("junction_recall", "Recall"),
+                                                    ("junction_f1", "F1 Score"))),
+                           ("eval.tsstes.txt", (("tsstes_precision", "Precision"), ("tsstes_sensitivity", "Sensitivity")))):
+        try:
+            with open(os.path.join(OUTDIR, f"{base_name}.{suffix}")) as f:
+                text = f.read()
+        except OSError:
+            continue
+        for key, label in fields:
+            hit = re.search(rf"^{label}:\s*(\S+)", text, re.M)
+            if hit:
+                m[key] = hit.group(1)
+    return m
+
+
+def batch(args):
+    if not (0.0 <= args.threshold <= 1.0):
+        die(f"-s must be a number in [0,1], got '{args.threshold}'.")
+    if args.threads < 1:
+        die(f"-t must be a positive integer, got '{args.threads}'.")
+    if not os.path.isfile(args.manifest):
+        die(f"Manifest not found: {args.manifest}")
+    if args.annotation and not os.path.isfile(args.annotation):
+        die(f"Annotation GTF not found: {args.annotation}")
+    binary = os.path.join(HELPERS_DIR, "process_tiebrush")
+    if not os.access(binary, os.X_OK):
+        die(f"Missing helper binary: {binary}")
+
+    samples = read_manifest(args.manifest)
+    if not samples:
+        die(f"No samples in {args.manifest}")
+    seen = set()
+    for junctions, coverage, base_name in samples:
+        if re.search(r"[/ ]", base_name):
+            die(f"basename '{base_name}' must not contain slashes or spaces.")
+        if base_name in seen:
+            die(f"basename '{base_name}' appears twice in {args.manifest}; outputs would collide.")
+        seen.add(base_name)
+        if not os.path.isfile(junctions):
+            die(f"Junction file not found: {junctions}")
+        if not os.path.isfile(coverage):
+            die(f"BigWig file not found: {coverage}")
+
+    # Samples running at once: the CPU budget, capped by the memory budget
+    workers = min(args.threads, len(samples))
+    if args.mem_gb is not None:
+        workers = max(1, min(workers, int(args.mem_gb // args.job_mem_gb)))
+    summary_out = args.summary or os.path.join(
+        OUTDIR, os.path.splitext(os.path.basename(args.manifest))[0] + ".summary.tsv")
+    os.makedirs(OUTDIR, exist_ok=True)
+    log(f"Mode: batch ({len(samples)} samples, {workers} at a time)")
+
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as pool:
+        futures = {}
+        # Largest inputs first so they do not end up as the tail
+        for junctions, coverage, base_name in sorted(samples, key=lambda s: -os.path.getsize(s[0])):
+            futures[pool.submit(_batch_task, junctions, coverage, base_name, args.threshold, binary)] = base_name
+        for fut in concurrent.futures.as_completed(futures):
+            r = fut.result()
+            results[r["basename"]] = r
+            log(f"  {r['basename']}: {r['status']} in {r['seconds']} s ({len(results)}/{len(samples)})")
+
+    if args.annotation:
+        done = [b for _, _, b in samples if results[b]["status"] == "ok"]
+        refs_dir = tempfile.mkdtemp(prefix=".eval.refs.", dir=OUTDIR)
+        try:
+            log(f"Evaluating {len(done)} samples against {args.annotation} (references built once)...")
+
+            def eval_one(base_name):
+                try:
+                    evaluate(base_name, args.annotation, refs_dir, quiet=True)
+                except subprocess.CalledProcessError as e:
+                    results[base_name]["status"] = f"eval failed: exit {e.returncode}"
+            # The first run builds the references; the rest reuse them
+            if done:
+                eval_one(done[0])
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as tp:
+                list(tp.map(eval_one, done[1:]))
+        finally:
+            shutil.rmtree(refs_dir, ignore_errors=True)
+        for b in done:
+            results[b].update(_eval_metrics(b))
+
+    with open(summary_out, "w") as w:
+        w.write("\t".join(SUMMARY_COLUMNS) + "\n")
+        for _, _, base_name in samples:
+            r = results[base_name]
+            w.write("\t".join(str(r.get(c, "")) for c in SUMMARY_COLUMNS) + "\n")
+    failed = [b for b, r in results.items() if r["status"] != "ok"]
+    log(f"Summary -> {summary_out}")
+    if failed:
+        die(f"{len(failed)} of {len(samples)} samples failed: {', '.join(failed)}")
+    log("spliceCOV batch complete!")
+
+
+def index(args):
+    if not os.path.isfile(args.coverage):
+        die(f"BigWig file not found: {args.coverage}")
+    out = args.output or os.path.splitext(args.coverage)[0] + ".scov"
+    log(f"Indexing {args.coverage} -> {out}")
+    n = scov.write_scov(args.coverage, out)
+    log(f"Wrote {n} intervals; pass {out} to -c in place of the bigWig.")
+
+
+def annotate_index(args):
+    if not os.path.isfile(args.annotation):
+        die(f"Annotation GTF not found: {args.annotation}")
+    out = annotation_index.index_path(args.annotation)
+    log(f"Indexing {args.annotation} -> {out}")
+    idx = annotation_index.AnnotationIndex.from_gtf(args.annotation)
+    idx.save(out, args.annotation)
+    log(f"Wrote {sum(len(v) for v in idx.ss.values())} splice sites and "
+        f"{sum(len(v[0]) for v in idx.tsstes.values())} TSS/CPAS; evaluation with -a {args.annotation} reuses it.")
+
+
+def sweep_thresholds(args):
+    if not os.path.isfile(args.annotation):
+        die(f"Annotation GTF not found: {args.annotation}")
+    for suffix in ("jscore.txt", "tsstes.scores.txt"):
+        path = os.path.join(OUTDIR, f"{args.basename}.{suffix}")
+        if not os.path.isfile(path):
+            die(f"Missing: {path} (run the pipeline first, or use the correct -b)")
+    thresholds = None
+    if args.thresholds:
+        try:
+            thresholds = [float(v) for v in args.thresholds.split(",") if v.strip()]
+        except ValueError:
+            die(f"-s must be a comma-separated list of numbers, got '{args.thresholds}'.")
+        if not thresholds or not all(0.0 <= t <= 1.0 for t in thresholds):
+            die(f"-s thresholds must be in [0,1], got '{args.thresholds}'.")
+    out = args.output or os.path.join(OUTDIR, f"{args.basename}.{'prcurve' if args.curve else 'sweep'}.tsv")
+    log(f"Sweeping thresholds for {args.basename} against {args.annotation}...")
+    df = threshold_sweep.sweep(args.basename, args.annotation, thresholds, curve=args.curve)
+    threshold_sweep.write_sweep(df, out)
+    if len(df):
+        best = df.loc[df["junction_f1"].idxmax()]
+        log(f"Best junction F1 {best['junction_f1']:.4f} at -s {best['threshold']:g}")
+    log(f"{len(df)} thresholds -> {out}")
+
+
+def positive_gb(value):
+    """argparse type for a memory size in GB: a finite number > 0."""
+    try:
+        gb = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number of GB, got '{value}'")
+    if not (0.0 < gb < float("inf")):
+        raise argparse.ArgumentTypeError(f"must be a finite number > 0, got '{value}'")
+    return gb
+
+
+def main():
+    p = argparse.ArgumentParser(prog="splicecov", description="SpliceCOV single-process pipeline engine.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("run", help="Run the full pipeline in one process (no step-by-step temp files).")
+    r.add_argument("-j", dest="junctions", required=True, help="Input TieBrush junction file.")
+    r.add_argument("-c", dest="coverage", required=True, help="Input coverage BigWig (or .scov index) file.")
+    r.add_argument("-a", dest="annotation", default=None, help="Annotation GTF; runs evaluation afterwards.")
+    r.add_argument("-b", dest="basename", default=None, help="Basename for all output files (default: from -j).")
+    r.add_argument("-s", dest="threshold", type=float, default=0.4, help="LightGBM scoring threshold [0,1] (default: 0.4).")
+    r.add_argument("-t", "--threads", dest="threads", type=int, default=1,
+                   help="Process chromosomes in parallel on this many processes (default: 1).")
+    r.set_defaults(func=run)
+
+    b = sub.add_parser("batch", help="Run many samples from a manifest on a pool of worker processes.")
+    b.add_argument("-m", dest="manifest", required=True,
+                   help="Manifest: one '<junctions> <coverage> [basename]' line per sample.")
+    b.add_argument("-a", dest="annotation", default=None, help="Annotation GTF; evaluates every sample against it.")
+    b.add_argument("-s", dest="threshold", type=float, default=0.4, help="LightGBM scoring threshold [0,1] (default: 0.4).")
+    b.add_argument("-t", "--threads", dest="threads", type=int, default=os.cpu_count() or 1,
+                   help="CPU budget: samples run at once (default: all CPUs).")
+    b.add_argument("--mem-gb", dest="mem_gb", type=positive_gb, default=None,
+                   help="Memory budget in GB; caps the samples run at once to mem-gb / job-mem-gb.")
+    b.add_argument("--job-mem-gb", dest="job_mem_gb", type=positive_gb, default=4.0,
+                   help="Memory one sample needs, for --mem-gb (default: 4).")
+    b.add_argument("-o", dest="summary", default=None,
+                   help="Summary table (default: out/<manifest name>.summary.tsv).")
+    b.set_defaults(func=batch)
+
+    i = sub.add_parser("index", help="Convert a bigWig into a memory-mapped .scov coverage file.")
+    i.add_argument("-c", dest="coverage", required=True, help="Input coverage BigWig file.")
+    i.add_argument("-o", dest="output", default=None, help="Output .scov path (default: <coverage>.scov).")
+    i.set_defaults(func=index)
+
+    a = sub.add_parser("annotate-index", help="Index an annotation GTF's splice sites and TSS/CPAS for evaluation.")
+    a.add_argument("-a", dest="annotation", required=True, help="Annotation GTF (index written to <gtf>.annidx).")
+    a.set_defaults(func=annotate_index)
+
+    w = sub.add_parser("sweep", help="Precision/recall over many -s thresholds from existing out/ scores.")
+    w.add_argument("-b", dest="basename", required=True, help="Basename of out/<basename>.{jscore,tsstes.scores}.txt.")
+    w.add_argument("-a", dest="annotation", required=True, help="Annotation GTF.")
+    w.add_argument("-s", dest="thresholds", default=None,
+                   help="Comma-separated thresholds (default: 0.05,0.10,...,0.95).")
+    w.add_argument("--curve", action="store_true", help="Evaluate at every distinct score (full PR curve).")
+    w.add_argument("-o", dest="output", default=None,
+                   help="Output TSV (default: out/<basename>.sweep.tsv, or .prcurve.tsv with --curve).")
+    w.set_defaults(func=sweep_thresholds)
+
+    args = p.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Precision/recall over many -s thresholds from one set of scores.
+
+The threshold only turns confidence_score into predicted_label (score >=
+threshold); every other stage is the same, so out/<base>.jscore.txt and
+out/<base>.tsstes.scores.txt from any run hold what an eval-only run at
+any threshold would see. For each threshold this gives the figures
+evaluate_ptf_new.py and evaluate_TSSTES_new.py print for the positives at
+that threshold:
+
+  junctions  a (chrom, pos) is predicted at t when its best score is >= t;
+             TP/FP are predicted positions in/not in the annotation splice
+             sites, FN the splice sites not predicted.
+  TSS/CPAS   every row with score >= t is a prediction; TP/FP are rows
+             within 50 bp of an annotated TSS/CPAS or not, FN the annotated
+             positions with no predicted row within 50 bp.
+
+Rows the scorers label 0 at any threshold are left out: junctions caught
+by the smooth_metric/perc_cov_diff/junc_len override or with cov_change_dir
+0, and TSS/CPAS rows with no model. The scorers write them with score 0.0
+and label 0; a model score (a sigmoid) is never exactly 0.0, so they are
+the rows with score 0.0 and label 0. Counting them would add predictions at
+t = 0 that a -s 0 run does not make.
+
+Each score set is sorted once; the counts at a threshold are then the
+number of sorted scores >= t (searchsorted), so a grid or a full PR curve
+costs no more than a single threshold. FN for TSS/CPAS uses, per annotated
+position, the best score among the rows in its window.
+
+Usage: threshold_sweep.py <base> <annotation.gtf> [<threshold> ...]
+       (reads out/<base>.*; default grid 0.05, 0.10, ..., 0.95)
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import annotation_index
+
+OUTDIR = "out"
+WINDOW = 50
+DEFAULT_GRID = [round(0.05 * i, 2) for i in range(1, 20)]
+COLUMNS = ["threshold",
+           "junction_tp", "junction_fp", "junction_fn", "junction_precision", "junction_recall", "junction_f1",
+           "tsstes_tp", "tsstes_fp", "tsstes_fn", "tsstes_precision", "tsstes_sensitivity"]
+
+
+def _read_scores(path):
+    """chromosome/position/confidence_score of the rows a threshold can label 1."""
+    df = pd.read_csv(path, sep="\t", usecols=["chromosome", "position", "confidence_score", "predicted_label"],
+                     dtype={"chromosome": str, "position": np.int64, "confidence_score": np.float64})
+    pinned = (df["confidence_score"] == 0.0) & (df["predicted_label"] == 0)
+    return df.loc[~pinned, ["chromosome", "position", "confidence_score"]]
+
+
+def _by_chrom(df):
+    for chrom, g in df.groupby("chromosome", sort=False):
+        yield chrom, g["position"].to_numpy(), g["confidence_score"].to_numpy()
+
+
+def junction_scores(jscore, ref):
+    """
+    Sorted best scores of the predicted junction positions that are / are not
+    annotated splice sites, and the number of annotated splice sites.
+    """
+    best = jscore.groupby(["chromosome", "position"], sort=False)["confidence_score"].max().reset_index()
+    hit, miss = [], []
+    for chrom, pos, score in _by_chrom(best):
+        sites = ref.ss.get(chrom)
+        known = np.isin(pos, sites) if sites is not None else np.zeros(len(pos), dtype=bool)
+        hit.append(score[known])
+        miss.append(score[~known])
+    n_ref = sum(len(v) for v in ref.ss.values())
+    return np.sort(np.concatenate(hit or [[]])), np.sort(np.concatenate(miss or [[]])), n_ref
+
+
+def tsstes_scores(tsstes, ref):
+    """
+    Sorted scores of the TSS/CPAS rows within WINDOW of an annotated position
+    / not, and per annotated position the best score of the rows within
+    WINDOW of it (-inf when none), sorted.
+    """
+    hit, miss, cover = [], [], []
+    rows = {chrom: (pos, score) for chrom, pos, score in _by_chrom(tsstes)}
+    for chrom, (pos, score) in rows.items():
+        ref_pos = ref.tsstes.get(chrom, (np.empty(0, dtype=np.int64),))[0]
+        found = (np.searchsorted(ref_pos, pos - WINDOW, side="left")
+                 < np.searchsorted(ref_pos, pos + WINDOW, side="right"))
+        hit.append(score[found])
+        miss.append(score[~found])
+    for chrom, (ref_pos, _) in ref.tsstes.items():
+        pos, score = rows.get(chrom, (np.empty(0, dtype=np.int64), np.empty(0)))
+        order = np.argsort(pos, kind="stable")
+        pos, score = pos[order], score[order]
+        lo = np.searchsorted(pos, ref_pos - WINDOW, side="left")
+        hi = np.searchsorted(pos, ref_pos + WINDOW, side="right")
+        # max(score[lo:hi]) per annotated position; reduceat over (lo, hi) pairs
+        vals = np.append(score, -np.inf)
+        best = np.maximum.reduceat(vals, np.column_stack([lo, hi]).ravel())[::2] if len(lo) else np.empty(0)
+        best[lo >= hi] = -np.inf
+        cover.append(best)
+    return (np.sort(np.concatenate(hit or [[]])), np.sort(np.concatenate(miss or [[]])),
+            np.sort(np.concatenate(cover or [[]])))
+
+
+def _at_least(sorted_scores, thresholds):
+    return len(sorted_scores) - np.searchsorted(sorted_scores, thresholds, side="left")
+
+
+def _ratio(a, b):
+    return np.divide(a, b, out=np.zeros(len(a)), where=b > 0)
+
+
+def sweep(base_name, annotation, thresholds=None, curve=False):
+    """
+    DataFrame with one row of counts and metrics per threshold. curve=True
+    evaluates at every distinct score instead of `thresholds`.
+    """
+    ref, _ = annotation_index.load_for(annotation)
+    j_hit, j_miss, j_ref = junction_scores(_read_scores(os.path.join(OUTDIR, f"{base_name}.jscore.txt")), ref)
+    t_hit, t_miss, t_cover = tsstes_scores(_read_scores(os.path.join(OUTDIR, f"{base_name}.tsstes.scores.txt")), ref)
+    if curve:
+        t = np.unique(np.concatenate([j_hit, j_miss, t_hit, t_miss]))
+    else:
+        t = np.array(sorted(DEFAULT_GRID if thresholds is None else thresholds), dtype=np.float64)
+
+    jtp, jfp = _at_least(j_hit, t), _at_least(j_miss, t)
+    jfn = j_ref - jtp
+    jprec, jrec = _ratio(jtp, jtp + jfp), _ratio(jtp, jtp + jfn)
+    jf1 = _ratio(2 * jprec * jrec, jprec + jrec)
+    ttp, tfp = _at_least(t_hit, t), _at_least(t_miss, t)
+    tfn = len(t_cover) - _at_least(t_cover, t)
+    return pd.DataFrame({
+        "threshold": t,
+        "junction_tp": jtp, "junction_fp": jfp, "junction_fn": jfn,
+        "junction_precision": jprec, "junction_recall": jrec, "junction_f1": jf1,
+        "tsstes_tp": ttp, "tsstes_fp": tfp, "tsstes_fn": tfn,
+        "tsstes_precision": _ratio(ttp, ttp + tfp), "tsstes_sensitivity": _ratio(ttp, ttp + tfn),
+    }, columns=COLUMNS)
+
+
+def write_sweep(df, out):
+    """TSV with the metrics to 4 decimals, as the evaluators print them; thresholds in full."""
+    df = df.copy()
+    for c in ("junction_precision", "junction_recall", "junction_f1", "tsstes_precision", "tsstes_sensitivity"):
+        df[c] = df[c].map("{:.4f}".format)
+    df.to_csv(out, sep="\t", index=False)
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(f"Usage: {sys.argv[0]} <base> <annotation.gtf> [<threshold> ...]", file=sys.stderr)
+        sys.exit(1)
+    thresholds = [float(v) for v in sys.argv[3:]] or None
+    write_sweep(sweep(sys.argv[1], sys.argv[2], thresholds), sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+/*
+ * Micro-benchmarks of process_tiebrush: the changepoint scan (get_drop) on
+ * synthetic bundles, from junction-sparse to junction-dense, and the
+ * bedGraph/junction line parsers in MB/s next to the sscanf formats they
+ * replaced. The scan checksum covers every drop_arr entry, so runs of two
+ * builds can be compared.
+ *
+ * Build and run: make bench
+ */
+#define main process_tiebrush_main
+#include "../scripts/process_tiebrush.c"
+#undef main
+
+#include <time.h>
+
+static unsigned long long rng_state = 88172645463325252ULL;
+
+static unsigned rnd(void) {
+    rng_state ^= rng_state << 13;
+    rng_state ^= rng_state >> 7;
+    rng_state ^= rng_state << 17;
+    return (unsigned)rng_state;
+}
+
+static double now(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+// One contiguous bundle of len bases with a junction start or end every
+// `spacing` bases on average; coverage steps up and down between them.
+static void make_bundle(Bundle *ctx, int len, int spacing) {
+    int pos = 1000;
+    double cov = 40;
+    while (pos < 1000 + len) {
+        int seg = 1 + rnd() % 20;
+        if (pos + seg > 1000 + len) seg = 1000 + len - pos;
+        if (rnd() % 8 == 0) cov = 5 + rnd() % 200;
+        else cov += (double)(rnd() % 5) - 2;
+        if (cov < 1) cov = 1;
+        push_covg(ctx, pos, pos + seg - 1, cov);
+        pos += seg;
+    }
+    for (int s = 1000 + rnd() % spacing; s < 1000 + len; s += 1 + rnd() % (2 * spacing)) {
+        int e = s + 50 + rnd() % 5000;
+        if (e >= 1000 + len) continue;
+        char strand = rnd() % 2 ? '+' : '-';
+        JuncEntry j = {s, e, 1 + rnd() % 40, 0, strand};
+        push_junc(&ctx->junc, &ctx->junc_size, &ctx->junc_cap, &j);
+    }
+}
+
+static void run_case(const char *name, int len, int spacing, int reps) {
+    Bundle ctx = {0};
+    make_bundle(&ctx, len, spacing);
+    int nj = ctx.junc_size;
+    sort_jend(&ctx, nj);
+
+    double t0 = now();
+    for (int r = 0; r < reps; r++) {
+        int js = 0;
+        int je = 0;
+        clear_drop(&ctx);
+        get_drop(&ctx, 0, ctx.covg_size - 1, ctx.covg_size, &js, &je, js, je, nj);
+    }
+    double dt = (now() - t0) / reps;
+
+    // FNV-1a over the raw drop entries
+    unsigned long long hash = 1469598103934665603ULL;
+    for (int i = 0; i < ctx.drop_size; i++) {
+        DropEntry d = ctx.drop_arr[i];
+        unsigned long long words[3];
+        words[0] = (unsigned long long)(unsigned)d.pos;
+        memcpy(&words[1], &d.perc, sizeof(double));
+        memcpy(&words[2], &d.covdiff, sizeof(double));
+        for (int w = 0; w < 3; w++) {
+            hash = (hash ^ words[w]) * 1099511628211ULL;
+        }
+    }
+    printf("%-8s %8d bp %6d junctions %8.2f ms %8.2f Mbp/s  drops %5d  checksum %016llx\n",
+           name, len, nj, dt * 1e3, len / dt / 1e6, ctx.drop_size, hash);
+    free_bundle(&ctx);
+}
+
+// Synthetic input text of about `bytes` bytes
+static char *make_text(size_t bytes, int junctions, size_t *len) {
+    char *text = malloc(bytes + 256);
+    size_t n = 0;
+    int pos = 10000;
+    while (n < bytes) {
+        int seg = 1 + rnd() % 30;
+        if (junctions) {
+            n += sprintf(text + n, "chr%u\t%d\t%d\tJUNC%08u\t%u\t%c\t%u.%04u-%u.%04u-%u.%04u-%u.%04u\n",
+                         1 + rnd() % 22, pos, pos + 100 + (int)(rnd() % 20000), rnd() % 100000000u, 1 + rnd() % 500,
+                         "+-."[rnd() % 3], rnd() % 2, rnd() % 10000, rnd() % 4, rnd() % 10000,
+                         rnd() % 2, rnd() % 10000, rnd() % 2, rnd() % 10000);
+        } else if (rnd() % 4) {
+            n += sprintf(text + n, "chr%u\t%d\t%d\t%u\n", 1 + rnd() % 22, pos, pos + seg, 1 + rnd() % 300);
+        } else {
+            n += sprintf(text + n, "chr%u\t%d\t%d\t%u.%u\n", 1 + rnd() % 22, pos, pos + seg, rnd() % 300, rnd() % 100);
+        }
+        pos += seg;
+    }
+    *len = n;
+    return text;
+}
+
+static void parse_case(const char *name, int junctions, size_t bytes) {
+    size_t len;
+    char *text = make_text(bytes, junctions, &len);
+    char chrname[256];
+    int start, end;
+    double cov, ps, po, pl, pr;
+    char strand;
+    double sum_new = 0;
+    double sum_old = 0;
+
+    double t0 = now();
+    const char *p = text;
+    const char *text_end = text + len;
+    while (p < text_end) {
+        const char *nl = memchr(p, '\n', text_end - p);
+        int ok = junctions
+            ? parse_junc_line(p, nl, chrname, &start, &end, &cov, &strand, &ps, &po, &pl, &pr)
+            : parse_cov_line(p, nl, chrname, &start, &end, &cov);
+        if (ok) sum_new += start + end + cov;
+        p = nl + 1;
+    }
+    double t_new = now() - t0;
+
+    t0 = now();
+    char line[4096];
+    p = text;
+    while (p < text_end) {
+        const char *nl = memchr(p, '\n', text_end - p);
+        size_t n = nl - p + 1;
+        memcpy(line, p, n);
+        line[n] = '\0';
+        int ok;
+        if (junctions) {
+            char name[256], strand_str[8], percs[256];
+            ok = sscanf(line, "%255s\t%d\t%d\t%255s\t%lf\t%7s\t%255s",
+                        chrname, &start, &end, name, &cov, strand_str, percs) == 7 &&
+                 sscanf(percs, "%lf-%lf-%lf-%lf", &ps, &po, &pl, &pr) == 4;
+        } else {
+            ok = sscanf(line, "%255s\t%d\t%d\t%lf", chrname, &start, &end, &cov) == 4;
+        }
+        if (ok) sum_old += start + end + cov;
+        p = nl + 1;
+    }
+    double t_old = now() - t0;
+
+    printf("%-9s %6.1f MB  parser %7.1f MB/s  sscanf %7.1f MB/s  %s\n", name, len / 1e6,
+           len / t_new / 1e6, len / t_old / 1e6, sum_new == sum_old ? "same values" : "VALUES DIFFER");
+    free(text);
+}
+
+int main(int argc, char *argv[]) {
+    int reps = argc > 1 ? atoi(argv[1]) : 5;
+    run_case("sparse", 1000000, 2000, reps);
+    run_case("typical", 1000000, 200, reps);
+    run_case("dense", 1000000, 20, reps);
+    run_case("hotspot", 200000, 3, reps);
+    parse_case("bedGraph", 0, 64 << 20);
+    parse_case("junctions", 1, 32 << 20);
+    return 0;
+}
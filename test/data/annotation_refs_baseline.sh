@@ -0,0 +1,108 @@
+#!/usr/bin/env bash
+# Evaluation references as spliceCOV.sh built them before annotation_index.py
+# (build_annotation_splice_sites and build_annotation_tsstes, copied
+# unchanged), for test_annotation_index.py. Run with LC_ALL=C: the
+# references are sorted in byte order now, as evaluate_ptf_new.py's
+# merge-join needs.
+# Usage: annotation_refs_baseline.sh <scripts dir> <annotation.gtf> <splice_sites.bed> <tsstes.bed>
+set -euo pipefail
+
+helpers_dir="$1"
+
+build_annotation_splice_sites() {
+  # outputs a 2-col file: chr <space/tab> pos
+  local gtf="$1"
+  local out="$2"
+  local tmp_introns="$3"
+
+  python3 "${helpers_dir}/gtf_to_intron_bed.py" "$gtf" "$tmp_introns"
+
+  # intron bed is expected: chr start end ...
+  awk 'BEGIN{OFS="\t"} {print $1,$2; print $1,$3}' "$tmp_introns" \
+    | sort -k1,1 -k2,2n | uniq > "$out"
+}
+
+build_annotation_tsstes() {
+  # outputs: chr \t pos \t TYPE  where TYPE in {TSS,CPAS}
+  # Prefers 'transcript' features if present; else infers per transcript_id from exons.
+  local gtf="$1"
+  local out="$2"
+
+  python3 - "$gtf" "$out" <<'PY'
+import sys, re
+gtf, outp = sys.argv[1], sys.argv[2]
+
+attr_re = re.compile(r'(\S+)\s+"([^"]+)"')
+
+def parse_attrs(s):
+    d={}
+    for m in attr_re.finditer(s):
+        d[m.group(1)] = m.group(2)
+    return d
+
+# We will collect:
+# - transcript features if present: tid -> (chr,strand,start,end)
+# - else exon extrema per transcript_id: tid -> min_start, max_end, chr,strand
+tx = {}
+exon_ext = {}
+
+with open(gtf, "r", encoding="utf-8", errors="replace") as f:
+    for line in f:
+        if not line or line[0] == "#":
+            continue
+        parts = line.rstrip("\n").split("\t")
+        if len(parts) < 9:
+            continue
+        chrom, source, feature, start, end, score, strand, frame, attrs = parts
+        try:
+            start_i = int(start)
+            end_i = int(end)
+        except:
+            continue
+        a = parse_attrs(attrs)
+        tid = a.get("transcript_id") or a.get("transcriptId") or a.get("transcript")  # last one is rare
+        if not tid:
+            continue
+
+        if feature == "transcript":
+            tx[tid] = (chrom, strand, start_i, end_i)
+        elif feature == "exon":
+            v = exon_ext.get(tid)
+            if v is None:
+                exon_ext[tid] = [chrom, strand, start_i, end_i]
+            else:
+                # keep chrom/strand as first-seen; update bounds
+                v[2] = min(v[2], start_i)
+                v[3] = max(v[3], end_i)
+
+# Choose transcript coords source
+coords = tx if tx else exon_ext
+
+# Emit unique positions
+seen = set()
+out = []
+for tid, (chrom, strand, s, e) in coords.items():
+    if strand == "+":
+        tss = s
+        cpas = e
+    else:
+        tss = e
+        cpas = s
+    k1 = (chrom, tss, "TSS")
+    k2 = (chrom, cpas, "CPAS")
+    if k1 not in seen:
+        seen.add(k1); out.append(k1)
+    if k2 not in seen:
+        seen.add(k2); out.append(k2)
+
+out.sort(key=lambda x: (x[0], x[1], x[2]))
+with open(outp, "w") as w:
+    for chrom, pos, typ in out:
+        w.write(f"{chrom}\t{pos}\t{typ}\n")
+PY
+}
+
+tmp_introns="$(mktemp)"
+trap 'rm -f "$tmp_introns"' EXIT
+build_annotation_splice_sites "$2" "$3" "$tmp_introns" > /dev/null
+build_annotation_tsstes "$2" "$4"
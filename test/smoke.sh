@@ -3,8 +3,8 @@ set -euo pipefail
 
 # This script fabricates tiny junctions/coverage/gtf inputs, then runs a minimal pipeline.
 # Requirements (provided by CI steps):
-#   - bedGraphToBigWig  (downloaded per OS)
-#   - bigWigToBedGraph  (already installed by CI steps)
+#   - bedGraphToBigWig  (downloaded per OS; only builds the test bigWig)
+#   - pyBigWig          (from requirements.txt; reads the bigWig)
 #   - bash, coreutils, awk
 
 ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+scripts/annotation_index.py: `refs` must write the splice-site and TSS/CPAS
+references spliceCOV.sh built before it (gtf_to_intron_bed.py | sort | uniq
+and the TSS/CPAS heredoc, kept in test/data/annotation_refs_baseline.sh),
+from the GTF and from a saved .annidx, for GTFs with and without transcript
+features; and a saved index must stop being used once the GTF changes.
+
+Run: python3 -m unittest discover -s test
+"""
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT_DIR, "scripts")
+DATA = os.path.join(ROOT_DIR, "test", "data")
+sys.path.insert(0, SCRIPTS)
+
+import annotation_index  # noqa: E402
+
+BASELINE = os.path.join(DATA, "annotation_refs_baseline.sh")
+CHROMS = ["chr1", "chr10", "chr1_random", "chr2"]
+
+
+def write_gtf(path, rng, n, transcripts):
+    """
+    n random multi- and single-exon transcripts on both strands, exons out of
+    order, shared boundaries, gene/CDS lines and comments; transcript=True adds
+    a transcript feature per transcript.
+    """
+    lines = ["##description: test annotation", "#!genome-build test"]
+    for t in range(n):
+        chrom, strand = rng.choice(CHROMS), rng.choice("+-")
+        pos = rng.choice([100, 500, 1000]) + rng.randint(0, 50) * 10
+        exons = []
+        for _ in range(rng.randint(1, 5)):
+            length = rng.randint(1, 30) * 10
+            exons.append((pos, pos + length))
+            pos += length + rng.randint(1, 40) * 10
+        gene = f"G{t // 2}"
+        attrs = (f'gene_id "{gene}"; transcript_id "T{t}";' if t % 3
+                 else f'gene_id "{gene}"; gene_name "N{t}"; transcript_id "T{t}"; exon_number "1";')
+        if t % 2 == 0:
+            lines.append(f"{chrom}\ttest\tgene\t{exons[0][0]}\t{exons[-1][1]}\t.\t{strand}\t.\tgene_id \"{gene}\";")
+        if transcripts:
+            lines.append(f"{chrom}\ttest\ttranscript\t{exons[0][0] - rng.randint(0, 1) * 5}\t{exons[-1][1]}"
+                         f"\t.\t{strand}\t.\t{attrs}")
+        order = list(range(len(exons)))
+        rng.shuffle(order)
+        for i in order:
+            s, e = exons[i]
+            lines.append(f"{chrom}\ttest\texon\t{s}\t{e}\t.\t{strand}\t.\t{attrs}")
+            if i == 0:
+                lines.append(f"{chrom}\ttest\tCDS\t{s}\t{e}\t.\t{strand}\t0\t{attrs}")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class AnnotationRefsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="splicecov-test-")
+        self.gtf = os.path.join(self.tmp, "annotation.gtf")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def refs(self, cmd):
+        ss, tsstes = os.path.join(self.tmp, "ss.bed"), os.path.join(self.tmp, "tsstes.bed")
+        subprocess.run(cmd + [ss, tsstes], check=True, capture_output=True, env=dict(os.environ, LC_ALL="C"))
+        return read(ss), read(tsstes)
+
+    def test_refs_match_baseline(self):
+        rng = random.Random(22)
+        for trial in range(12):
+            transcripts = trial % 2 == 0
+            write_gtf(self.gtf, rng, rng.randint(1, 40), transcripts)
+            with self.subTest(trial=trial, transcripts=transcripts):
+                expected = self.refs(["bash", BASELINE, SCRIPTS, self.gtf])
+                self.assertTrue(expected[1])
+                refs = [sys.executable, os.path.join(SCRIPTS, "annotation_index.py"), "refs", self.gtf]
+                self.assertEqual(self.refs(refs), expected)
+                annotation_index.AnnotationIndex.from_gtf(self.gtf).save(annotation_index.index_path(self.gtf),
+                                                                         self.gtf)
+                self.assertEqual(self.refs(refs), expected)  # now read from the .annidx
+                os.remove(annotation_index.index_path(self.gtf))
+
+
+class AnnotationIndexFreshnessTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="splicecov-test-")
+        self.gtf = os.path.join(self.tmp, "annotation.gtf")
+        write_gtf(self.gtf, random.Random(1), 20, transcripts=True)
+        self.idx = annotation_index.index_path(self.gtf)
+        annotation_index.AnnotationIndex.from_gtf(self.gtf).save(self.idx, self.gtf)
+        self.assertTrue(annotation_index.is_fresh(self.idx, self.gtf))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def bump_mtime(self):
+        st = os.stat(self.gtf)
+        os.utime(self.gtf, ns=(st.st_atime_ns, st.st_mtime_ns + 2_000_000_000))
+
+    def assertRefsOf(self, idx, gtf):
+        expected = annotation_index.AnnotationIndex.from_gtf(gtf)
+        self.assertEqual({c: v.tolist() for c, v in idx.ss.items()},
+                         {c: v.tolist() for c, v in expected.ss.items()})
+        self.assertEqual({c: [a.tolist() for a in v] for c, v in idx.tsstes.items()},
+                         {c: [a.tolist() for a in v] for c, v in expected.tsstes.items()})
+
+    def test_unchanged(self):
+        with mock.patch.object(annotation_index, "gtf_sha256", wraps=annotation_index.gtf_sha256) as sha:
+            idx, cached = annotation_index.load_for(self.gtf)
+        self.assertTrue(cached)
+        sha.assert_not_called()  # size and mtime match
+        self.assertRefsOf(idx, self.gtf)
+
+    def test_touched(self):
+        # Same contents, new mtime: the stat check fails and the hash decides
+        self.bump_mtime()
+        with mock.patch.object(annotation_index, "gtf_sha256", wraps=annotation_index.gtf_sha256) as sha:
+            self.assertTrue(annotation_index.is_fresh(self.idx, self.gtf))
+        sha.assert_called_once_with(self.gtf)
+        idx, cached = annotation_index.load_for(self.gtf)
+        self.assertTrue(cached)
+        self.assertRefsOf(idx, self.gtf)
+
+    def test_appended(self):
+        with open(self.gtf, "a") as f:
+            f.write('chr3\ttest\texon\t100\t200\t.\t+\t.\ttranscript_id "X1";\n'
+                    'chr3\ttest\texon\t300\t400\t.\t+\t.\ttranscript_id "X1";\n')
+        self.assertFalse(annotation_index.is_fresh(self.idx, self.gtf))
+        idx, cached = annotation_index.load_for(self.gtf)
+        self.assertFalse(cached)
+        self.assertEqual(idx.ss["chr3"].tolist(), [200, 300])
+        self.assertRefsOf(idx, self.gtf)
+
+    def test_rewritten_same_size(self):
+        text = read(self.gtf)
+        # One digit of an exon end changed: same size, other splice sites
+        i = text.index("\texon\t")
+        j = text.index("\t", i + 6)
+        end = text.index("\t", j + 1)
+        digit = text[end - 1]
+        changed = text[:end - 1] + ("1" if digit != "1" else "2") + text[end:]
+        self.assertEqual(len(changed), len(text))
+        with open(self.gtf, "w") as f:
+            f.write(changed)
+        self.bump_mtime()
+        self.assertFalse(annotation_index.is_fresh(self.idx, self.gtf))
+        idx, cached = annotation_index.load_for(self.gtf)
+        self.assertFalse(cached)
+        self.assertRefsOf(idx, self.gtf)
+
+    def test_stale_index_is_rebuilt_fresh(self):
+        with open(self.gtf, "a") as f:
+            f.write("# trailing comment\n")
+        self.assertFalse(annotation_index.is_fresh(self.idx, self.gtf))
+        annotation_index.AnnotationIndex.from_gtf(self.gtf).save(self.idx, self.gtf)
+        self.assertTrue(annotation_index.is_fresh(self.idx, self.gtf))
+
+
+if __name__ == "__main__":
+    unittest.main()
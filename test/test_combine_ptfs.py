@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+scripts/combine_ptfs must write what combine_ptfs.sh's `awk | sort -u`
+fallback writes: on junction rows nearly sorted as the scorer writes them
+(each JEND after its JSTART) and chromosomes interleaved across the two
+inputs. Inputs it cannot merge in one pass (a chromosome split into two
+runs, runs out of byte order, a non-integer or zero-padded position) must
+exit 3 without output so combine_ptfs.sh takes the fallback, as it does
+when the binary is missing.
+
+Run: make test   (builds scripts/combine_ptfs first)
+"""
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT_DIR, "scripts")
+BINARY = os.path.join(SCRIPTS, "combine_ptfs")
+WRAPPER = os.path.join(SCRIPTS, "combine_ptfs.sh")
+
+CHROMS = ["chr1", "chr10", "chr2", "chrX"]  # LC_ALL=C order
+
+
+def junction_rows(rng, chroms, n):
+    """Score-positive jscore rows (14 columns), a JSTART then its JEND per junction, a chromosome at a time."""
+    rows = []
+    for chrom in chroms:
+        starts = sorted(rng.randint(1, 400) for _ in range(n))
+        for i, s in enumerate(starts):
+            strand = rng.choice("+-")
+            e = s + rng.randint(0, 60)
+            for pos, event in ((s, "JSTART"), (e, "JEND")):
+                rows.append([chrom, str(pos), f"b{i}", "12", strand, "0.5", "0.1", "3", "0", "1", "0.2",
+                             event, f"{rng.random():.4f}", "1"])
+    return rows
+
+
+def tsstes_rows(rng, chroms, n):
+    """Score-positive TSS/CPAS rows, sorted by position within each chromosome."""
+    rows = []
+    for chrom in chroms:
+        for pos in sorted(rng.randint(1, 400) for _ in range(n)):
+            rows.append([chrom, str(pos), ".", rng.choice(["TSS", "CPAS"]), "7", f"{rng.random():.4f}", "1"])
+    return rows
+
+
+def sorted_unique(jrows, trows):
+    """combine_ptfs.sh's output computed directly: the four fields, LC_ALL=C sort -k1,1 -k2,2n -k3,3 -k4,4 -u."""
+    rows = {(r[0], r[1], r[4], r[11]) for r in jrows} | {tuple(r[:4]) for r in trows}
+    ordered = sorted(rows, key=lambda r: (r[0].encode(), int(r[1]), r[2].encode(), r[3].encode()))
+    return "".join("\t".join(r) + "\n" for r in ordered)
+
+
+def write_rows(path, rows):
+    with open(path, "w") as f:
+        f.write("".join("\t".join(r) + "\n" for r in rows))
+
+
+@unittest.skipUnless(os.access(BINARY, os.X_OK), "scripts/combine_ptfs not built (make build-c)")
+class CombinePtfsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix="splicecov-test-")
+        # combine_ptfs.sh alone in its directory: no binary next to it, so it sorts
+        cls.sort_only = os.path.join(cls.tmp, "sort_only", "combine_ptfs.sh")
+        os.makedirs(os.path.dirname(cls.sort_only))
+        shutil.copy2(WRAPPER, cls.sort_only)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def inputs(self, jrows, trows):
+        jpos, tpos = os.path.join(self.tmp, "jpos.txt"), os.path.join(self.tmp, "tsstes.pos.txt")
+        write_rows(jpos, jrows)
+        write_rows(tpos, trows)
+        return jpos, tpos
+
+    def run_cmd(self, cmd, jpos, tpos):
+        return subprocess.run([cmd, jpos, tpos], capture_output=True, text=True, env=dict(os.environ, TMPDIR=self.tmp))
+
+    def fallback(self, jpos, tpos):
+        return self.run_cmd(self.sort_only, jpos, tpos).stdout
+
+    def assertMergedLikeSort(self, jrows, trows):
+        jpos, tpos = self.inputs(jrows, trows)
+        p = self.run_cmd(BINARY, jpos, tpos)
+        self.assertEqual(p.returncode, 0, p.stderr)
+        expected = self.fallback(jpos, tpos)
+        self.assertTrue(expected)
+        self.assertEqual(p.stdout, expected)
+        self.assertEqual(self.run_cmd(WRAPPER, jpos, tpos).stdout, expected)
+
+    def assertFallsBack(self, jrows, trows):
+        jpos, tpos = self.inputs(jrows, trows)
+        p = self.run_cmd(BINARY, jpos, tpos)
+        self.assertEqual(p.returncode, 3)
+        self.assertEqual(p.stdout, "")
+        wrapped = self.run_cmd(WRAPPER, jpos, tpos)
+        self.assertEqual(wrapped.returncode, 0, wrapped.stderr)
+        self.assertEqual(wrapped.stdout, self.fallback(jpos, tpos))
+
+    def test_nearly_sorted_junctions(self):
+        rng = random.Random(19)
+        for trial in range(20):
+            with self.subTest(trial=trial):
+                self.assertMergedLikeSort(junction_rows(rng, CHROMS, rng.randint(1, 40)),
+                                          tsstes_rows(rng, CHROMS, rng.randint(0, 30)))
+
+    def test_interleaved_chromosomes(self):
+        # Each input holds only some chromosomes, so the merge alternates between them
+        rng = random.Random(20)
+        for trial in range(20):
+            with self.subTest(trial=trial):
+                self.assertMergedLikeSort(junction_rows(rng, ["chr1", "chr2"], 15),
+                                          tsstes_rows(rng, ["chr10", "chr2", "chrX"], 15))
+
+    def test_duplicate_rows(self):
+        rng = random.Random(21)
+        jrows = junction_rows(rng, ["chr1"], 10)
+        trows = tsstes_rows(rng, ["chr1"], 10)
+        self.assertMergedLikeSort(jrows + jrows[:4] + junction_rows(rng, ["chr2"], 3), trows + trows)
+
+    def test_unmergeable_inputs_fall_back(self):
+        rng = random.Random(22)
+        jrows = junction_rows(rng, ["chr1", "chr2"], 10)
+        trows = tsstes_rows(rng, CHROMS, 10)
+        split = jrows + junction_rows(rng, ["chr1"], 3)  # chr1, chr2, chr1 again
+        swapped = tsstes_rows(rng, ["chr2", "chr10"], 5)
+        non_integer = [r[:] for r in jrows]
+        non_integer[5][1] = "12.5"
+        padded = [r[:] for r in trows]
+        padded[3][1] = "007"
+        for name, j, t in (("split chromosome", split, trows),
+                           ("chromosomes out of byte order", jrows, swapped),
+                           ("non-integer position", non_integer, trows),
+                           ("zero-padded position", jrows, padded)):
+            with self.subTest(case=name):
+                self.assertFallsBack(j, t)
+
+    def test_wrapper_without_binary(self):
+        rng = random.Random(23)
+        jrows, trows = junction_rows(rng, CHROMS, 5), tsstes_rows(rng, CHROMS, 5)
+        jpos, tpos = self.inputs(jrows, trows)
+        out = os.path.join(self.tmp, "combined.ptf")
+        subprocess.run([self.sort_only, jpos, tpos, out], check=True, env=dict(os.environ, TMPDIR=self.tmp))
+        with open(out) as f:
+            self.assertEqual(f.read(), sorted_unique(jrows, trows))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+`splicecov run -t N` shards the work by chromosome; its out/ files must be
+those of `-t 1`, also when the bigWig lists its chromosomes in another
+order than the byte order of the sorted junctions (chr1, chr2, chr10), when
+junctions lie on a contig missing from the bigWig, and when one lies past
+the last covered base of its chromosome.
+
+Run: make test   (needs lightgbm, pyBigWig and scripts/process_tiebrush)
+"""
+import filecmp
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT_DIR, "scripts")
+DATA = os.path.join(ROOT_DIR, "test", "data")
+
+try:
+    import lightgbm  # noqa: F401
+    import pyBigWig
+except ImportError:  # pragma: no cover
+    pyBigWig = None
+
+# bigWig order; LC_ALL=C order is chr1, chr10, chr2
+CHROMS = [("chr1", "chr1"), ("chr2", "chr2"), ("chr10", "chr1")]  # (name, fixture chromosome copied)
+CHROM_LEN = 30000
+OUTPUTS = ("jscore.txt", "tsstes.scores.txt", "combined.ptf")
+
+
+def fixture_rows(path, ncols):
+    rows = {}
+    with open(path) as f:
+        for line in f:
+            if line.startswith(("track", "#")):
+                continue
+            a = line.rstrip("\n").split("\t")
+            rows.setdefault(a[0], []).append(a[1:ncols])
+    return rows
+
+
+def write_sample(tmp):
+    """bigWig in CHROMS order and raw junctions copied from the process_tiebrush fixture."""
+    cov = fixture_rows(os.path.join(DATA, "tiebrush_coverage.bedGraph"), 4)
+    bw = pyBigWig.open(os.path.join(tmp, "sample.bw"), "w")
+    bw.addHeader([(name, CHROM_LEN) for name, _ in CHROMS])
+    for name, src in CHROMS:
+        rows = cov[src]
+        bw.addEntries([name] * len(rows), [int(r[0]) for r in rows], ends=[int(r[1]) for r in rows],
+                      values=[float(r[2]) for r in rows])
+    bw.close()
+
+    junc = fixture_rows(os.path.join(DATA, "tiebrush_junctions.bed"), 6)
+    with open(os.path.join(tmp, "sample.bed"), "w") as f:
+        f.write("track name=junctions\n")
+        for name, src in CHROMS:
+            for r in junc[src]:
+                f.write("\t".join([name] + r) + "\n")
+        f.write("chr1\t25000\t26000\tJUNCTAIL\t300\t-\n")     # past the last covered base of chr1
+        f.write("chr1_random\t2000\t4000\tJUNCRAND1\t200\t+\n")  # no coverage for this contig
+        f.write("chr1_random\t5000\t6000\tJUNCRAND2\t150\t-\n")
+
+
+@unittest.skipIf(pyBigWig is None, "lightgbm or pyBigWig not installed")
+@unittest.skipUnless(os.access(os.path.join(SCRIPTS, "process_tiebrush"), os.X_OK),
+                     "scripts/process_tiebrush not built (make build-c)")
+class ShardedRunTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix="splicecov-test-")
+        write_sample(cls.tmp)
+        cls.out = {}
+        for threads in (1, 4):
+            run_dir = os.path.join(cls.tmp, f"t{threads}")
+            os.makedirs(run_dir)
+            subprocess.run([sys.executable, os.path.join(SCRIPTS, "splicecov_engine.py"), "run",
+                            "-j", os.path.join(cls.tmp, "sample.bed"), "-c", os.path.join(cls.tmp, "sample.bw"),
+                            "-b", "sample", "-t", str(threads)],
+                           cwd=run_dir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            cls.out[threads] = os.path.join(run_dir, "out")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def test_outputs_match_single_process(self):
+        for suffix in OUTPUTS:
+            with self.subTest(output=suffix):
+                self.assertTrue(filecmp.cmp(os.path.join(self.out[1], f"sample.{suffix}"),
+                                            os.path.join(self.out[4], f"sample.{suffix}"), shallow=False))
+
+    def test_every_chromosome_has_tsstes_rows(self):
+        with open(os.path.join(self.out[1], "sample.tsstes.scores.txt")) as f:
+            chroms = [line.split("\t", 1)[0] for line in f][1:]
+        # Coverage streamed in junction order: chr1, chr10, chr2
+        self.assertEqual(list(dict.fromkeys(chroms)), ["chr1", "chr10", "chr2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
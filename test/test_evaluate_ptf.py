@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+scripts/evaluate_ptf_new.py: the merge-join over sorted files
+(evaluate_sorted) and the in-memory path (evaluate_in_memory) must count
+and write the same rows, and main() must fall back from one to the other
+cleanly when the input turns out not to be sorted.
+
+Run: python3 -m unittest discover -s test
+"""
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import mock
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT_DIR, "scripts")
+sys.path.insert(0, SCRIPTS)
+
+import evaluate_ptf_new as ev  # noqa: E402
+
+CHROMS = ["chr1", "chr10", "chr2", "chrX"]
+
+
+class Recorder:
+    """RowFiles stand-in keeping the written rows in memory."""
+
+    def __init__(self):
+        self.rows = {n: [] for n in ev.RowFiles.NAMES}
+
+    def write(self, name, row):
+        self.rows[name].append(row)
+
+
+def make_target(rng, n, with_score):
+    """Junction rows on few positions, so keys repeat (with tied and distinct scores)."""
+    rows = ["# chromosome\tposition\tstrand\ttype\tcov\tlen\tscore"]
+    for i in range(n):
+        cols = [rng.choice(CHROMS), str(rng.randint(1, 60)), rng.choice("+-"), "junc", str(rng.randint(1, 50)), "0"]
+        if with_score:
+            cols.append(rng.choice(["0.5", "0.75", "0.9", f"{rng.random():.6f}"]))
+        rows.append("\t".join(cols))
+        if i % 37 == 0:
+            rows.append("")
+    return rows
+
+
+def make_ref(rng, n):
+    rows = ["# splice sites"]
+    rows += [f"{rng.choice(CHROMS)}\t{rng.randint(1, 60)}\tref{i}" for i in range(n)]
+    rows.append("chr2")  # too short to hold a position
+    return rows
+
+
+def sort_rows(rows):
+    """LC_ALL=C sort -s -k1,1 -k2,2n, as spliceCOV.sh sorts them (comment/blank lines first)."""
+    def key(line):
+        cols = line.split()
+        return (0, "", 0) if len(cols) < 2 or line.startswith("#") else (1, cols[0], int(cols[1]))
+    return sorted(rows, key=key)
+
+
+def write_lines(path, lines):
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+class EvaluatePtfTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="splicecov-test-")
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def path(self, name, lines):
+        p = os.path.join(self.tmp, name)
+        write_lines(p, lines)
+        return p
+
+    def run_path(self, evaluate, target, ref):
+        out = Recorder()
+        return evaluate(target, ref, out), out.rows
+
+    def assertSameResult(self, a, b):
+        (na, ra), (nb, rb) = a, b
+        self.assertEqual(na, nb)
+        for name in ("matching_rows", "non_matching_rows", "ref_only_rows"):
+            self.assertEqual(sorted(ra[name]), sorted(rb[name]), name)
+            self.assertEqual(len(set(ra[name])), len(ra[name]), name)
+
+    def test_sorted_and_in_memory_agree(self):
+        rng = random.Random(25)
+        for trial in range(40):
+            with_score = trial % 2 == 0
+            target = make_target(rng, rng.randint(0, 300), with_score)
+            ref = make_ref(rng, rng.randint(0, 120))
+            t_sorted = self.path("t.sorted", sort_rows(target))
+            r_sorted = self.path("r.sorted", sort_rows(ref))
+            t_unsorted = self.path("t.unsorted", target)
+            r_unsorted = self.path("r.unsorted", ref)
+            with self.subTest(trial=trial, with_score=with_score):
+                merged = self.run_path(ev.evaluate_sorted, t_sorted, r_sorted)
+                in_memory = self.run_path(ev.evaluate_in_memory, t_sorted, r_sorted)
+                self.assertSameResult(merged, in_memory)
+                # Same files, same order: the labelled rows match line for line
+                self.assertEqual(merged[1]["with_labels"], in_memory[1]["with_labels"])
+                self.assertSameResult(merged, self.run_path(ev.evaluate_in_memory, t_unsorted, r_unsorted))
+                n = merged[0]
+                self.assertEqual(n["matching"] + n["non_matching"], n["target"])
+                self.assertEqual(n["matching"] + n["ref_only"], n["ref"])
+
+    def test_best_score_and_first_row_kept(self):
+        ref = self.path("ref", ["chr1\t5"])
+        for rows, best in (
+                (["chr1\t5\t+\tj\t1\t0\t0.2", "chr1\t5\t-\tj\t2\t0\t0.9", "chr1\t5\t+\tj\t3\t0\t0.9"],
+                 "chr1\t5\t-\tj\t2\t0\t0.9"),
+                (["chr1\t5\t+\tj\t1\t0", "chr1\t5\t-\tj\t2\t0"], "chr1\t5\t+\tj\t1\t0")):
+            target = self.path("target", rows)
+            for evaluate in (ev.evaluate_sorted, ev.evaluate_in_memory):
+                with self.subTest(evaluate=evaluate.__name__, score=len(rows[0].split()) > 6):
+                    n, out = self.run_path(evaluate, target, ref)
+                    self.assertEqual(out["matching_rows"], [best])
+                    self.assertEqual(n, dict(ref=1, target=1, matching=1, non_matching=0, ref_only=0))
+
+    def test_unsorted_input_is_detected(self):
+        ref = self.path("ref", ["chr1\t7"])
+        for rows in (["chr1\t9", "chr1\t7"],          # position order
+                     ["chr2\t1", "chr10\t1"],         # chromosome byte order
+                     ["chr1\t007"],                   # same position as 7 only by value
+                     ["chr1\tpos"]):
+            target = self.path("target", rows)
+            with self.subTest(rows=rows):
+                with self.assertRaises(ev.NotSorted):
+                    self.run_path(ev.evaluate_sorted, target, ref)
+        with self.assertRaises(ev.NotSorted):
+            self.run_path(ev.evaluate_sorted, self.path("target", ["chr1\t7"]), self.path("ref", ["chr1\t07"]))
+
+    def test_non_canonical_position_matches_as_text(self):
+        # The in-memory path compares positions as written: 007 is not 7
+        target = self.path("target", ["chr1\t007\t+\tj\t1\t0\t0.5", "chr1\t7\t+\tj\t1\t0\t0.4"])
+        ref = self.path("ref", ["chr1\t7"])
+        n, out = self.run_path(ev.evaluate_in_memory, target, ref)
+        self.assertEqual(n, dict(ref=1, target=2, matching=1, non_matching=1, ref_only=0))
+        self.assertEqual(out["non_matching_rows"], ["chr1\t007\t+\tj\t1\t0\t0.5"])
+
+    def run_main(self, *argv):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch.object(sys, "argv", ["evaluate_ptf_new.py", *argv]), \
+                redirect_stdout(stdout), redirect_stderr(stderr):
+            ev.main()
+        return stdout.getvalue(), stderr.getvalue()
+
+    def read_row_files(self, target):
+        files = ev.RowFiles(target, enabled=False).paths
+        out = {}
+        for name, p in files.items():
+            with open(p) as f:
+                out[name] = f.read()
+        return out
+
+    def test_fallback_rewrites_row_files(self):
+        rng = random.Random(7)
+        # Sorted for most of the file, so the merge-join has written rows before it stops
+        target = sort_rows(make_target(rng, 400, with_score=True))
+        target.append("chr1\t3\t+\tjunc\t9\t0\t0.99")
+        target.append("chr1\t007\t+\tjunc\t9\t0\t0.5")
+        target_path = self.path("target.txt", target)
+        ref_path = self.path("ref.txt", sort_rows(make_ref(rng, 150)))
+
+        run_dir = os.path.join(self.tmp, "main")
+        os.makedirs(run_dir)
+        os.chdir(run_dir)
+        stdout, stderr = self.run_main(target_path, ref_path)
+        self.assertIn("reading both files into memory", stderr)
+        got = self.read_row_files(target_path)
+
+        direct_dir = os.path.join(self.tmp, "direct")
+        os.makedirs(direct_dir)
+        os.chdir(direct_dir)
+        out = ev.RowFiles(target_path)
+        try:
+            n = ev.evaluate_in_memory(target_path, ref_path, out)
+        finally:
+            out.close()
+        self.assertEqual(got, self.read_row_files(target_path))
+        self.assertIn(f"Target file rows: {n['target']}\n", stdout)
+        self.assertIn(f"({n['matching']} rows)", stdout)
+
+    def test_no_row_files(self):
+        os.chdir(self.tmp)
+        target = self.path("target.txt", ["chr1\t5\t+\tj\t1\t0\t0.5", "chr1\t9\t+\tj\t1\t0\t0.5"])
+        ref = self.path("ref.txt", ["chr1\t5", "chr2\t1"])
+        stdout, _ = self.run_main("--no-row-files", target, ref)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, "out")))
+        self.assertIn("Precision: 0.5000", stdout)
+        self.assertIn("Recall:    0.5000", stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+scripts/evaluate_TSSTES_new.py must print the same metrics and write the
+same files as its bisect-per-row version (kept in
+test/data/evaluate_TSSTES_baseline.py) on random targets and references,
+with the lines that version treats specially: comments, comments after
+leading blanks, blank, short and non-integer lines, a last line without a
+newline, repeated reference positions and reference chromosomes with no
+predictions.
+
+Run: python3 -m unittest discover -s test
+"""
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CURRENT = os.path.join(ROOT_DIR, "scripts", "evaluate_TSSTES_new.py")
+BASELINE = os.path.join(ROOT_DIR, "test", "data", "evaluate_TSSTES_baseline.py")
+
+TARGET_CHROMS = ["chr1", "chr10", "chr2", "chrZ"]  # chrZ is not in the reference
+REF_CHROMS = ["chr1", "chr10", "chr2", "chrM"]     # chrM has no predictions
+SUFFIXES = ("_matching_rows.txt", "_non_matching_clusters.txt", "_ref_only_rows.txt", "_with_labels.txt")
+ODD_LINES = ["# header", "", "   # indented comment\t5", "\t#chr1\t100", "chr1", "chr2\tabc\tTSS",
+             "chr1 7", "   ", "chr10\t-3\tCPAS"]
+
+
+def make_target(rng, n):
+    rows = []
+    for _ in range(n):
+        if rng.random() < 0.15:
+            rows.append(rng.choice(ODD_LINES))
+        else:
+            rows.append(f"{rng.choice(TARGET_CHROMS)}\t{rng.randint(0, 600)}\t.\t{rng.choice(['TSS', 'CPAS'])}"
+                        f"\t{rng.random():.3f}\t1")
+    return rows
+
+
+def make_ref(rng, n):
+    rows = ["# reference", "chr2\tpos\tTSS", "chr1"]
+    positions = [(rng.choice(REF_CHROMS), rng.randint(0, 600)) for _ in range(n)]
+    positions += rng.sample(positions, min(len(positions), 5))  # repeated positions
+    rng.shuffle(positions)
+    rows += [f"{c}\t{p}\t{rng.choice(['TSS', 'CPAS'])}" for c, p in positions]
+    return rows
+
+
+class EvaluateTsstesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="splicecov-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def run_script(self, script, name, target, ref):
+        run_dir = os.path.join(self.tmp, name)
+        os.makedirs(run_dir, exist_ok=True)
+        for f in os.listdir(run_dir):
+            os.remove(os.path.join(run_dir, f))
+        p = subprocess.run([sys.executable, script, target, ref], cwd=run_dir, capture_output=True, text=True,
+                           check=True)
+        files = {}
+        for suffix in SUFFIXES:
+            path = os.path.join(run_dir, os.path.basename(target) + suffix)
+            if os.path.exists(path):
+                with open(path) as f:
+                    files[suffix] = f.read()
+        return p.stdout, files
+
+    def assertSameAsBaseline(self, target_lines, ref_lines, final_newline=True):
+        target = os.path.join(self.tmp, "sample.tsstes.pos.txt")
+        ref = os.path.join(self.tmp, "ann.tsstes.bed")
+        with open(target, "w") as f:
+            f.write("\n".join(target_lines) + ("\n" if final_newline and target_lines else ""))
+        with open(ref, "w") as f:
+            f.write("\n".join(ref_lines) + "\n")
+        stdout, files = self.run_script(CURRENT, "current", target, ref)
+        base_stdout, base_files = self.run_script(BASELINE, "baseline", target, ref)
+        self.assertEqual(stdout, base_stdout)
+        self.assertEqual(files, base_files)
+        return stdout, files
+
+    def test_random_inputs(self):
+        rng = random.Random(23)
+        for trial in range(30):
+            target = make_target(rng, rng.randint(0, 200))
+            ref = make_ref(rng, rng.randint(0, 80))
+            with self.subTest(trial=trial):
+                self.assertSameAsBaseline(target, ref, final_newline=trial % 3 != 0)
+
+    def test_edge_cases(self):
+        ref = ["chr1\t100\tTSS", "chr1\t100\tCPAS", "chr1\t160\tTSS", "chrM\t5\tTSS"]
+        target = ["# chromosome\tposition", "  # chr1\t100", "chr1\t120\t.\tTSS", "chr1\tx", "chr1",
+                  "chr9\t100\t.\tTSS", "", "chr1\t211\t.\tCPAS"]
+        stdout, files = self.assertSameAsBaseline(target, ref, final_newline=False)
+        self.assertIn("Found 1 matching and 2 non-matching rows.", stdout)
+        self.assertEqual(files["_ref_only_rows.txt"], "chrM\t5\n")
+        self.assertTrue(files["_with_labels.txt"].endswith("chr1\t211\t.\tCPAS\t0\n"))
+        self.assertIn("  # chr1\t100\t0\n", files["_with_labels.txt"])  # labelled, though not counted
+
+    def test_empty_target(self):
+        self.assertSameAsBaseline([], ["chr1\t100\tTSS"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+scripts/junction_percs.py must print what process_junctions_perc.pl prints:
+the vectorized chrom_percs against the step-by-step _sweep_percs on random
+junction sets, and the whole script against the Perl output kept in
+test/data/junctions_percs.expected.
+
+Run: python3 -m unittest discover -s test
+"""
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT_DIR, "scripts")
+DATA = os.path.join(ROOT_DIR, "test", "data")
+sys.path.insert(0, SCRIPTS)
+
+import junction_percs  # noqa: E402
+
+FIXTURE = os.path.join(DATA, "junctions_percs.bed")
+EXPECTED = os.path.join(DATA, "junctions_percs.expected")
+
+
+def random_junctions(rng, n, span, max_len, allow_empty=False):
+    """n junctions on all three strands over a few coordinates, so starts, ends and counts repeat."""
+    s = rng.integers(0, span, size=n)
+    e = s + rng.integers(0 if allow_empty else 1, max_len, size=n)
+    c = rng.integers(1, 20, size=n)
+    z = rng.choice([0, 1, 2], size=n, p=[0.4, 0.4, 0.2])
+    order = np.lexsort((e, s))
+    return [a[order].tolist() for a in (s, e, c, z)]
+
+
+def run_main(path):
+    buf = io.StringIO()
+    with mock.patch.object(sys, "argv", ["junction_percs.py", path]), redirect_stdout(buf):
+        junction_percs.main()
+    return buf.getvalue()
+
+
+class JunctionPercsTest(unittest.TestCase):
+    def assertSamePercs(self, junctions):
+        fast = junction_percs.chrom_percs(*junctions)
+        sweep = junction_percs._sweep_percs(*junctions)
+        if sweep is None:
+            self.assertIsNone(fast)
+            return
+        self.assertEqual([list(v) for v in fast], [list(v) for v in sweep])
+
+    def test_matches_sweep_on_random_junctions(self):
+        rng = np.random.default_rng(0)
+        for trial in range(300):
+            n = int(rng.integers(1, 60))
+            # Dense loci (many equal coordinates) down to sparse ones
+            span = int(rng.choice([5, 20, 200, 5000]))
+            with self.subTest(trial=trial, n=n, span=span):
+                self.assertSamePercs(random_junctions(rng, n, span, max_len=span // 2 + 2))
+
+    def test_zero_length_and_inverted_use_sweep(self):
+        rng = np.random.default_rng(1)
+        for trial in range(50):
+            s, e, c, z = random_junctions(rng, 30, 20, 10, allow_empty=True)
+            s[0], e[0] = e[0] + 3, s[0]  # at least one s >= e
+            with self.subTest(trial=trial):
+                self.assertSamePercs((s, e, c, z))
+
+    @unittest.skipIf(shutil.which("perl") is None, "perl not installed")
+    def test_random_files_match_perl(self):
+        rng = np.random.default_rng(2)
+        with tempfile.TemporaryDirectory(prefix="splicecov-test-") as tmp:
+            path = os.path.join(tmp, "junctions.bed")
+            for trial in range(20):
+                with open(path, "w") as f:
+                    f.write("track name=junctions\n")
+                    for chrom in ("chr1", "chr2"):
+                        s, e, c, z = random_junctions(rng, 25, 30, 12, allow_empty=trial % 2 == 1)
+                        if trial % 4 == 3:
+                            s[1], e[1] = e[1] + 2, s[1]
+                        for i, (a, b, n, k) in enumerate(zip(s, e, c, z)):
+                            f.write(f"{chrom}\t{a}\t{b}\tJ{i}\t{n}\t{junction_percs.STRAND_CHARS[k]}\n")
+                perl = subprocess.run(["perl", os.path.join(SCRIPTS, "process_junctions_perc.pl"), path],
+                                      check=True, capture_output=True, text=True).stdout
+                with self.subTest(trial=trial):
+                    self.assertEqual(run_main(path), perl)
+
+    def test_single_boundary_emits_nothing(self):
+        self.assertIsNone(junction_percs.chrom_percs([10, 10], [10, 10], [1, 2], [1, 0]))
+
+    def test_same_output_as_perl_fixture(self):
+        with open(EXPECTED) as f:
+            self.assertEqual(run_main(FIXTURE), f.read())
+
+    @unittest.skipIf(shutil.which("perl") is None, "perl not installed")
+    def test_fixture_expected_is_perl_output(self):
+        perl = subprocess.run(["perl", os.path.join(SCRIPTS, "process_junctions_perc.pl"), FIXTURE],
+                              check=True, capture_output=True, text=True).stdout
+        with open(EXPECTED) as f:
+            self.assertEqual(perl, f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
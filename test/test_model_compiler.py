@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Compiled LightGBM models (scripts/model_compiler.py) must give exactly the
+probabilities of lgb.Booster.predict.
+
+Run: python3 -m unittest discover -s test   (needs lightgbm and a C compiler)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT_DIR, "scripts")
+MODEL_DIR = os.path.join(SCRIPTS, "model_output")
+sys.path.insert(0, SCRIPTS)
+
+import model_compiler  # noqa: E402
+
+try:
+    import lightgbm as lgb
+except ImportError:  # pragma: no cover
+    lgb = None
+
+# Every model the pipeline scores with (Makefile PIPELINE_MODELS), plus a small extra one
+MODELS = ["0606_spleen_no_normscale_lightgbm_model.txt", "tss_lightgbm_model.txt",
+          "cpas_lightgbm_model.txt", "0204_blood_lightgbm_model.txt"]
+
+
+def num_features(model_path):
+    header, _ = model_compiler.parse_model(model_path)
+    return int(header["max_feature_idx"]) + 1
+
+
+def feature_rows(model_path, n, seed=0):
+    """Rows built from the model's own thresholds plus NaN, +-0, tiny and random values."""
+    rng = np.random.default_rng(seed)
+    header, trees = model_compiler.parse_model(model_path)
+    thr = np.array([float(v) for t in trees for v in t.get("threshold", "").split()])
+    X = rng.choice(thr, size=(n, int(header["max_feature_idx"]) + 1))
+    m = rng.random(X.shape) < 0.3
+    X[m] *= rng.choice([1 + 1e-16, 1 - 1e-16, 0.5, 2.0], size=X.shape)[m]
+    X[rng.random(X.shape) < 0.05] = np.nan
+    X[rng.random(X.shape) < 0.05] = 0.0
+    X[rng.random(X.shape) < 0.02] = -0.0
+    X[rng.random(X.shape) < 0.02] = 1e-36
+    m = rng.random(X.shape) < 0.05
+    X[m] = rng.normal(0.0, 1e6, size=X.shape)[m]
+    return X
+
+
+@unittest.skipIf(lgb is None, "lightgbm not installed")
+@unittest.skipIf(shutil.which(os.environ.get("CC") or "cc") is None, "no C compiler")
+class CompiledModelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix="splicecov-test-")
+        cls.models = {}
+        for name in MODELS:
+            path = os.path.join(cls.tmp, name)
+            shutil.copy(os.path.join(MODEL_DIR, name), path)
+            model_compiler.compile_model(path)
+            cls.models[name] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def test_bit_identical_probabilities(self):
+        for name, path in self.models.items():
+            booster = lgb.Booster(model_file=path)
+            compiled = model_compiler.load_compiled(path)
+            self.assertIsNotNone(compiled, name)
+            X = feature_rows(path, 50000)
+            for num_iteration in (booster.best_iteration, None, 1, 10):
+                want = booster.predict(X, num_iteration=num_iteration)
+                got = compiled.predict(X, num_iteration=num_iteration)
+                self.assertTrue(np.array_equal(want.view(np.int64), got.view(np.int64)),
+                                f"{name} num_iteration={num_iteration}")
+
+    def test_stale_build_is_ignored(self):
+        path = self.models[MODELS[0]]
+        stale = os.path.join(self.tmp, "stale_lightgbm_model.txt")
+        with open(path) as src, open(stale, "w") as dst:
+            dst.write(src.read() + "\n")
+        shutil.copy(model_compiler.compiled_path(path), model_compiler.compiled_path(stale))
+        self.assertIsNone(model_compiler.load_compiled(stale))
+
+    def test_feature_count_checked(self):
+        for name, path in self.models.items():
+            compiled = model_compiler.load_compiled(path)
+            with self.assertRaises(ValueError, msg=name):
+                compiled.predict(np.zeros((3, num_features(path) - 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+scripts/process_tiebrush must print the same bundles for any thread count
+and for plain, gzip-compressed or piped input. The expected output in
+test/data/tiebrush_expected.txt is that of the original single-threaded
+process_tiebrush.c on the same fixture: two chromosomes, ten bundles, and
+coverage with both zero-valued records and a stretch with no records.
+
+Run: make test   (builds scripts/process_tiebrush first)
+"""
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BINARY = os.path.join(ROOT_DIR, "scripts", "process_tiebrush")
+DATA = os.path.join(ROOT_DIR, "test", "data")
+
+COVERAGE = os.path.join(DATA, "tiebrush_coverage.bedGraph")
+JUNCTIONS = os.path.join(DATA, "tiebrush_junctions.bed")
+EXPECTED = os.path.join(DATA, "tiebrush_expected.txt")
+THREADS = (1, 4)
+
+
+def write_gzip(src, dst, members=1):
+    """gzip copy of src; members > 1 splits it into concatenated members, as bgzip does."""
+    with open(src, "rb") as f:
+        data = f.read()
+    step = -(-len(data) // members)
+    with open(dst, "wb") as out:
+        for i in range(0, len(data), step):
+            out.write(gzip.compress(data[i:i + step]))
+
+
+@unittest.skipUnless(os.access(BINARY, os.X_OK), "scripts/process_tiebrush not built (make build-c)")
+class ProcessTiebrushTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix="splicecov-test-")
+        cls.coverage_gz = os.path.join(cls.tmp, "coverage.bedGraph.gz")
+        cls.coverage_bgz = os.path.join(cls.tmp, "coverage.bgz.bedGraph.gz")
+        cls.junctions_gz = os.path.join(cls.tmp, "junctions.bed.gz")
+        write_gzip(COVERAGE, cls.coverage_gz)
+        write_gzip(COVERAGE, cls.coverage_bgz, members=7)
+        write_gzip(JUNCTIONS, cls.junctions_gz)
+        with open(EXPECTED) as f:
+            cls.expected = f.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def run_tiebrush(self, threads, coverage, junctions, stdin=None):
+        with open(stdin, "rb") if stdin else open(os.devnull, "rb") as f:
+            p = subprocess.run([BINARY, "-t", str(threads), coverage, junctions], stdin=f,
+                               capture_output=True, check=True)
+        return p.stdout.decode()
+
+    def test_plain_input(self):
+        for t in THREADS:
+            with self.subTest(threads=t):
+                self.assertEqual(self.run_tiebrush(t, COVERAGE, JUNCTIONS), self.expected)
+
+    def test_gzip_input(self):
+        for t in THREADS:
+            for coverage in (self.coverage_gz, self.coverage_bgz):
+                with self.subTest(threads=t, coverage=os.path.basename(coverage)):
+                    self.assertEqual(self.run_tiebrush(t, coverage, self.junctions_gz), self.expected)
+
+    def test_coverage_from_stdin(self):
+        for t in THREADS:
+            with self.subTest(threads=t):
+                self.assertEqual(self.run_tiebrush(t, "-", JUNCTIONS, stdin=COVERAGE), self.expected)
+
+    def test_bad_thread_count(self):
+        p = subprocess.run([BINARY, "-t", "0", COVERAGE, JUNCTIONS], capture_output=True)
+        self.assertNotEqual(p.returncode, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+scripts/threshold_sweep.py: each row of `splicecov sweep` must hold what
+eval-only mode prints for a run at that -s, including -s 0, where the rows
+the scorers force to label 0 (junction overrides, TSS/CPAS rows with no
+model) stay negatives. One run's scores are swept and compared with the
+evaluators' counts for real runs at each threshold.
+
+Run: make test   (needs lightgbm, pyBigWig and scripts/process_tiebrush)
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT_DIR, "scripts")
+sys.path.insert(0, SCRIPTS)
+
+import threshold_sweep  # noqa: E402
+from test_engine_threads import pyBigWig, write_sample  # noqa: E402
+
+THRESHOLDS = (0.0, 0.2, 0.975)
+SWEPT = "s1"  # the run at -s 0.2: its labels differ from those of the other thresholds
+
+
+def write_annotation(path, jscore, tsstes_scores):
+    """
+    GTF whose introns end on every third pair of predicted junction positions
+    and whose single-exon transcripts start 20 bp after every other TSS/CPAS
+    row, plus a chromosome with no predictions.
+    """
+    def rows(p):
+        with open(p) as f:
+            return [line.rstrip("\n").split("\t") for line in f][1:]
+
+    by_chrom = {}
+    for r in rows(jscore):
+        by_chrom.setdefault(r[0], set()).add(int(r[1]))
+    exons = []
+    for chrom, positions in sorted(by_chrom.items()):
+        positions = sorted(positions)
+        for i in range(0, len(positions) - 1, 3):
+            p, q = positions[i], positions[i + 1]
+            exons.append([(chrom, p - 100, p), (chrom, q, q + 100)])
+    for r in rows(tsstes_scores)[::2]:
+        p = int(r[1])
+        exons.append([(r[0], p + 20, p + 400)])
+    exons.append([("chrY", 100, 200), ("chrY", 300, 400)])
+    with open(path, "w") as f:
+        for n, tx in enumerate(exons):
+            for chrom, s, e in tx:
+                f.write(f'{chrom}\tsplicecov\texon\t{s}\t{e}\t.\t+\t.\tgene_id "g{n}"; transcript_id "t{n}";\n')
+
+
+def count_lines(path):
+    with open(path) as f:
+        return sum(1 for _ in f)
+
+
+def evaluated(run_dir, base, n_ref):
+    """
+    Counts and formatted metrics of eval-only mode for out/<base>; with no
+    positives it prints no figures, which are then 0 and every reference
+    position a false negative (n_ref per side).
+    """
+    with open(os.path.join(run_dir, "out", f"{base}.eval.junctions.txt")) as f:
+        junc = f.read()
+    with open(os.path.join(run_dir, "out", f"{base}.eval.tsstes.txt")) as f:
+        tss = f.read()
+    out = {}
+    if junc.startswith("No junction positives"):
+        out.update(junction_tp=0, junction_fp=0, junction_fn=n_ref["ss"],
+                   junction_precision="0.0000", junction_recall="0.0000", junction_f1="0.0000")
+    else:
+        count = {k: int(re.search(rf"{k} rows written to: .* \((\d+) rows\)", junc).group(1))
+                 for k in ("Matching", "Non-matching", "Reference-only")}
+        out.update(junction_tp=count["Matching"], junction_fp=count["Non-matching"],
+                   junction_fn=count["Reference-only"],
+                   junction_precision=re.search(r"Precision: (\S+)", junc).group(1),
+                   junction_recall=re.search(r"Recall: +(\S+)", junc).group(1),
+                   junction_f1=re.search(r"F1 Score: +(\S+)", junc).group(1))
+    if tss.startswith("No TSSTES positives"):
+        out.update(tsstes_tp=0, tsstes_fp=0, tsstes_fn=n_ref["tsstes"],
+                   tsstes_precision="0.0000", tsstes_sensitivity="0.0000")
+    else:
+        tp, fp = re.search(r"Found (\d+) matching and (\d+) non-matching rows", tss).groups()
+        out.update(tsstes_tp=int(tp), tsstes_fp=int(fp),
+                   tsstes_fn=count_lines(os.path.join(run_dir, f"{base}.tsstes.pos.txt_ref_only_rows.txt")),
+                   tsstes_precision=re.search(r"Precision: +(\S+)", tss).group(1),
+                   tsstes_sensitivity=re.search(r"Sensitivity: +(\S+)", tss).group(1))
+    return out
+
+
+@unittest.skipIf(pyBigWig is None, "lightgbm or pyBigWig not installed")
+@unittest.skipUnless(os.access(os.path.join(SCRIPTS, "process_tiebrush"), os.X_OK),
+                     "scripts/process_tiebrush not built (make build-c)")
+class ThresholdSweepTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix="splicecov-test-")
+        cls.cwd = os.getcwd()
+        write_sample(cls.tmp)
+        for i, t in enumerate(THRESHOLDS):
+            subprocess.run([sys.executable, os.path.join(SCRIPTS, "splicecov_engine.py"), "run",
+                            "-j", "sample.bed", "-c", "sample.bw", "-b", f"s{i}", "-s", str(t)],
+                           cwd=cls.tmp, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        cls.gtf = os.path.join(cls.tmp, "annotation.gtf")
+        out = os.path.join(cls.tmp, "out")
+        write_annotation(cls.gtf, os.path.join(out, "s0.jscore.txt"), os.path.join(out, "s0.tsstes.scores.txt"))
+        refs = {k: os.path.join(cls.tmp, f"ann.{k}.bed") for k in ("ss", "tsstes")}
+        subprocess.run([sys.executable, os.path.join(SCRIPTS, "annotation_index.py"), "refs", cls.gtf,
+                        refs["ss"], refs["tsstes"]], check=True, stdout=subprocess.DEVNULL)
+        n_ref = {k: count_lines(p) for k, p in refs.items()}
+        cls.expected = {}
+        for i, t in enumerate(THRESHOLDS):
+            subprocess.run(["bash", os.path.join(SCRIPTS, "spliceCOV.sh"), "-b", f"s{i}", "-a", cls.gtf],
+                           cwd=cls.tmp, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            cls.expected[t] = evaluated(cls.tmp, f"s{i}", n_ref)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def setUp(self):
+        os.chdir(self.tmp)
+        self.addCleanup(os.chdir, self.cwd)
+
+    def test_forced_negatives_present(self):
+        # Scores pinned to 0 by the junction overrides, so t = 0 tests something
+        with open(os.path.join(self.tmp, "out", "s0.jscore.txt")) as f:
+            pinned = [line for line in f if line.rstrip("\n").split("\t")[-2:] == ["0.0", "0"]]
+        self.assertTrue(pinned)
+
+    def test_sweep_matches_evaluation(self):
+        df = threshold_sweep.sweep(SWEPT, self.gtf, list(THRESHOLDS))
+        metrics = ("junction_precision", "junction_recall", "junction_f1", "tsstes_precision", "tsstes_sensitivity")
+        for _, row in df.iterrows():
+            expected = self.expected[row["threshold"]]
+            with self.subTest(threshold=row["threshold"]):
+                got = {k: int(row[k]) for k in expected if k not in metrics}
+                got.update({k: f"{row[k]:.4f}" for k in metrics})
+                self.assertEqual(got, expected)
+
+    def test_curve_starts_above_zero(self):
+        # Pinned rows do not make a point of their own at score 0
+        df = threshold_sweep.sweep(SWEPT, self.gtf, curve=True)
+        self.assertGreater(df["threshold"].iloc[0], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()